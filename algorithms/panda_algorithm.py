@@ -12,11 +12,29 @@ Center: Data Life and Intelligent Health Center
 """
 
 import numpy as np
-import pandas as pd
 from typing import Dict, List, Tuple, Optional
 import logging
+import time
 from datetime import datetime
 
+# Feature order of the vectorized Monte Carlo path, with the weight of each
+FEATURE_WEIGHTS = (
+    ('age_score', 'age'),
+    ('family_history', 'family_history'),
+    ('brca_score', 'brca_mutation'),
+    ('reproductive_score', 'reproductive_factors'),
+    ('hormone_therapy', 'hormone_therapy'),
+    ('breast_density_score', 'breast_density')
+)
+# Differential privacy noise scale (only applied at the "high" level)
+PRIVACY_NOISE_SCALE = 0.01
+# Fewest samples per patient an interval is estimated from, even past the deadline
+MIN_CI_SAMPLES = 100
+# Cap on patients x samples kept in memory for one batch
+MAX_CI_CELLS = 4_000_000
+# Cap on patients x samples x features drawn per round between deadline checks
+CI_ROUND_CELLS = 1_000_000
+
 class PandaAlgorithm:
     """
     Panda Algorithm for Breast Cancer Risk Assessment
@@ -28,16 +46,21 @@ class PandaAlgorithm:
     - Advanced Risk Stratification
     """
     
-    def __init__(self, federated_mode: bool = True, privacy_level: str = "high"):
+    def __init__(self, federated_mode: bool = True, privacy_level: str = "high",
+                 ci_samples: int = 2000, ci_budget_ms: float = 20.0):
         """
         Initialize Panda Algorithm
         
         Args:
             federated_mode: Enable federated learning mode
             privacy_level: Privacy protection level ("low", "medium", "high")
+            ci_samples: Monte Carlo samples per patient for confidence intervals
+            ci_budget_ms: Time budget for one confidence interval computation
         """
         self.federated_mode = federated_mode
         self.privacy_level = privacy_level
+        self.ci_samples = ci_samples
+        self.ci_budget_ms = ci_budget_ms
         self.model_weights = self._initialize_weights()
         self.logger = self._setup_logger()
         
@@ -80,7 +103,7 @@ class PandaAlgorithm:
         """
         try:
             # Extract and validate features
-            features = self._extract_features(patient_data)
+            features = raw_features = self._extract_features(patient_data)
             
             # Apply privacy protection if enabled
             if self.privacy_level == "high":
@@ -102,7 +125,7 @@ class PandaAlgorithm:
             result = {
                 'risk_score': round(adjusted_score, 2),
                 'risk_category': risk_category,
-                'confidence_interval': self._calculate_confidence_interval(adjusted_score),
+                'confidence_interval': self._calculate_confidence_interval(raw_features),
                 'feature_contributions': self._calculate_feature_contributions(features),
                 'recommendations': self._generate_recommendations(risk_category),
                 'algorithm_version': 'Panda v1.0',
@@ -228,10 +251,127 @@ class PandaAlgorithm:
         else:
             return "High Risk"
     
-    def _calculate_confidence_interval(self, score: float) -> Tuple[float, float]:
-        """Calculate 95% confidence interval for risk score"""
-        margin = score * 0.1  # 10% margin
-        return (max(0, score - margin), min(100, score + margin))
+    def _calculate_confidence_interval(self, features: Dict) -> Tuple[float, float]:
+        """Calculate 95% confidence interval for risk score from Monte Carlo samples"""
+        interval = self._monte_carlo(self._feature_matrix([features]))
+        return (round(float(interval['lower'][0]), 2), round(float(interval['upper'][0]), 2))
+
+    def confidence_intervals(self, patients: List[Dict], level: float = 0.95,
+                             budget_ms: Optional[float] = None,
+                             rng: Optional[np.random.Generator] = None) -> Dict:
+        """
+        Empirical confidence intervals for a batch of patients
+        
+        Args:
+            patients: Patient risk factor dictionaries
+            level: Coverage of the interval
+            budget_ms: Time budget (defaults to ``ci_budget_ms``)
+            rng: Random generator, for reproducible intervals
+            
+        Returns:
+            Dictionary with per-patient ``lower``, ``median`` and ``upper``
+            arrays, the number of ``samples`` per patient and whether the
+            deadline ``truncated`` sampling
+        """
+        features = self._feature_matrix([self._extract_features(patient) for patient in patients])
+        return self._monte_carlo(features, level, budget_ms, rng)
+
+    def _feature_matrix(self, features: List[Dict]) -> np.ndarray:
+        return np.array([[f[key] for key, _ in FEATURE_WEIGHTS] for f in features],
+                        dtype=np.float64).reshape(len(features), len(FEATURE_WEIGHTS))
+
+    def predict_scores(self, patients: List[Dict]) -> np.ndarray:
+        """
+        Noise-free base scores (0-100) of a batch of patients
+
+        This is the expected score without privacy noise or federated
+        adjustment, and the quantity ``partial_fit`` calibrates.
+        """
+        features = self._feature_matrix([self._extract_features(p) for p in patients])
+        weights = np.array([self.model_weights[weight] for _, weight in FEATURE_WEIGHTS]) * 100
+        return np.clip(features @ weights, 0, 100)
+
+    def partial_fit(self, patients: List[Dict], outcomes, learning_rate: float = 0.05) -> Dict:
+        """
+        Update the feature weights from one mini-batch of labelled patients
+
+        Takes one gradient step on the Brier score of ``score / 100`` against
+        the 0/1 outcomes. Weights stay non-negative.
+
+        Args:
+            patients: Patient risk factor dicts
+            outcomes: 0/1 outcome per patient
+            learning_rate: Step size
+
+        Returns:
+            Batch size and the batch Brier score before and after the step
+        """
+        features = self._feature_matrix([self._extract_features(p) for p in patients])
+        outcomes = np.asarray(outcomes, dtype=np.float64)
+        names = [weight for _, weight in FEATURE_WEIGHTS]
+        weights = np.array([self.model_weights[name] for name in names])
+
+        probability = features @ weights
+        before = float(np.mean((np.clip(probability, 0, 1) - outcomes) ** 2))
+        # 截断区间外的评分对权重没有梯度
+        active = (probability > 0) & (probability < 1)
+        residual = np.where(active, np.clip(probability, 0, 1) - outcomes, 0.0)
+        gradient = 2 * residual @ features / max(len(outcomes), 1)
+        weights = np.maximum(weights - learning_rate * gradient, 0)
+        self.model_weights.update(zip(names, weights.tolist()))
+
+        after = float(np.mean((np.clip(features @ weights, 0, 1) - outcomes) ** 2))
+        self.logger.info(f"Weights updated from {len(outcomes)} patients: Brier {before:.4f} -> {after:.4f}")
+        return {'rows': int(len(outcomes)), 'brier_before': round(before, 6), 'brier_after': round(after, 6)}
+
+    def _sample_scores(self, features: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+        """Draw ``k`` noisy scores per patient (rows of ``features``) in one pass"""
+        n, f = features.shape
+        weights = np.array([self.model_weights[weight] for _, weight in FEATURE_WEIGHTS]) * 100
+        if self.privacy_level == "high":
+            values = np.clip(features[:, None, :] + rng.laplace(0, PRIVACY_NOISE_SCALE, size=(n, k, f)), 0, 1)
+            scores = values @ weights
+        else:
+            scores = np.repeat((features @ weights)[:, None], k, axis=1)
+        scores = np.clip(scores, 0, 100)
+        if self.federated_mode:
+            # Federated consensus and population factors, as in _apply_federated_adjustment
+            scores = np.clip(scores * rng.normal(1.0, 0.05, size=(n, k)) * rng.uniform(0.95, 1.05, size=(n, k)),
+                             0, 100)
+        return scores.astype(np.float32)
+
+    def _monte_carlo(self, features: np.ndarray, level: float = 0.95, budget_ms: Optional[float] = None,
+                     rng: Optional[np.random.Generator] = None) -> Dict:
+        """Sample in rounds until ``ci_samples`` are drawn or the deadline passes"""
+        start = time.perf_counter()
+        deadline = start + (self.ci_budget_ms if budget_ms is None else budget_ms) / 1000
+        rng = rng if rng is not None else np.random.default_rng()
+        n = max(len(features), 1)
+        target = max(min(self.ci_samples, MAX_CI_CELLS // n), MIN_CI_SAMPLES)
+        round_size = max(CI_ROUND_CELLS // (n * len(FEATURE_WEIGHTS)), 1)
+
+        rounds = []
+        drawn = 0
+        truncated = False
+        while drawn < target:
+            size = min(round_size, target - drawn)
+            rounds.append(self._sample_scores(features, size, rng))
+            drawn += size
+            if drawn >= MIN_CI_SAMPLES and drawn < target and time.perf_counter() >= deadline:
+                truncated = True
+                break
+
+        scores = np.concatenate(rounds, axis=1)
+        tail = (1 - level) / 2 * 100
+        lower, median, upper = np.percentile(scores, [tail, 50, 100 - tail], axis=1)
+        return {
+            'lower': lower,
+            'median': median,
+            'upper': upper,
+            'samples': drawn,
+            'truncated': truncated,
+            'elapsed_ms': (time.perf_counter() - start) * 1000
+        }
     
     def _calculate_feature_contributions(self, features: Dict) -> Dict:
         """Calculate individual feature contributions to risk"""
@@ -0,0 +1,235 @@
+"""
+准入控制
+Token-bucket admission control and a prioritised concurrency limiter.
+
+Routes are grouped into traffic classes. Each class has a shared token
+bucket, a token bucket per client and a concurrency cap, and every
+admitted request also takes a slot from the global concurrency limit.
+Low-priority classes (uploads, analyses, exports and charts) may only use
+part of the global slots, so prediction traffic always has headroom. A
+request that cannot be admitted is rejected immediately with ``429`` (rate
+limits) or ``503`` (no free slots) and a ``Retry-After`` header, never
+queued; tokens taken by the earlier checks are refunded.
+
+Clients are identified by remote address (install ``ProxyFix`` when running
+behind a reverse proxy); client-supplied headers are not trusted.
+
+Limits are enforced per process; under gunicorn the effective rate of a
+class is its ``rate`` multiplied by the number of workers.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from flask import current_app, g, jsonify, request
+
+DEFAULT_ADMISSION = {
+    # 全局并发上限
+    'max_concurrency': 64,
+    # 每类最多保留多少个客户端令牌桶（LRU淘汰）
+    'max_clients': 10000,
+    'classes': {
+        'predict': {
+            'routes': ['/api/predict/<disease_id>', '/api/predict/<disease_id>/batch', '/api/predict/multi',
+                       '/api/predict/<disease_id>/whatif', '/api/predict/<disease_id>/trajectory'],
+            'rate': 500, 'burst': 1000,
+            'client_rate': 50, 'client_burst': 100,
+            'max_concurrency': 64, 'max_share': 1.0
+        },
+        'analysis': {
+            'routes': ['/panda/upload', '/panda/analyze', '/api/imaging/<subcategory_id>/ingest',
+                       '/api/models/<disease_id>/updates'],
+            'rate': 2, 'burst': 5,
+            'client_rate': 0.2, 'client_burst': 2,
+            'max_concurrency': 4, 'max_share': 0.25
+        },
+        # 导出、图表渲染和大块数据读取
+        'reports': {
+            'routes': ['/api/export/catalog/<category_id>/<subcategory_id>', '/api/export/uploads/<filename>',
+                       '/api/export/analyses/<analysis_id>', '/api/charts/<disease_id>/gauge.png',
+                       '/api/charts/<disease_id>/contributions.png', '/api/charts/<disease_id>/distribution.png',
+                       '/api/omics/<subcategory_id>/<matrix_name>/values',
+                       '/api/omics/<subcategory_id>/<matrix_name>/stats',
+                       '/api/multimodal/medical_text/search', '/api/stats/risk_distribution'],
+            'rate': 20, 'burst': 40,
+            'client_rate': 2, 'client_burst': 10,
+            'max_concurrency': 8, 'max_share': 0.5
+        }
+    }
+}
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``rate`` tokens/second"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', '_lock')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: float = 1.0) -> Tuple[bool, float]:
+        """
+        Take tokens if available
+
+        Returns:
+            ``(admitted, retry_after_seconds)``
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True, 0.0
+            if self.rate <= 0:
+                return False, 60.0
+            return False, (tokens - self.tokens) / self.rate
+
+    def refund(self, tokens: float = 1.0):
+        """Return tokens taken for a request that was rejected later on"""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + tokens)
+
+
+class ConcurrencyLimiter:
+    """Global in-flight limit with per-class caps and priority shares"""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.by_class: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, traffic_class: str, class_limit: int, max_share: float) -> bool:
+        with self._lock:
+            # 低优先级类只能使用全局并发的一部分，为预测请求预留余量
+            share_limit = max(1, int(self.max_concurrency * max_share))
+            current = self.by_class.get(traffic_class, 0)
+            if (self.in_flight >= self.max_concurrency or self.in_flight >= share_limit
+                    or current >= class_limit):
+                return False
+            self.in_flight += 1
+            self.by_class[traffic_class] = current + 1
+            return True
+
+    def release(self, traffic_class: str):
+        with self._lock:
+            self.in_flight -= 1
+            self.by_class[traffic_class] -= 1
+
+
+class _TrafficClass:
+    def __init__(self, name: str, config: Dict, max_clients: int):
+        self.name = name
+        self.bucket = TokenBucket(config['rate'], config['burst'])
+        self.client_rate = config['client_rate']
+        self.client_burst = config['client_burst']
+        self.max_concurrency = config.get('max_concurrency', math.inf)
+        self.max_share = config.get('max_share', 1.0)
+        self.max_clients = max_clients
+        self.clients: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def client_bucket(self, client_id: str) -> TokenBucket:
+        with self._lock:
+            bucket = self.clients.get(client_id)
+            if bucket is None:
+                bucket = self.clients[client_id] = TokenBucket(self.client_rate, self.client_burst)
+                if len(self.clients) > self.max_clients:
+                    self.clients.popitem(last=False)
+            else:
+                self.clients.move_to_end(client_id)
+            return bucket
+
+
+class AdmissionController:
+    """Decides, before any work is done, whether a request is admitted"""
+
+    def __init__(self, config: Dict = None):
+        config = config or DEFAULT_ADMISSION
+        self.limiter = ConcurrencyLimiter(config['max_concurrency'])
+        self.classes: Dict[str, _TrafficClass] = {}
+        self.routes: Dict[str, _TrafficClass] = {}
+        for name, class_config in config['classes'].items():
+            traffic_class = _TrafficClass(name, class_config, config.get('max_clients', 10000))
+            self.classes[name] = traffic_class
+            for route in class_config['routes']:
+                self.routes[route] = traffic_class
+
+    def admit(self, route: str, client_id: str) -> Tuple[Optional[_TrafficClass], Optional[Tuple[int, float]]]:
+        """
+        Returns:
+            ``(traffic_class, rejection)``; rejection is ``(status, retry_after)``
+            or None when admitted. Unclassified routes are always admitted.
+        """
+        traffic_class = self.routes.get(route)
+        if traffic_class is None:
+            return None, None
+
+        client_bucket = traffic_class.client_bucket(client_id)
+        admitted, retry_after = client_bucket.try_acquire()
+        if not admitted:
+            return traffic_class, (429, retry_after)
+        admitted, retry_after = traffic_class.bucket.try_acquire()
+        if not admitted:
+            # 被后续检查拒绝的请求不消耗客户端配额
+            client_bucket.refund()
+            return traffic_class, (429, retry_after)
+        if not self.limiter.try_acquire(traffic_class.name, traffic_class.max_concurrency,
+                                        traffic_class.max_share):
+            client_bucket.refund()
+            traffic_class.bucket.refund()
+            return traffic_class, (503, 1.0)
+        return traffic_class, None
+
+    def release(self, traffic_class: _TrafficClass):
+        self.limiter.release(traffic_class.name)
+
+
+def client_identifier() -> str:
+    """Identify the caller by remote address (a header would let a client pick a fresh bucket per request)"""
+    return request.remote_addr or 'unknown'
+
+
+def init_app(app, controller: AdmissionController = None) -> AdmissionController:
+    """
+    Install admission control on a Flask app
+
+    Limits come from the ``ADMISSION`` config key; setting
+    ``ADMISSION_ENABLED`` to False turns the checks off (e.g. for benchmarks).
+    """
+    controller = controller or AdmissionController(app.config.get('ADMISSION', DEFAULT_ADMISSION))
+    app.config.setdefault('ADMISSION_ENABLED', True)
+
+    @app.before_request
+    def _admit():
+        if request.url_rule is None or not current_app.config['ADMISSION_ENABLED']:
+            return None
+        traffic_class, rejection = controller.admit(request.url_rule.rule, client_identifier())
+        if rejection is None:
+            if traffic_class is not None:
+                g.admission_class = traffic_class
+            return None
+
+        status, retry_after = rejection
+        message = 'Too many requests' if status == 429 else 'Server overloaded'
+        response = jsonify({'status': 'error', 'error': message, 'message': message})
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    @app.teardown_request
+    def _release(exc=None):
+        traffic_class = g.pop('admission_class', None)
+        if traffic_class is not None:
+            controller.release(traffic_class)
+
+    app.extensions['admission'] = controller
+    return controller
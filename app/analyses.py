@@ -0,0 +1,56 @@
+"""
+分析结果存储
+Persisted Panda analysis results, one JSON document per analysis.
+
+Results are written atomically (temporary file + rename) so exports and
+reports never read a half-written document.
+"""
+
+import json
+import os
+import re
+import uuid
+from datetime import datetime
+from typing import Dict
+
+_ID_RE = re.compile(r'^panda_[0-9]{8}_[0-9]{6}_[0-9a-f]{6}$')
+
+
+def new_analysis_id() -> str:
+    return f'panda_{datetime.now().strftime("%Y%m%d_%H%M%S")}_{uuid.uuid4().hex[:6]}'
+
+
+class AnalysisStore:
+    """Directory of analysis result documents"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, analysis_id: str) -> str:
+        if not _ID_RE.match(analysis_id or ''):
+            raise KeyError(analysis_id)
+        return os.path.join(self.root, f'{analysis_id}.json')
+
+    def save(self, result: Dict) -> str:
+        """Store a result that carries its ``analysis_id``"""
+        path = self.path(result['analysis_id'])
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        return path
+
+    def load(self, analysis_id: str) -> Dict:
+        try:
+            with open(self.path(analysis_id), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(analysis_id)
+
+
+def init_app(app) -> AnalysisStore:
+    """Create the result store configured by ``ANALYSIS_DIR``"""
+    store = AnalysisStore(app.config['ANALYSIS_DIR'])
+    app.extensions['analyses'] = store
+    return store
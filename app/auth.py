@@ -0,0 +1,24 @@
+"""
+管理接口鉴权
+Admin token check shared by the operational endpoints.
+
+Admin endpoints require the ``X-Admin-Token`` header to match the
+``ADMIN_TOKEN`` config value (defaulting to the environment variable of the
+same name) and are disabled when no token is configured.
+"""
+
+import hmac
+import os
+
+from flask import current_app, request
+
+
+def init_app(app):
+    app.config.setdefault('ADMIN_TOKEN', os.environ.get('ADMIN_TOKEN'))
+
+
+def is_admin() -> bool:
+    """True if the current request carries the configured admin token"""
+    token = current_app.config.get('ADMIN_TOKEN')
+    supplied = request.headers.get('X-Admin-Token', '')
+    return bool(token) and hmac.compare_digest(supplied.encode(), token.encode())
@@ -0,0 +1,380 @@
+"""
+多模态数据目录
+Indexed, paginated catalog of multimodal database records (SQLite).
+
+Each record belongs to one subcategory of MULTIMODAL_DATABASE (literature,
+records, reports, genomics, proteomics, metabolomics, ct, mri, xray,
+ultrasound) and carries a type, source, date and status. Listing uses
+keyset pagination ordered by ``(record_date DESC, id DESC)``: the cursor is
+the last row's sort key, so every page is an index range scan no matter
+how deep the client has paged. Per-subcategory counts by status and
+source are maintained by triggers, so page headers never count rows.
+Triggers also append the id of every inserted, updated or deleted record
+to ``catalog_changes``, which lets derived indexes (text search) follow
+the catalog without rescanning it.
+"""
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+STATUSES = ('active', 'processing', 'archived')
+FILTER_COLUMNS = {'type': 'record_type', 'source': 'source', 'status': 'status'}
+MAX_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog_records (
+    id INTEGER PRIMARY KEY,
+    category TEXT NOT NULL,
+    subcategory TEXT NOT NULL,
+    record_type TEXT NOT NULL,
+    source TEXT NOT NULL,
+    record_date TEXT NOT NULL,
+    status TEXT NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    content TEXT,
+    uri TEXT,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_catalog_date ON catalog_records (subcategory, record_date, id);
+CREATE INDEX IF NOT EXISTS idx_catalog_type ON catalog_records (subcategory, record_type, record_date, id);
+CREATE INDEX IF NOT EXISTS idx_catalog_source ON catalog_records (subcategory, source, record_date, id);
+CREATE INDEX IF NOT EXISTS idx_catalog_status ON catalog_records (subcategory, status, record_date, id);
+
+CREATE TABLE IF NOT EXISTS catalog_counts (
+    subcategory TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (subcategory, dimension, value)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS catalog_count_insert AFTER INSERT ON catalog_records BEGIN
+    INSERT INTO catalog_counts VALUES (NEW.subcategory, 'status', NEW.status, 1)
+        ON CONFLICT DO UPDATE SET count = count + 1;
+    INSERT INTO catalog_counts VALUES (NEW.subcategory, 'source', NEW.source, 1)
+        ON CONFLICT DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS catalog_count_delete AFTER DELETE ON catalog_records BEGIN
+    UPDATE catalog_counts SET count = count - 1
+        WHERE subcategory = OLD.subcategory AND dimension = 'status' AND value = OLD.status;
+    UPDATE catalog_counts SET count = count - 1
+        WHERE subcategory = OLD.subcategory AND dimension = 'source' AND value = OLD.source;
+    DELETE FROM catalog_counts WHERE count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS catalog_count_update AFTER UPDATE OF subcategory, status, source ON catalog_records BEGIN
+    UPDATE catalog_counts SET count = count - 1
+        WHERE subcategory = OLD.subcategory AND dimension = 'status' AND value = OLD.status;
+    UPDATE catalog_counts SET count = count - 1
+        WHERE subcategory = OLD.subcategory AND dimension = 'source' AND value = OLD.source;
+    DELETE FROM catalog_counts WHERE count <= 0;
+    INSERT INTO catalog_counts VALUES (NEW.subcategory, 'status', NEW.status, 1)
+        ON CONFLICT DO UPDATE SET count = count + 1;
+    INSERT INTO catalog_counts VALUES (NEW.subcategory, 'source', NEW.source, 1)
+        ON CONFLICT DO UPDATE SET count = count + 1;
+END;
+
+CREATE TABLE IF NOT EXISTS catalog_changes (
+    seq INTEGER PRIMARY KEY,
+    record_id INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS catalog_change_insert AFTER INSERT ON catalog_records BEGIN
+    INSERT INTO catalog_changes (record_id) VALUES (NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS catalog_change_delete AFTER DELETE ON catalog_records BEGIN
+    INSERT INTO catalog_changes (record_id) VALUES (OLD.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS catalog_change_update
+AFTER UPDATE OF id, category, subcategory, title, content ON catalog_records BEGIN
+    INSERT INTO catalog_changes (record_id) VALUES (OLD.id);
+    INSERT INTO catalog_changes (record_id) SELECT NEW.id WHERE NEW.id != OLD.id;
+END;
+"""
+
+COLUMNS = ('id', 'category', 'subcategory', 'record_type', 'source', 'record_date',
+           'status', 'title', 'uri', 'metadata')
+
+
+class CatalogError(ValueError):
+    """Invalid record, filter or cursor"""
+
+
+class CatalogConflict(CatalogError):
+    """A record id that is already taken"""
+
+
+def encode_cursor(record_date: str, record_id: int) -> str:
+    return base64.urlsafe_b64encode(f'{record_date}|{record_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        record_date, record_id = base64.urlsafe_b64decode(padded).decode().split('|')
+        return record_date, int(record_id)
+    except (ValueError, UnicodeDecodeError):
+        raise CatalogError('invalid cursor')
+
+
+def _check_date(value: str, name: str) -> str:
+    try:
+        return date.fromisoformat(value).isoformat()
+    except (TypeError, ValueError):
+        raise CatalogError(f'{name} must be a YYYY-MM-DD date')
+
+
+class Catalog:
+    """SQLite-backed record catalog"""
+
+    def __init__(self, path: str, subcategories: Dict[str, str]):
+        """
+        Args:
+            path: SQLite database file
+            subcategories: Subcategory id -> category id
+        """
+        self.path = path
+        self.subcategories = subcategories
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection, reopened after fork"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _row(self, record: Dict) -> tuple:
+        subcategory = record.get('subcategory')
+        if subcategory not in self.subcategories:
+            raise CatalogError(f'unknown subcategory: {subcategory}')
+        status = record.get('status', 'active')
+        if status not in STATUSES:
+            raise CatalogError(f'status must be one of {", ".join(STATUSES)}')
+        for field in ('record_type', 'source'):
+            if not isinstance(record.get(field), str) or not record[field]:
+                raise CatalogError(f'{field} is required')
+        record_id = record.get('id')
+        if record_id is not None and (isinstance(record_id, bool) or not isinstance(record_id, int)
+                                      or not 0 < record_id < 2 ** 63):
+            raise CatalogError('id must be a positive integer')
+        for field in ('title', 'content', 'uri'):
+            if record.get(field) is not None and not isinstance(record[field], str):
+                raise CatalogError(f'{field} must be a string')
+        metadata = record.get('metadata')
+        if metadata is not None and not isinstance(metadata, dict):
+            raise CatalogError('metadata must be an object')
+        return (
+            record_id,
+            self.subcategories[subcategory],
+            subcategory,
+            record['record_type'],
+            record['source'],
+            _check_date(record.get('record_date'), 'record_date'),
+            status,
+            record.get('title') or '',
+            record.get('content'),
+            record.get('uri'),
+            json.dumps(metadata, ensure_ascii=False) if metadata is not None else None
+        )
+
+    def add_records(self, records: Iterable[Dict]) -> List[int]:
+        """
+        Insert records in one transaction, returning their ids
+
+        Raises:
+            CatalogConflict: A supplied id already exists (nothing is inserted)
+        """
+        rows = [self._row(record) for record in records]
+        connection = self._connection()
+        ids = []
+        with self._write_lock:
+            try:
+                with connection:
+                    for row in rows:
+                        cursor = connection.execute(
+                            'INSERT INTO catalog_records (id, category, subcategory, record_type, source, '
+                            'record_date, status, title, content, uri, metadata) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', row)
+                        ids.append(cursor.lastrowid)
+            except sqlite3.IntegrityError as e:
+                if 'catalog_records.id' not in str(e):
+                    raise CatalogError(f'invalid record: {e}')
+                raise CatalogConflict(f'record id {row[0]} already exists')
+        return ids
+
+    def get(self, record_id: int, with_content: bool = False) -> Optional[Dict]:
+        columns = COLUMNS + (('content',) if with_content else ())
+        row = self._connection().execute(
+            f'SELECT {", ".join(columns)} FROM catalog_records WHERE id = ?', (record_id,)).fetchone()
+        return self._to_dict(columns, row) if row else None
+
+    @staticmethod
+    def _to_dict(columns, row) -> Dict:
+        record = dict(zip(columns, row))
+        if record.get('metadata'):
+            record['metadata'] = json.loads(record['metadata'])
+        return record
+
+    def _conditions(self, subcategory, filters, date_from, date_to) -> Tuple[List[str], List]:
+        if subcategory not in self.subcategories:
+            raise CatalogError(f'unknown subcategory: {subcategory}')
+        conditions, params = ['subcategory = ?'], [subcategory]
+        for name, value in (filters or {}).items():
+            if name not in FILTER_COLUMNS:
+                raise CatalogError(f'cannot filter by {name}')
+            if value:
+                conditions.append(f'{FILTER_COLUMNS[name]} = ?')
+                params.append(value)
+        if date_from:
+            conditions.append('record_date >= ?')
+            params.append(_check_date(date_from, 'date_from'))
+        if date_to:
+            conditions.append('record_date <= ?')
+            params.append(_check_date(date_to, 'date_to'))
+        return conditions, params
+
+    def list_records(self, subcategory: str, filters: Optional[Dict[str, str]] = None,
+                     date_from: Optional[str] = None, date_to: Optional[str] = None,
+                     cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[Dict], Optional[str]]:
+        """
+        List one page of records, newest first
+
+        Args:
+            subcategory: Subcategory id
+            filters: Any of ``type``, ``source``, ``status`` -> exact value
+            date_from, date_to: Inclusive date bounds
+            cursor: ``next_cursor`` from the previous page
+            limit: Page size (capped at MAX_PAGE_SIZE)
+
+        Returns:
+            ``(records, next_cursor)``; next_cursor is None on the last page
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        conditions, params = self._conditions(subcategory, filters, date_from, date_to)
+        if cursor:
+            conditions.append('(record_date, id) < (?, ?)')
+            params.extend(decode_cursor(cursor))
+
+        sql = (f'SELECT {", ".join(COLUMNS)} FROM catalog_records WHERE {" AND ".join(conditions)} '
+               'ORDER BY record_date DESC, id DESC LIMIT ?')
+        rows = self._connection().execute(sql, params + [limit + 1]).fetchall()
+
+        records = [self._to_dict(COLUMNS, row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = records[-1]
+            next_cursor = encode_cursor(last['record_date'], last['id'])
+        return records, next_cursor
+
+    def iter_records(self, subcategory: str, filters: Optional[Dict[str, str]] = None,
+                     date_from: Optional[str] = None, date_to: Optional[str] = None,
+                     offset: int = 0, batch_size: int = 1000) -> Iterator[Dict]:
+        """
+        Iterate over every matching record in listing order, skipping ``offset`` rows
+
+        The offset is applied once; later batches continue from the last
+        row's key, so each batch is an index range scan.
+        """
+        conditions, params = self._conditions(subcategory, filters, date_from, date_to)
+        return self._iter_batches(conditions, params, offset, batch_size)
+
+    def _iter_batches(self, conditions, params, offset, batch_size):
+        connection = self._connection()
+        select = f'SELECT {", ".join(COLUMNS)} FROM catalog_records WHERE '
+        order = ' ORDER BY record_date DESC, id DESC LIMIT ? OFFSET ?'
+        rows = connection.execute(select + ' AND '.join(conditions) + order,
+                                  params + [batch_size, offset]).fetchall()
+        while rows:
+            for row in rows:
+                yield self._to_dict(COLUMNS, row)
+            if len(rows) < batch_size:
+                return
+            last_date, last_id = rows[-1][COLUMNS.index('record_date')], rows[-1][0]
+            rows = connection.execute(
+                select + ' AND '.join(conditions + ['(record_date, id) < (?, ?)']) + order,
+                params + [last_date, last_id, batch_size, 0]).fetchall()
+
+    def iter_text(self, category: str, after_id: int = 0, batch_size: int = 5000):
+        """Yield ``(id, subcategory, title, content)`` of a category's records in id order"""
+        connection = self._connection()
+        while True:
+            rows = connection.execute(
+                'SELECT id, subcategory, title, content FROM catalog_records '
+                'WHERE id > ? AND category = ? ORDER BY id LIMIT ?',
+                (after_id, category, batch_size)).fetchall()
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after_id = rows[-1][0]
+
+    def last_change(self) -> int:
+        """Sequence number of the latest catalog change (0 if none)"""
+        return self._connection().execute('SELECT COALESCE(MAX(seq), 0) FROM catalog_changes').fetchone()[0]
+
+    def iter_changes(self, after_seq: int = 0, batch_size: int = 5000):
+        """Yield ``(seq, record_id)`` of inserts, updates and deletes after a sequence number"""
+        connection = self._connection()
+        while True:
+            rows = connection.execute(
+                'SELECT seq, record_id FROM catalog_changes WHERE seq > ? ORDER BY seq LIMIT ?',
+                (after_seq, batch_size)).fetchall()
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after_seq = rows[-1][0]
+
+    def text_records(self, category: str, record_ids: Iterable[int]) -> List[tuple]:
+        """``(id, subcategory, title, content)`` of those records that exist and belong to a category"""
+        record_ids = list(record_ids)
+        rows = []
+        connection = self._connection()
+        # 分批绑定参数，避免超出SQLite变量个数上限
+        for start in range(0, len(record_ids), 500):
+            chunk = record_ids[start:start + 500]
+            rows.extend(connection.execute(
+                'SELECT id, subcategory, title, content FROM catalog_records '
+                f'WHERE category = ? AND id IN ({", ".join("?" * len(chunk))}) ORDER BY id',
+                [category] + chunk).fetchall())
+        return rows
+
+    def summary(self, subcategory: str) -> Dict:
+        """Total, per-status and per-source counts from the trigger-maintained table"""
+        rows = self._connection().execute(
+            'SELECT dimension, value, count FROM catalog_counts WHERE subcategory = ?', (subcategory,)).fetchall()
+        statuses = {value: count for dimension, value, count in rows if dimension == 'status'}
+        sources = {value: count for dimension, value, count in rows if dimension == 'source'}
+        return {
+            'total': sum(statuses.values()),
+            'statuses': statuses,
+            'sources': len(sources)
+        }
+
+
+def init_app(app, multimodal_database: Dict) -> Catalog:
+    """Create the catalog configured by ``CATALOG_DB_PATH``"""
+    subcategories = {
+        subcategory['id']: category_id
+        for category_id, category in multimodal_database.items()
+        for subcategory in category['subcategories']
+    }
+    catalog = Catalog(app.config['CATALOG_DB_PATH'], subcategories)
+    app.extensions['catalog'] = catalog
+    return catalog
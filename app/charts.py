@@ -0,0 +1,246 @@
+"""
+风险图表渲染
+Server-side risk charts rendered by a pool of matplotlib worker processes.
+
+matplotlib is slow to import and its global state is not thread-safe, so
+charts are never drawn in request threads. A long-lived process pool (spawn
+context, Agg backend) renders them, and matplotlib is only ever imported
+inside the workers.
+
+Every chart is identified by the sha256 of its kind and inputs (canonical
+JSON), and the PNG is stored content-addressed::
+
+    <CHART_CACHE_DIR>/ab/<digest>.png
+
+A repeated chart is a plain file read. Concurrent requests for a chart that
+is still being rendered wait on the same job instead of rendering it twice.
+A render that fails in the worker or outlasts ``timeout`` raises
+``RenderError`` so the caller can answer 503/504 instead of crashing.
+
+Chart kinds:
+
+* ``gauge`` - ``{'score': 42.5, 'title': ...}``
+* ``contributions`` - ``{'items': [[label, value], ...], 'title': ...}``
+* ``distribution`` - ``{'histogram': [10 counts], 'score': optional, 'title': ...}``
+"""
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+# 修改绘图代码后递增，使旧缓存失效
+CHART_VERSION = 1
+KINDS = ('gauge', 'contributions', 'distribution')
+# 与 get_risk_level 的阈值一致：(下界, 上界, 颜色)
+RISK_BANDS = ((0, 30, '#28a745'), (30, 70, '#fd7e14'), (70, 100, '#dc3545'))
+DPI = 100
+
+
+class ChartError(ValueError):
+    """Unknown chart kind or invalid chart inputs"""
+
+
+class RenderError(RuntimeError):
+    """A valid chart that could not be rendered (worker failure or timeout)"""
+
+    def __init__(self, message: str, timed_out: bool = False):
+        super().__init__(message)
+        self.timed_out = timed_out
+
+
+def chart_key(kind: str, spec: Dict) -> str:
+    payload = json.dumps({'kind': kind, 'spec': spec, 'version': CHART_VERSION},
+                         sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _band_color(score: float) -> str:
+    for low, high, color in RISK_BANDS:
+        if score < high:
+            return color
+    return RISK_BANDS[-1][2]
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _draw_gauge(figure, spec):
+    import math
+    from matplotlib.patches import Wedge
+
+    ax = figure.add_subplot(1, 1, 1)
+    for low, high, color in RISK_BANDS:
+        # 0分在左侧(180°)，100分在右侧(0°)
+        ax.add_patch(Wedge((0, 0), 1.0, 180 - high * 1.8, 180 - low * 1.8, width=0.3, color=color, alpha=0.85))
+    score = min(max(spec['score'], 0.0), 100.0)
+    angle = math.radians(180 - score * 1.8)
+    ax.plot([0, 0.8 * math.cos(angle)], [0, 0.8 * math.sin(angle)], color='#343a40', linewidth=3)
+    ax.add_patch(Wedge((0, 0), 0.06, 0, 360, color='#343a40'))
+    ax.text(0, -0.2, f'{spec["score"]:.1f}', ha='center', va='center', fontsize=22, fontweight='bold')
+    ax.set_xlim(-1.1, 1.1)
+    ax.set_ylim(-0.35, 1.1)
+    ax.set_aspect('equal')
+    ax.axis('off')
+
+
+def _draw_contributions(figure, spec):
+    items = sorted(spec['items'], key=lambda item: abs(item[1]))
+    ax = figure.add_subplot(1, 1, 1)
+    labels = [label for label, _ in items]
+    values = [value for _, value in items]
+    ax.barh(range(len(items)), values, color=['#dc3545' if value > 0 else '#28a745' for value in values])
+    ax.set_yticks(range(len(items)), labels)
+    ax.axvline(0, color='#343a40', linewidth=0.8)
+    ax.set_xlabel('Risk score contribution')
+    ax.grid(axis='x', alpha=0.3)
+
+
+def _draw_distribution(figure, spec):
+    histogram = spec['histogram']
+    width = 100.0 / len(histogram)
+    edges = [i * width for i in range(len(histogram))]
+    ax = figure.add_subplot(1, 1, 1)
+    ax.bar(edges, histogram, width=width, align='edge', edgecolor='white',
+           color=[_band_color(edge + width / 2) for edge in edges])
+    if spec.get('score') is not None:
+        ax.axvline(spec['score'], color='#343a40', linestyle='--', linewidth=1.5, label='Current score')
+        ax.legend()
+    ax.set_xlim(0, 100)
+    ax.set_xlabel('Risk score')
+    ax.set_ylabel('Predictions')
+    ax.grid(axis='y', alpha=0.3)
+
+
+_DRAW = {'gauge': _draw_gauge, 'contributions': _draw_contributions, 'distribution': _draw_distribution}
+_SIZES = {'gauge': (4, 3), 'contributions': (6, 4), 'distribution': (6, 4)}
+
+
+def _render(kind: str, spec: Dict, path: str) -> str:
+    """Worker: draw one chart and publish it atomically at ``path``"""
+    from matplotlib.figure import Figure
+
+    # 直接使用Figure，不经过pyplot的全局状态
+    figure = Figure(figsize=_SIZES[kind], dpi=DPI)
+    _DRAW[kind](figure, spec)
+    if spec.get('title'):
+        figure.suptitle(spec['title'])
+    figure.tight_layout()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    figure.savefig(tmp, format='png')
+    os.replace(tmp, path)
+    return path
+
+
+def _validate(kind: str, spec: Dict):
+    if kind not in KINDS:
+        raise ChartError(f'chart kind must be one of {", ".join(KINDS)}')
+    if kind in ('gauge', 'distribution') and spec.get('score') is not None:
+        if not isinstance(spec['score'], (int, float)) or not 0 <= spec['score'] <= 100:
+            raise ChartError('score must be between 0 and 100')
+    if kind == 'gauge' and spec.get('score') is None:
+        raise ChartError('score is required')
+    if kind == 'contributions' and not spec.get('items'):
+        raise ChartError('items are required')
+    if kind == 'distribution' and not spec.get('histogram'):
+        raise ChartError('histogram is required')
+
+
+class ChartService:
+    """Process pool renderer with a content-addressed PNG cache"""
+
+    def __init__(self, cache_dir: str, workers: Optional[int] = None, timeout: float = 30.0):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.rendered = 0
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], f'{digest}.png')
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            import multiprocessing
+            # 使用spawn，避免从多线程的服务进程fork
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def render(self, kind: str, spec: Dict) -> str:
+        """
+        Return the path of the chart PNG, rendering it on a cache miss
+
+        Args:
+            kind: gauge, contributions or distribution
+            spec: JSON-serializable chart inputs
+
+        Returns:
+            Path of the cached PNG file
+
+        Raises:
+            ChartError: Invalid chart inputs
+            RenderError: The worker failed or did not finish within ``timeout``
+        """
+        _validate(kind, spec)
+        digest = chart_key(kind, spec)
+        path = self.path(digest)
+        if os.path.exists(path):
+            return path
+
+        with self._lock:
+            future = self._pending.get(digest)
+            if future is None:
+                try:
+                    future = self._executor().submit(_render, kind, spec, path)
+                except BrokenProcessPool:
+                    # 工作进程异常退出，重建进程池
+                    self._pool = None
+                    future = self._executor().submit(_render, kind, spec, path)
+                self._pending[digest] = future
+                self.rendered += 1
+                owner = True
+            else:
+                owner = False
+        if owner:
+            # 回调可能在当前线程立即执行，须在锁外注册
+            future.add_done_callback(lambda _: self._forget(digest))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # 渲染任务继续执行，完成后写入缓存供后续请求使用
+            raise RenderError(f'chart not rendered within {self.timeout:g}s', timed_out=True)
+        except BrokenProcessPool:
+            with self._lock:
+                self._pool = None
+            raise RenderError('chart worker exited')
+        except Exception as e:
+            raise RenderError(f'chart rendering failed: {e}')
+
+    def _forget(self, digest: str):
+        with self._lock:
+            self._pending.pop(digest, None)
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def init_app(app) -> ChartService:
+    """Create the chart service configured by ``CHART_CACHE_DIR``"""
+    import atexit
+
+    service = ChartService(app.config['CHART_CACHE_DIR'], app.config.get('CHART_WORKERS'))
+    atexit.register(service.close)
+    app.extensions['charts'] = service
+    return service
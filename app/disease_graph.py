@@ -0,0 +1,112 @@
+"""
+多疾病依赖评估
+Dependency-aware evaluation of several diseases for the same patients.
+
+Some disease schemas take another condition as an input (``stroke`` has a
+``diabetes`` factor). ``DEPENDENCIES`` lists these edges; when the client
+does not supply such a factor, it is filled from the upstream disease's
+predicted state instead of the population statistics. Diseases are
+evaluated in topological order, and an upstream disease that was not
+requested is evaluated as an intermediate node.
+
+All diseases share one patient frame: a missing factor is imputed once (by
+the first disease that uses it) so every disease sees the same value, and
+the cleaned columns and derived features (pack-years, BMI band, age band)
+are memoized in a single ``Features`` object for the whole request or batch.
+"""
+
+from typing import Callable, Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+from app.scoring import Features, score_columns
+
+# 与 get_risk_level 一致：评分达到高风险即视为存在该疾病
+HIGH_RISK_SCORE = 70
+
+
+def _has_condition(scores: np.ndarray) -> np.ndarray:
+    return (scores >= HIGH_RISK_SCORE).astype(np.float64)
+
+
+# (疾病, 输入因子) -> (上游疾病, 由上游评分得到因子值)
+DEPENDENCIES: Dict[Tuple[str, str], Tuple[str, Callable[[np.ndarray], np.ndarray]]] = {
+    ('stroke', 'diabetes'): ('diabetes', _has_condition),
+}
+
+
+def evaluation_order(disease_ids: Sequence[str]) -> List[str]:
+    """
+    Requested diseases plus their upstream diseases, dependencies first
+
+    Raises:
+        ValueError: The dependency edges contain a cycle
+    """
+    upstream: Dict[str, List[str]] = {}
+    for (disease_id, _), (source, _) in DEPENDENCIES.items():
+        upstream.setdefault(disease_id, []).append(source)
+
+    order: List[str] = []
+    visiting = set()
+
+    def visit(disease_id):
+        if disease_id in order:
+            return
+        if disease_id in visiting:
+            raise ValueError(f'dependency cycle at {disease_id}')
+        visiting.add(disease_id)
+        for source in upstream.get(disease_id, []):
+            visit(source)
+        visiting.discard(disease_id)
+        order.append(disease_id)
+
+    for disease_id in disease_ids:
+        visit(disease_id)
+    return order
+
+
+def evaluate(disease_models: Mapping, imputer, disease_ids: Sequence[str],
+             values: Dict[str, np.ndarray], n_rows: int) -> Dict:
+    """
+    Score several diseases over one patient frame
+
+    Args:
+        disease_models: DISEASE_MODELS
+        imputer: ``app.imputation.Imputer``
+        disease_ids: Requested diseases
+        values: Validated float64 columns (NaN for missing); filled in place
+        n_rows: Number of patients
+
+    Returns:
+        ``order``, per-disease ``scores``, ``imputed`` and ``derived`` masks
+        (field -> rows) and the shared ``features``
+    """
+    observed = {field: ~np.isnan(column) for field, column in values.items()}
+    order = evaluation_order(disease_ids)
+    dependent = {key: edge for key, edge in DEPENDENCIES.items() if key[0] in order}
+    unknown = np.zeros(n_rows, dtype=bool)
+
+    # 先填充所有非依赖因子；依赖因子留待上游疾病评分后再填
+    imputed: Dict[str, Dict[str, np.ndarray]] = {}
+    for disease_id in order:
+        fields = [factor['id'] for factor in disease_models[disease_id]['risk_factors']
+                  if (disease_id, factor['id']) not in dependent]
+        # 只填充仍缺失的值，已由前面疾病填充的值保持不变
+        imputer.impute_columns(disease_id, {field: values.setdefault(field, np.full(n_rows, np.nan))
+                                            for field in fields})
+        # 没有参考数据的因子保持缺失，由评分函数取默认值
+        imputed[disease_id] = {field: ~observed.get(field, unknown) & ~np.isnan(values[field]) for field in fields}
+
+    # 所有疾病共享同一个特征缓存
+    features = Features(values, n_rows)
+    scores: Dict[str, np.ndarray] = {}
+    derived: Dict[str, Dict[str, np.ndarray]] = {disease_id: {} for disease_id in order}
+    for disease_id in order:
+        for (target, field), (source, transform) in dependent.items():
+            if target == disease_id:
+                column = values.setdefault(field, np.full(n_rows, np.nan))
+                missing = np.isnan(column)
+                column[missing] = transform(scores[source])[missing]
+                derived[disease_id][field] = missing
+        scores[disease_id] = score_columns(disease_id, features)
+    return {'order': order, 'scores': scores, 'imputed': imputed, 'derived': derived, 'features': features}
@@ -0,0 +1,302 @@
+"""
+模型评估
+Single-pass evaluation of a scorer against labelled data.
+
+``StreamingEvaluator`` keeps two score histograms (positives and negatives)
+at 0.1-point resolution plus ten calibration bins, so memory does not depend
+on the number of rows. Every threshold's confusion matrix is a cumulative
+sum over the histograms, and so are the ROC and precision-recall curves
+derived from them.
+
+``LabelledCsv`` streams an uploaded CSV through validation and imputation in
+chunks; ``evaluate_csv`` scores each chunk with the vectorized scorer and
+feeds it to the evaluator.
+
+Suggested cut-offs:
+
+* ``youden`` - maximises sensitivity + specificity - 1
+* ``f1`` - maximises F1
+* ``low_medium`` - highest threshold that keeps sensitivity >= 0.9 (rule-out)
+* ``medium_high`` - lowest threshold with specificity >= 0.9 (rule-in)
+
+The last two are the data-driven replacement for the fixed 30/70 boundaries
+of ``get_risk_level``.
+"""
+
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+# 评分分辨率：每0.1分一个直方图桶
+SCORE_RESOLUTION = 10
+N_SCORE_BINS = 100 * SCORE_RESOLUTION + 1
+CALIBRATION_BINS = 10
+CURVE_POINTS = 101
+TARGET_SENSITIVITY = 0.9
+TARGET_SPECIFICITY = 0.9
+CHUNK_ROWS = 50000
+
+OUTCOME_COLUMNS = ('outcome', 'label', 'diagnosis', 'target', 'y')
+LABEL_VALUES = {
+    '1': 1.0, '1.0': 1.0, 'true': 1.0, 'yes': 1.0, 'y': 1.0, 'positive': 1.0,
+    '0': 0.0, '0.0': 0.0, 'false': 0.0, 'no': 0.0, 'n': 0.0, 'negative': 0.0
+}
+
+
+class EvaluationError(ValueError):
+    """Data that cannot be evaluated"""
+
+
+class MissingOutcomeError(EvaluationError):
+    """The data has no outcome column"""
+
+
+def _csv_errors():
+    import pandas as pd
+
+    return pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError
+
+
+def _rate(numerator, denominator):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator > 0, numerator / np.maximum(denominator, 1), 0.0)
+
+
+class StreamingEvaluator:
+    """Accumulates score histograms and calibration statistics chunk by chunk"""
+
+    def __init__(self):
+        self.positives = np.zeros(N_SCORE_BINS, dtype=np.int64)
+        self.negatives = np.zeros(N_SCORE_BINS, dtype=np.int64)
+        self.calibration_count = np.zeros(CALIBRATION_BINS, dtype=np.int64)
+        self.calibration_predicted = np.zeros(CALIBRATION_BINS)
+        self.calibration_observed = np.zeros(CALIBRATION_BINS)
+        self.brier_sum = 0.0
+
+    @property
+    def rows(self) -> int:
+        return int(self.positives.sum() + self.negatives.sum())
+
+    def update(self, scores: np.ndarray, labels: np.ndarray):
+        """Add a chunk of risk scores (0-100) and binary labels"""
+        scores = np.clip(np.asarray(scores, dtype=np.float64), 0, 100)
+        labels = np.asarray(labels, dtype=np.float64)
+        bins = np.floor(scores * SCORE_RESOLUTION + 1e-9).astype(np.intp)
+        positive = labels == 1
+        self.positives += np.bincount(bins[positive], minlength=N_SCORE_BINS)
+        self.negatives += np.bincount(bins[~positive], minlength=N_SCORE_BINS)
+
+        probability = scores / 100
+        calibration = np.minimum((probability * CALIBRATION_BINS).astype(np.intp), CALIBRATION_BINS - 1)
+        self.calibration_count += np.bincount(calibration, minlength=CALIBRATION_BINS)
+        self.calibration_predicted += np.bincount(calibration, weights=probability, minlength=CALIBRATION_BINS)
+        self.calibration_observed += np.bincount(calibration, weights=labels, minlength=CALIBRATION_BINS)
+        self.brier_sum += float(((probability - labels) ** 2).sum())
+
+    def _cumulative(self):
+        """TP and FP when predicting positive for score >= each histogram threshold"""
+        tp = np.cumsum(self.positives[::-1])[::-1]
+        fp = np.cumsum(self.negatives[::-1])[::-1]
+        return tp, fp
+
+    def confusion(self, threshold: float) -> Dict:
+        """Confusion matrix for ``score >= threshold``"""
+        index = int(np.clip(np.ceil(threshold * SCORE_RESOLUTION - 1e-9), 0, N_SCORE_BINS))
+        tp = int(self.positives[index:].sum())
+        fp = int(self.negatives[index:].sum())
+        fn = int(self.positives.sum()) - tp
+        tn = int(self.negatives.sum()) - fp
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        return {
+            'threshold': round(threshold, 1),
+            'tp': tp, 'fp': fp, 'tn': tn, 'fn': fn,
+            'accuracy': round((tp + tn) / max(tp + fp + tn + fn, 1), 4),
+            'precision': round(precision, 4),
+            'recall': round(recall, 4),
+            'specificity': round(tn / (tn + fp) if tn + fp else 0.0, 4),
+            'f1_score': round(2 * precision * recall / (precision + recall) if precision + recall else 0.0, 4)
+        }
+
+    def result(self) -> Dict:
+        """Metrics, curves, calibration and suggested cut-offs"""
+        n_pos, n_neg = int(self.positives.sum()), int(self.negatives.sum())
+        if not n_pos or not n_neg:
+            raise EvaluationError('outcome must contain both positive and negative cases')
+
+        tp, fp = self._cumulative()
+        tpr = tp / n_pos
+        fpr = fp / n_neg
+        precision = _rate(tp, tp + fp)
+        f1 = _rate(2 * precision * tpr, precision + tpr)
+        thresholds = np.arange(N_SCORE_BINS) / SCORE_RESOLUTION
+
+        # ROC从(0,0)到(1,1)：阈值由高到低
+        roc_x = np.concatenate([[0.0], fpr[::-1]])
+        roc_y = np.concatenate([[0.0], tpr[::-1]])
+        auc = float(np.trapezoid(roc_y, roc_x))
+        # 平均精确率：按召回率增量加权
+        recall_steps = np.diff(np.concatenate([[0.0], tpr[::-1]]))
+        average_precision = float((recall_steps * precision[::-1]).sum())
+
+        youden = int(np.argmax(tpr - fpr))
+        best_f1 = int(np.argmax(f1))
+        sensitive = np.flatnonzero(tpr >= TARGET_SENSITIVITY)
+        specific = np.flatnonzero(1 - fpr >= TARGET_SPECIFICITY)
+        low_medium = thresholds[sensitive[-1]] if sensitive.size else 0.0
+        medium_high = thresholds[specific[0]] if specific.size else 100.0
+        medium_high = max(medium_high, low_medium)
+
+        # 曲线按整数分降采样
+        step = (N_SCORE_BINS - 1) // (CURVE_POINTS - 1)
+        points = np.arange(0, N_SCORE_BINS, step)
+
+        calibration = []
+        for i in range(CALIBRATION_BINS):
+            count = int(self.calibration_count[i])
+            calibration.append({
+                'bin': [i * 100 // CALIBRATION_BINS, (i + 1) * 100 // CALIBRATION_BINS],
+                'count': count,
+                'mean_predicted': round(self.calibration_predicted[i] / count, 4) if count else None,
+                'observed_rate': round(self.calibration_observed[i] / count, 4) if count else None
+            })
+
+        return {
+            'rows': n_pos + n_neg,
+            'positives': n_pos,
+            'negatives': n_neg,
+            'auc': round(auc, 4),
+            'average_precision': round(average_precision, 4),
+            'brier_score': round(self.brier_sum / (n_pos + n_neg), 4),
+            'suggested_thresholds': {
+                'youden': float(thresholds[youden]),
+                'f1': float(thresholds[best_f1]),
+                'low_medium': float(low_medium),
+                'medium_high': float(medium_high)
+            },
+            'confusion': {
+                'current_medium': self.confusion(30),
+                'current_high': self.confusion(70),
+                'youden': self.confusion(thresholds[youden]),
+                'f1': self.confusion(thresholds[best_f1])
+            },
+            'roc_curve': {'threshold': thresholds[points].tolist(), 'fpr': fpr[points].round(4).tolist(),
+                          'tpr': tpr[points].round(4).tolist()},
+            'pr_curve': {'threshold': thresholds[points].tolist(), 'recall': tpr[points].round(4).tolist(),
+                         'precision': precision[points].round(4).tolist()},
+            'calibration': calibration
+        }
+
+
+def find_outcome_column(columns, requested: Optional[str] = None,
+                        disease_id: Optional[str] = None) -> Optional[str]:
+    """The requested column, else a column named after the disease, else a generic outcome name"""
+    if requested:
+        return requested if requested in columns else None
+    if disease_id and disease_id in columns:
+        return disease_id
+    lowered = {column.strip().lower(): column for column in columns}
+    return next((lowered[name] for name in OUTCOME_COLUMNS if name in lowered), None)
+
+
+class LabelledCsv:
+    """
+    Chunked reader of a labelled CSV for one disease
+
+    Iterating yields ``(values, labels)``: validated and imputed float64
+    columns for the disease's risk factors, and 0/1 labels. Rows without a
+    recognised label are skipped; invalid factor values are imputed like
+    missing ones.
+
+    Raises:
+        MissingOutcomeError: No outcome column
+        EvaluationError: The file is not a readable CSV
+    """
+
+    def __init__(self, path: str, disease_id: str, validator, imputer, outcome_column: Optional[str] = None,
+                 chunk_rows: int = CHUNK_ROWS):
+        import pandas as pd
+
+        try:
+            header = pd.read_csv(path, nrows=0).columns
+        except _csv_errors() as e:
+            raise EvaluationError(f'unreadable CSV: {e}')
+        self.outcome = find_outcome_column(header, outcome_column, disease_id)
+        if self.outcome is None:
+            raise MissingOutcomeError('no outcome column')
+        self.path = path
+        self.disease_id = disease_id
+        self.validator = validator
+        self.imputer = imputer
+        self.chunk_rows = chunk_rows
+        self.fields = [field for field in validator.fields if field in header and field != self.outcome]
+        self.skipped_rows = 0
+        self.rows_with_invalid_values = 0
+
+    def __iter__(self):
+        import pandas as pd
+
+        try:
+            chunks = pd.read_csv(self.path, usecols=self.fields + [self.outcome], chunksize=self.chunk_rows,
+                                 dtype=str, keep_default_na=False)
+        except _csv_errors() as e:
+            raise EvaluationError(f'unreadable CSV: {e}')
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            except _csv_errors() as e:
+                raise EvaluationError(f'unreadable CSV: {e}')
+            labels = chunk[self.outcome].str.strip().str.lower().map(LABEL_VALUES).to_numpy(dtype=np.float64)
+            labelled = ~np.isnan(labels)
+            self.skipped_rows += int((~labelled).sum())
+            if not labelled.any():
+                continue
+            chunk = chunk[labelled]
+            raw = {field: pd.to_numeric(chunk[field], errors='coerce').to_numpy(dtype=np.float64)
+                   for field in self.fields}
+            # 非法值按缺失处理并填充
+            batch = self.validator.validate_columns(raw, len(chunk))
+            self.rows_with_invalid_values += len(batch.errors)
+            self.imputer.impute_columns(self.disease_id, batch.values)
+            yield batch.values, labels[labelled]
+
+
+def evaluate_csv(path: str, disease_id: str, validator, imputer, outcome_column: Optional[str] = None,
+                 chunk_rows: int = CHUNK_ROWS) -> Dict:
+    """
+    Score a labelled CSV in chunks and evaluate the scores against the outcome
+
+    Args:
+        path: CSV with one column per risk factor and an outcome column
+        disease_id: Scorer to evaluate
+        validator: ``FactorValidator`` of the disease
+        imputer: ``Imputer`` for missing factor values
+        outcome_column: Outcome column name (detected when omitted)
+
+    Returns:
+        ``StreamingEvaluator.result()`` plus row counts and timing
+
+    Raises:
+        MissingOutcomeError: No outcome column
+        EvaluationError: Only one outcome class
+    """
+    from app.scoring import score_columns
+
+    start = time.perf_counter()
+    reader = LabelledCsv(path, disease_id, validator, imputer, outcome_column, chunk_rows)
+    evaluator = StreamingEvaluator()
+    for values, labels in reader:
+        evaluator.update(score_columns(disease_id, values), labels)
+
+    result = evaluator.result()
+    result.update({
+        'outcome_column': reader.outcome,
+        'features_used': reader.fields,
+        'skipped_rows': reader.skipped_rows,
+        'rows_with_invalid_values': reader.rows_with_invalid_values,
+        'elapsed_seconds': round(time.perf_counter() - start, 3)
+    })
+    return result
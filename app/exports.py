@@ -0,0 +1,187 @@
+"""
+数据导出
+Streaming exports in CSV, NDJSON and columnar form.
+
+Exports are generators wrapped in ``stream_with_context``, so the response
+goes out with chunked transfer encoding while rows are still being read
+and memory use does not grow with the export size. Rows are buffered into
+chunks of roughly ``CHUNK_BYTES`` before each write.
+
+Every export accepts an ``offset`` (number of data rows to skip) so an
+interrupted download can be resumed; the ``X-Export-Offset`` response
+header echoes it. The CSV header is only written when the offset is 0, so
+a resumed download can be appended to the partial file as-is.
+
+The columnar format is NDJSON with one line per batch of rows:
+``{"offset": 1000, "columns": {"name": [...], ...}}``.
+"""
+
+import codecs
+import csv
+import io
+import json
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from flask import Response, stream_with_context
+
+CHUNK_BYTES = 64 * 1024
+# 导出上传文件前校验编码时每次读取的字节数
+CHECK_BYTES = 1024 * 1024
+COLUMNAR_BATCH_ROWS = 1000
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'columnar': ('application/x-ndjson', 'columns.ndjson')
+}
+
+
+def _json_default(value):
+    # numpy标量等
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+
+
+def _cell(value):
+    if isinstance(value, (dict, list)):
+        return _dumps(value)
+    return value
+
+
+def iter_csv(rows: Iterable[Dict], columns: Sequence[str], header: bool = True) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_cell(row.get(column)) for column in columns])
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(rows: Iterable[Dict], columns: Sequence[str]) -> Iterator[str]:
+    chunk: List[str] = []
+    size = 0
+    for row in rows:
+        line = _dumps({column: row.get(column) for column in columns}) + '\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def iter_columnar(rows: Iterable[Dict], columns: Sequence[str], offset: int = 0,
+                  batch_rows: int = COLUMNAR_BATCH_ROWS) -> Iterator[str]:
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_rows))
+        if not batch:
+            return
+        yield _dumps({'offset': offset,
+                      'columns': {column: [row.get(column) for row in batch] for column in columns}}) + '\n'
+        offset += len(batch)
+
+
+def stream_export(rows: Iterable[Dict], columns: Sequence[str], fmt: str, offset: int,
+                  filename: str) -> Response:
+    """
+    Build a streaming export response
+
+    Args:
+        rows: Row dicts starting at ``offset`` (consumed lazily)
+        columns: Column order
+        fmt: csv, ndjson or columnar
+        offset: Rows skipped by the source
+        filename: Download name without extension
+    """
+    mimetype, extension = FORMATS[fmt]
+    if fmt == 'csv':
+        body = iter_csv(rows, columns, header=offset == 0)
+    elif fmt == 'ndjson':
+        body = iter_ndjson(rows, columns)
+    else:
+        body = iter_columnar(rows, columns, offset)
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    response.headers['X-Export-Offset'] = str(offset)
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _check_utf8(path: str):
+    """Decode the whole file once so a streamed export cannot fail half way"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(CHECK_BYTES), b''):
+                decoder.decode(block)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        raise ValueError('file is not UTF-8 encoded text')
+
+
+def csv_file_rows(path: str, offset: int = 0):
+    """
+    Read the header of a CSV file and return ``(columns, rows)``
+
+    ``rows`` is a lazy iterator of dicts starting after ``offset`` data rows;
+    the file is only opened again once it is iterated.
+
+    Raises:
+        ValueError: The file is not UTF-8 text or its header is not valid CSV
+    """
+    _check_utf8(path)
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        try:
+            columns = next(csv.reader(f), [])
+        except csv.Error as e:
+            raise ValueError(f'invalid CSV header: {e}')
+
+    def rows():
+        # 文件已校验；导出期间被改写时以替换字符代替非法字节，不中断响应
+        with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for values in islice(reader, offset, None):
+                yield dict(zip(columns, values))
+
+    return columns, rows()
+
+
+def flatten(value, prefix: str = '') -> Iterator[Dict]:
+    """Flatten nested analysis results into ``{'key': 'a.b', 'value': v}`` rows"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, f'{prefix}.{key}' if prefix else str(key))
+    elif isinstance(value, list) and value and all(isinstance(item, (dict, list)) for item in value):
+        for index, item in enumerate(value):
+            yield from flatten(item, f'{prefix}[{index}]')
+    else:
+        yield {'key': prefix, 'value': value}
+
+
+def parse_export_args(args) -> Tuple[str, int]:
+    """Return ``(fmt, offset)`` from request args or raise ValueError"""
+    fmt = args.get('format', 'csv')
+    if fmt not in FORMATS:
+        raise ValueError(f'format must be one of {", ".join(FORMATS)}')
+    try:
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        raise ValueError('offset must be an integer')
+    if offset < 0:
+        raise ValueError('offset must not be negative')
+    return fmt, offset
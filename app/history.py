@@ -0,0 +1,201 @@
+"""
+预测历史记录
+Write-behind prediction history backed by SQLite.
+
+``record`` only appends a tuple to a bounded in-memory queue, so the
+request path pays microseconds. A background writer drains the queue and
+inserts rows in batches inside a single transaction on a WAL-mode
+database, updating the cohort rollups (see ``app.rollups``) in the same
+transaction. When the queue is full new records are dropped and counted
+rather than blocking requests. Pending rows are flushed on shutdown.
+
+The writer thread is started lazily in the process that records the
+first prediction, which keeps the store safe to create before gunicorn
+forks its workers.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+from app import rollups
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    disease_id TEXT NOT NULL,
+    risk_score REAL NOT NULL,
+    risk_level TEXT NOT NULL,
+    factors TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_disease_created ON predictions (disease_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_predictions_created ON predictions (created_at);
+""" + rollups.ROLLUP_SCHEMA
+
+INSERT_SQL = """
+INSERT INTO predictions (disease_id, risk_score, risk_level, factors, created_at)
+VALUES (?, ?, ?, ?, ?)
+"""
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open the history database in WAL mode, creating the schema if needed"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class PredictionHistory:
+    """Bounded write-behind queue in front of the SQLite history table"""
+
+    def __init__(self, path: str, max_queue: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 0.5):
+        self.path = path
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _ensure_writer(self) -> queue.Queue:
+        # fork之后子进程中没有写线程，需要为当前进程重新创建队列和线程
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self.max_queue)
+                    self._thread = threading.Thread(target=self._writer, name='history-writer', daemon=True)
+                    self._thread.start()
+                    self._pid = os.getpid()
+                    atexit.register(self.close)
+        return self._queue
+
+    def record(self, disease_id: str, factors: Dict, risk_score: float, risk_level: str) -> bool:
+        """
+        Queue one prediction for persistence
+
+        Returns:
+            False if the queue was full and the record was dropped
+        """
+        try:
+            self._ensure_writer().put_nowait((disease_id, float(risk_score), risk_level, factors, time.time()))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self):
+        """Block until every queued record has been written"""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """Flush pending records and stop the writer thread"""
+        if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _writer(self):
+        connection = connect(self.path)
+        # 汇总表是后加的，已有历史数据时先回填
+        if (connection.execute('SELECT 1 FROM prediction_rollups LIMIT 1').fetchone() is None
+                and connection.execute('SELECT 1 FROM predictions LIMIT 1').fetchone() is not None):
+            rollups.rebuild(connection)
+        batch_queue = self._queue
+        stopping = False
+        while not stopping:
+            try:
+                item = batch_queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            while True:
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if stopping or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = batch_queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(connection, batch)
+            except sqlite3.Error:
+                logger.exception('Failed to write %d prediction history records', len(batch))
+            finally:
+                for _ in range(len(batch) + (1 if stopping else 0)):
+                    batch_queue.task_done()
+        connection.close()
+
+    def _write_batch(self, connection: sqlite3.Connection, batch: List):
+        if not batch:
+            return
+        rows = [(disease_id, score, level, json.dumps(factors, separators=(',', ':')), created_at)
+                for disease_id, score, level, factors, created_at in batch]
+        with connection:
+            connection.executemany(INSERT_SQL, rows)
+            rollups.upsert(connection, batch)
+        self.written += len(rows)
+
+    def _reader(self) -> sqlite3.Connection:
+        """Per-thread read connection, reopened after fork"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._local.connection = connect(self.path)
+            self._local.pid = os.getpid()
+        return connection
+
+    def rollup(self, disease_id: Optional[str] = None, start_day: Optional[str] = None,
+               end_day: Optional[str] = None,
+               group_by: Sequence[str] = ('disease_id', 'risk_level')) -> List[Dict]:
+        """Query the cohort rollups; see ``app.rollups.query``"""
+        return rollups.query(self._reader(), disease_id, start_day, end_day, group_by)
+
+    def recent(self, disease_id: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """Return the most recent persisted predictions, newest first"""
+        sql = 'SELECT id, disease_id, risk_score, risk_level, factors, created_at FROM predictions'
+        params = []
+        if disease_id:
+            sql += ' WHERE disease_id = ?'
+            params.append(disease_id)
+        sql += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit)
+        return [
+            {'id': row[0], 'disease_id': row[1], 'risk_score': row[2], 'risk_level': row[3],
+             'factors': json.loads(row[4]), 'created_at': row[5]}
+            for row in self._reader().execute(sql, params)
+        ]
+
+
+def init_app(app) -> PredictionHistory:
+    """Create the history store configured by ``HISTORY_DB_PATH``"""
+    history = PredictionHistory(
+        app.config['HISTORY_DB_PATH'],
+        max_queue=app.config.get('HISTORY_MAX_QUEUE', 10000),
+        batch_size=app.config.get('HISTORY_BATCH_SIZE', 500)
+    )
+    app.extensions['history'] = history
+    return history
@@ -0,0 +1,250 @@
+"""
+医学影像预览金字塔
+Multi-resolution preview pyramid for imaging volumes.
+
+Ingestion runs once per volume. The volume is hashed (sha256 of the file
+bytes), and if that digest is already stored nothing else happens. Otherwise
+the volume is windowed to 8 bits and split into slice ranges; a process
+pool builds, for each range, every pyramid level (2x2 mean pooling per
+level) and a PNG thumbnail per slice. Workers write straight into the
+``.npy`` level files, which the parent pre-allocates. Objects are stored
+content-addressed::
+
+    objects/ab/<digest>/manifest.json
+    objects/ab/<digest>/level_<n>.npy   slices x height x width, uint8
+    objects/ab/<digest>/thumbs/<i>.png
+
+Serving opens a level with ``np.load(mmap_mode='r')`` and reads only the
+requested slice. Encoded PNGs are kept in a small LRU cache and are
+immutable, so responses can be cached by clients forever.
+
+Volumes are ``.npy`` arrays: 2-D for projection images (X-ray) or 3-D
+(slices x height x width) for CT/MRI/ultrasound series.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+THUMBNAIL_SIZE = 128
+# 最粗一级的最长边不小于此值
+MIN_LEVEL_SIZE = 64
+SLICES_PER_TASK = 16
+MAX_CACHED_PNGS = 512
+
+
+class ImagingError(ValueError):
+    """Unreadable volume or unknown object"""
+
+
+def file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def level_shapes(height: int, width: int):
+    """In-plane shape of each pyramid level, full resolution first"""
+    shapes = [(height, width)]
+    while max(shapes[-1]) // 2 >= MIN_LEVEL_SIZE and min(shapes[-1]) >= 2:
+        h, w = shapes[-1]
+        shapes.append((h // 2, w // 2))
+    return shapes
+
+
+def _downsample(image):
+    """2x2 mean pooling (odd trailing row/column dropped)"""
+    import numpy as np
+
+    h, w = image.shape[0] // 2 * 2, image.shape[1] // 2 * 2
+    return image[:h, :w].astype(np.float32).reshape(h // 2, 2, w // 2, 2).mean(axis=(1, 3))
+
+
+def _build_slices(source: str, target: str, start: int, stop: int, window, shapes):
+    """Worker: window, downsample and thumbnail slices ``[start, stop)``"""
+    import numpy as np
+    from PIL import Image
+
+    volume = np.load(source, mmap_mode='r')
+    if volume.ndim == 2:
+        volume = volume[None]
+    low, high = window
+    scale = 255.0 / (high - low) if high > low else 0.0
+    levels = [np.load(os.path.join(target, f'level_{n}.npy'), mmap_mode='r+') for n in range(len(shapes))]
+    for index in range(start, stop):
+        image = np.clip((np.asarray(volume[index], dtype=np.float32) - low) * scale, 0, 255)
+        for n, (level, (h, w)) in enumerate(zip(levels, shapes)):
+            if n:
+                image = _downsample(image)
+            level[index] = image[:h, :w].round().astype(np.uint8)
+        thumbnail = Image.fromarray(levels[-1][index])
+        thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        thumbnail.save(os.path.join(target, 'thumbs', f'{index}.png'), optimize=True)
+    for level in levels:
+        level.flush()
+    return stop - start
+
+
+class ImagingStore:
+    """Content-addressed store of preview pyramids"""
+
+    def __init__(self, root: str, workers: Optional[int] = None):
+        self.root = root
+        self.workers = workers
+        self._pngs: 'OrderedDict[tuple, bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, digest: str) -> str:
+        if len(digest) != 64 or any(c not in '0123456789abcdef' for c in digest):
+            raise ImagingError('invalid digest')
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def manifest(self, digest: str) -> Dict:
+        try:
+            with open(os.path.join(self.path(digest), 'manifest.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ImagingError('unknown image')
+
+    def ingest(self, source: str, modality: str = '') -> Dict:
+        """
+        Build the pyramid for a ``.npy`` volume unless it is already stored
+
+        Returns:
+            The object manifest (including its ``digest``)
+        """
+        import numpy as np
+
+        digest = file_digest(source)
+        target = self.path(digest)
+        if os.path.exists(os.path.join(target, 'manifest.json')):
+            return self.manifest(digest)
+
+        try:
+            volume = np.load(source, mmap_mode='r')
+        except (ValueError, OSError):
+            raise ImagingError('source must be a .npy array')
+        if volume.ndim not in (2, 3) or volume.dtype.kind not in 'uif' or 0 in volume.shape:
+            raise ImagingError('volume must be a 2-D or 3-D numeric array')
+        n_slices = 1 if volume.ndim == 2 else volume.shape[0]
+        height, width = volume.shape[-2:]
+
+        # 取约1%-99%分位作为显示窗口，按步长抽样避免读入整个体数据
+        step = max(1, n_slices // 32)
+        sample = np.asarray(volume[::step] if volume.ndim == 3 else volume, dtype=np.float32)
+        sample = sample[np.isfinite(sample)]
+        low, high = (np.percentile(sample, [1, 99]).tolist() if sample.size else (0.0, 0.0))
+        shapes = level_shapes(height, width)
+
+        # 每次导入使用独立的暂存目录，并发导入同一内容时互不覆盖
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f'{digest}.', suffix='.tmp', dir=os.path.dirname(target))
+        try:
+            os.chmod(staging, 0o755)
+            os.makedirs(os.path.join(staging, 'thumbs'))
+            for n, (h, w) in enumerate(shapes):
+                np.lib.format.open_memmap(os.path.join(staging, f'level_{n}.npy'), mode='w+',
+                                          dtype=np.uint8, shape=(n_slices, h, w)).flush()
+            del volume
+
+            ranges = [(start, min(start + SLICES_PER_TASK, n_slices))
+                      for start in range(0, n_slices, SLICES_PER_TASK)]
+            if len(ranges) == 1:
+                _build_slices(source, staging, 0, n_slices, (low, high), shapes)
+            else:
+                import multiprocessing
+                # 使用spawn，避免从多线程的服务进程fork
+                with ProcessPoolExecutor(max_workers=self.workers,
+                                         mp_context=multiprocessing.get_context('spawn')) as pool:
+                    futures = [pool.submit(_build_slices, source, staging, start, stop, (low, high), shapes)
+                               for start, stop in ranges]
+                    for future in futures:
+                        future.result()
+
+            manifest = {
+                'digest': digest,
+                'modality': modality,
+                'slices': n_slices,
+                'window': [low, high],
+                'levels': [{'level': n, 'height': h, 'width': w} for n, (h, w) in enumerate(shapes)]
+            }
+            with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f)
+            try:
+                os.replace(staging, target)
+            except OSError:
+                # 另一个导入已写入同一内容
+                shutil.rmtree(staging, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return manifest
+
+    def slice_png(self, digest: str, level: int, index: int) -> bytes:
+        """PNG of one slice at one level, reading only that slice from disk"""
+        key = (digest, level, index)
+        with self._lock:
+            png = self._pngs.get(key)
+            if png is not None:
+                self._pngs.move_to_end(key)
+                return png
+
+        import numpy as np
+        from PIL import Image
+
+        manifest = self.manifest(digest)
+        if not 0 <= level < len(manifest['levels']) or not 0 <= index < manifest['slices']:
+            raise ImagingError('level or slice out of range')
+        pixels = np.load(os.path.join(self.path(digest), f'level_{level}.npy'), mmap_mode='r')[index]
+        buffer = io.BytesIO()
+        Image.fromarray(np.ascontiguousarray(pixels)).save(buffer, format='PNG')
+        png = buffer.getvalue()
+
+        with self._lock:
+            self._pngs[key] = png
+            if len(self._pngs) > MAX_CACHED_PNGS:
+                self._pngs.popitem(last=False)
+        return png
+
+    def thumbnail_path(self, digest: str, index: int) -> str:
+        path = os.path.join(self.path(digest), 'thumbs', f'{int(index)}.png')
+        if not os.path.exists(path):
+            raise ImagingError('unknown thumbnail')
+        return path
+
+
+def init_app(app) -> ImagingStore:
+    """Create the preview store configured by ``IMAGING_DATA_DIR``"""
+    store = ImagingStore(app.config['IMAGING_DATA_DIR'], app.config.get('IMAGING_WORKERS'))
+    app.extensions['imaging'] = store
+    return store
+
+
+def main(argv=None):
+    """python -m app.imaging VOLUME.npy [...] 预先构建预览金字塔"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m app.imaging', description='Build imaging preview pyramids')
+    parser.add_argument('volumes', nargs='+', help='.npy volumes to ingest')
+    parser.add_argument('--root', default=os.environ.get('IMAGING_DATA_DIR', os.path.join('data', 'imaging')))
+    parser.add_argument('--modality', default='')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    store = ImagingStore(args.root, args.workers)
+    for volume in args.volumes:
+        manifest = store.ingest(volume, args.modality)
+        print(f"{manifest['digest']}  {volume}  {manifest['slices']} slices, {len(manifest['levels'])} levels")
+
+
+if __name__ == '__main__':
+    main()
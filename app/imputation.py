@@ -0,0 +1,314 @@
+"""
+缺失数据填充
+Missing-value imputation for prediction inputs.
+
+Missing fields are filled with population statistics instead of being
+scored as 0. For every ``risk_factors`` field the statistics are a table of
+conditional values indexed by age band (the rollup bands) and gender: the
+mean for numeric fields and the mode for select fields. The last row and
+column of each table are the marginals, used when the row's age or gender
+is itself unknown, so imputing a whole batch is a single fancy-index lookup
+per field::
+
+    table[band, gender]     band: 0..4, 5 = any    gender: 0, 1, 2 = any
+
+Cells backed by fewer than ``MIN_CELL_COUNT`` reference rows fall back to
+``[band, any]``, then ``[any, gender]``, then ``[any, any]``. Fields with no
+reference data are left missing, so the rule-based scorers apply their own
+defaults exactly as they did before imputation existed. Trained models need
+every feature; ``complete_columns`` fills what is still missing with the
+schema default (the first option of a select field, or the midpoint of a
+numeric field's range), the same way in training and in serving.
+
+Statistics are fitted once from a reference cohort CSV and stored as JSON::
+
+    python -m app.imputation cohort.csv --disease diabetes
+
+NumPy is only imported when a batch is imputed or statistics are fitted.
+"""
+
+import json
+import math
+import os
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from app.rollups import AGE_BANDS
+
+if TYPE_CHECKING:
+    import numpy as np
+
+STATS_VERSION = 1
+MIN_CELL_COUNT = 20
+# 年龄段上界（最后一段无上界）
+BAND_UPPERS = [upper for upper, _ in AGE_BANDS[:-1]]
+N_BANDS = len(AGE_BANDS)
+ANY_BAND = N_BANDS
+ANY_GENDER = 2
+
+
+def age_band_index(age: Optional[float]) -> int:
+    if age is None:
+        return ANY_BAND
+    for index, upper in enumerate(BAND_UPPERS):
+        if age < upper:
+            return index
+    return N_BANDS - 1
+
+
+def _schema_default(factor: Dict) -> float:
+    if factor.get('type') == 'select':
+        options = factor.get('options') or [{'value': 0}]
+        return float(options[0]['value'])
+    low, high = factor.get('min'), factor.get('max')
+    if low is None or high is None:
+        return float(low if low is not None else high if high is not None else 0)
+    return (float(low) + float(high)) / 2
+
+
+def _python_value(value: float):
+    return int(value) if float(value).is_integer() else float(value)
+
+
+class Imputer:
+    """Conditional imputation tables for every disease schema"""
+
+    def __init__(self, disease_models: Dict, stats: Optional[Dict] = None):
+        self.fields = {disease_id: model.get('risk_factors', []) for disease_id, model in disease_models.items()}
+        # disease_id -> {'rows': n, 'fields': {field: table}}
+        self.stats: Dict[str, Dict] = dict((stats or {}).get('diseases', {}))
+        self._arrays: Dict[str, Dict[str, 'np.ndarray']] = {}
+
+    def table(self, disease_id: str, field: str) -> Optional[List[List[float]]]:
+        """Fitted table of a field, or None when there was no reference data for it"""
+        return self.stats.get(disease_id, {}).get('fields', {}).get(field)
+
+    def impute(self, disease_id: str, factors: Mapping) -> Tuple[Dict, List[str]]:
+        """
+        Fill the missing fields of one validated factor mapping
+
+        Returns:
+            ``(factors, imputed_fields)``
+        """
+        band = age_band_index(factors.get('age'))
+        gender = factors.get('gender')
+        gender = int(gender) if gender in (0, 1) else ANY_GENDER
+        completed = dict(factors)
+        imputed = []
+        for field, table in self._fitted(disease_id):
+            if field not in completed:
+                completed[field] = _python_value(table[band][gender])
+                imputed.append(field)
+        return completed, imputed
+
+    def _fitted(self, disease_id: str) -> List[Tuple[str, List[List[float]]]]:
+        tables = [(factor['id'], self.table(disease_id, factor['id'])) for factor in self.fields[disease_id]]
+        return [(field, table) for field, table in tables if table is not None]
+
+    def _tables(self, disease_id: str) -> Dict[str, 'np.ndarray']:
+        arrays = self._arrays.get(disease_id)
+        if arrays is None:
+            import numpy as np
+            arrays = {field: np.array(table, dtype=np.float64) for field, table in self._fitted(disease_id)}
+            self._arrays[disease_id] = arrays
+        return arrays
+
+    def impute_columns(self, disease_id: str, values: Dict[str, 'np.ndarray']) -> Dict[str, 'np.ndarray']:
+        """
+        Fill NaNs in float64 columns in place
+
+        Age band and gender are taken from the observed values only, so the
+        result does not depend on the order fields are imputed in. Fields
+        without fitted statistics keep their NaNs.
+
+        Returns:
+            Field -> boolean mask of the rows that were imputed
+        """
+        import numpy as np
+
+        n_rows = len(next(iter(values.values()))) if values else 0
+        bands, genders = self._strata(values, n_rows)
+        masks = {}
+        for field, table in self._tables(disease_id).items():
+            column = values.get(field)
+            if column is None:
+                column = values[field] = np.full(n_rows, np.nan)
+            missing = np.isnan(column)
+            if missing.any():
+                column[missing] = table[bands[missing], genders[missing]]
+            masks[field] = missing
+        return masks
+
+    def complete_columns(self, disease_id: str, values: Dict[str, 'np.ndarray'],
+                         n_rows: Optional[int] = None) -> Dict[str, 'np.ndarray']:
+        """
+        Impute, then fill the remaining NaNs with schema defaults
+
+        For model feature matrices, which cannot hold missing values. The
+        rule-based scorers use ``impute_columns`` and their own defaults.
+        """
+        import numpy as np
+
+        if n_rows is None:
+            n_rows = len(next(iter(values.values()))) if values else 0
+        for factor in self.fields[disease_id]:
+            values.setdefault(factor['id'], np.full(n_rows, np.nan))
+        self.impute_columns(disease_id, values)
+        for factor in self.fields[disease_id]:
+            column = values[factor['id']]
+            column[np.isnan(column)] = _schema_default(factor)
+        return values
+
+    @staticmethod
+    def _strata(values: Dict[str, 'np.ndarray'], n_rows: int) -> Tuple['np.ndarray', 'np.ndarray']:
+        import numpy as np
+
+        age = values.get('age')
+        if age is None:
+            bands = np.full(n_rows, ANY_BAND, dtype=np.intp)
+        else:
+            bands = np.searchsorted(np.array(BAND_UPPERS, dtype=np.float64), age, side='right')
+            bands[np.isnan(age)] = ANY_BAND
+        gender = values.get('gender')
+        if gender is None:
+            genders = np.full(n_rows, ANY_GENDER, dtype=np.intp)
+        else:
+            genders = np.where((gender == 0) | (gender == 1), np.nan_to_num(gender), ANY_GENDER).astype(np.intp)
+        return bands, genders
+
+    def fit(self, disease_id: str, values: Dict[str, 'np.ndarray']) -> Dict:
+        """
+        Compute the conditional tables of one disease from a reference cohort
+
+        Args:
+            values: Validated float64 columns (NaN for missing)
+
+        Returns:
+            The fitted statistics for ``disease_id``
+        """
+        import numpy as np
+
+        n_rows = len(next(iter(values.values()))) if values else 0
+        bands, genders = self._strata(values, n_rows)
+        cells = bands * 3 + genders
+        n_cells = (N_BANDS + 1) * 3
+        fields = {}
+        for factor in self.fields[disease_id]:
+            column = values.get(factor['id'])
+            if column is None:
+                continue
+            observed = ~np.isnan(column)
+            if not observed.any():
+                continue
+            if factor.get('type') == 'select':
+                options = np.array(sorted({float(o['value']) for o in factor.get('options', [])}))
+                codes = np.searchsorted(options, column[observed])
+                counts = np.bincount(cells[observed] * len(options) + codes,
+                                     minlength=n_cells * len(options)).reshape(N_BANDS + 1, 3, len(options))
+                counts = _marginals(counts)
+                table = options[counts.argmax(axis=2)]
+                support = counts.sum(axis=2)
+            else:
+                support = _marginals(np.bincount(cells[observed], minlength=n_cells).reshape(N_BANDS + 1, 3))
+                sums = _marginals(np.bincount(cells[observed], weights=column[observed],
+                                              minlength=n_cells).reshape(N_BANDS + 1, 3))
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    table = sums / support
+            fields[factor['id']] = _fallback(table, support).round(4).tolist()
+
+        self.stats[disease_id] = {'rows': n_rows, 'fields': fields}
+        self._arrays.pop(disease_id, None)
+        return self.stats[disease_id]
+
+    def to_json(self) -> Dict:
+        return {'version': STATS_VERSION, 'age_bands': BAND_UPPERS, 'diseases': self.stats}
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.to_json(), f)
+        os.replace(tmp, path)
+
+
+def _marginals(counts: 'np.ndarray') -> 'np.ndarray':
+    """Turn the unknown-band/unknown-gender slots into band/gender/overall totals"""
+    totals = counts.copy()
+    totals[:, ANY_GENDER] = counts.sum(axis=1)
+    totals[ANY_BAND] = totals.sum(axis=0)
+    return totals
+
+
+def _fallback(table: 'np.ndarray', support: 'np.ndarray') -> 'np.ndarray':
+    """Replace sparse cells by the band, gender and overall marginals in turn"""
+    import numpy as np
+
+    table = table.astype(np.float64)
+    sparse = support < MIN_CELL_COUNT
+    for band in range(N_BANDS + 1):
+        for gender in range(3):
+            if not sparse[band, gender]:
+                continue
+            for b, g in ((band, ANY_GENDER), (ANY_BAND, gender), (ANY_BAND, ANY_GENDER)):
+                if not sparse[b, g]:
+                    table[band, gender] = table[b, g]
+                    break
+            else:
+                # 参考数据过少时仍优于模式默认值
+                table[band, gender] = table[ANY_BAND, ANY_GENDER]
+    return table
+
+
+def load(path: str, disease_models: Dict) -> Imputer:
+    stats = None
+    if os.path.exists(path):
+        with open(path) as f:
+            stats = json.load(f)
+        if stats.get('version') != STATS_VERSION or stats.get('age_bands') != BAND_UPPERS:
+            stats = None
+    return Imputer(disease_models, stats)
+
+
+def init_app(app, disease_models: Dict) -> Imputer:
+    """Load the statistics configured by ``IMPUTATION_STATS_PATH``"""
+    imputer = load(app.config['IMPUTATION_STATS_PATH'], disease_models)
+    app.extensions['imputation'] = imputer
+    return imputer
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """python -m app.imputation COHORT.csv --disease ID 由参考人群计算填充统计量"""
+    import argparse
+
+    from app.exports import csv_file_rows
+    from app.validation import build_validators
+    from run import DISEASE_MODELS
+
+    parser = argparse.ArgumentParser(prog='python -m app.imputation',
+                                     description='Fit imputation statistics from a reference cohort CSV')
+    parser.add_argument('cohort', help='CSV file with one column per risk factor')
+    parser.add_argument('--disease', required=True, choices=sorted(DISEASE_MODELS))
+    parser.add_argument('--output', default=os.environ.get('IMPUTATION_STATS_PATH',
+                                                          os.path.join('data', 'imputation.json')))
+    args = parser.parse_args(argv)
+
+    validator = build_validators(DISEASE_MODELS)[args.disease]
+    columns, rows = csv_file_rows(args.cohort)
+    raw = {field: [] for field in validator.fields if field in columns}
+    n_rows = 0
+    for row in rows:
+        for field, column in raw.items():
+            column.append(row[field])
+        n_rows += 1
+    # 超出范围或无法解析的值按缺失处理
+    batch = validator.validate_columns(raw, n_rows)
+
+    imputer = load(args.output, DISEASE_MODELS)
+    fitted = imputer.fit(args.disease, batch.values)
+    imputer.save(args.output)
+    print(f"{args.disease}: {fitted['rows']} rows, fields {', '.join(fitted['fields']) or '-'} -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+请求计时与指标
+Per-request timing middleware, ``Server-Timing`` headers and a Prometheus
+``/metrics`` endpoint.
+
+Views mark their phases with ``stage('score')`` blocks; every request then
+gets a ``Server-Timing`` header with one entry per stage plus the total,
+and the durations are folded into per-route histograms. Metrics are kept
+per process, so under gunicorn each worker reports its own counters.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from flask import Response, g, request
+
+# 延迟直方图的桶上界（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 未匹配到路由的请求统一归为一个标签，避免标签基数无限增长
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # 最后一个位置对应 +Inf 桶
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return result
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels) -> str:
+    return ','.join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+
+
+class MetricsRegistry:
+    """Thread-safe store of request counters and latency histograms"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests: Dict[Tuple[str, str, int], int] = {}
+        self._durations: Dict[Tuple[str, str], Histogram] = {}
+        self._stages: Dict[Tuple[str, str], Histogram] = {}
+
+    def record(self, method: str, route: str, status: int, duration: float,
+               stages: List[Tuple[str, float]]):
+        with self._lock:
+            key = (method, route, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+            histogram = self._durations.get((method, route))
+            if histogram is None:
+                histogram = self._durations[(method, route)] = Histogram(self.buckets)
+            histogram.observe(duration)
+
+            for name, seconds in stages:
+                histogram = self._stages.get((route, name))
+                if histogram is None:
+                    histogram = self._stages[(route, name)] = Histogram(self.buckets)
+                histogram.observe(seconds)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                '# HELP http_requests_total Total number of HTTP requests.',
+                '# TYPE http_requests_total counter'
+            ]
+            for (method, route, status), count in sorted(self._requests.items()):
+                lines.append(f'http_requests_total{{{_labels(method=method, route=route, status=status)}}} {count}')
+
+            lines.append('# HELP http_request_duration_seconds HTTP request latency.')
+            lines.append('# TYPE http_request_duration_seconds histogram')
+            for (method, route), histogram in sorted(self._durations.items()):
+                self._render_histogram(lines, 'http_request_duration_seconds', histogram,
+                                       method=method, route=route)
+
+            lines.append('# HELP http_request_stage_duration_seconds Time spent in each request stage.')
+            lines.append('# TYPE http_request_stage_duration_seconds histogram')
+            for (route, name), histogram in sorted(self._stages.items()):
+                self._render_histogram(lines, 'http_request_stage_duration_seconds', histogram,
+                                       route=route, stage=name)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histogram(lines: List[str], metric: str, histogram: Histogram, **labels):
+        base = _labels(**labels)
+        for bound, count in histogram.cumulative():
+            lines.append(f'{metric}_bucket{{{base},le="{bound}"}} {count}')
+        lines.append(f'{metric}_sum{{{base}}} {histogram.sum:.6f}')
+        lines.append(f'{metric}_count{{{base}}} {histogram.count}')
+
+
+@contextmanager
+def stage(name: str):
+    """Time a named phase of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        g.setdefault('stage_timings', []).append((name, time.perf_counter() - start))
+
+
+def _server_timing(stages: List[Tuple[str, float]], total: float) -> str:
+    entries = [f'{name};dur={seconds * 1000:.3f}' for name, seconds in stages]
+    entries.append(f'total;dur={total * 1000:.3f}')
+    return ', '.join(entries)
+
+
+def init_app(app, registry: MetricsRegistry = None) -> MetricsRegistry:
+    """
+    Install timing hooks and the ``/metrics`` endpoint on a Flask app
+
+    Returns:
+        The registry collecting this app's metrics
+    """
+    registry = registry or MetricsRegistry()
+
+    @app.before_request
+    def _start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def _record_timing(response):
+        start = g.get('request_start')
+        if start is None:
+            return response
+        total = time.perf_counter() - start
+        stages = g.get('stage_timings', [])
+        response.headers['Server-Timing'] = _server_timing(stages, total)
+        route = request.url_rule.rule if request.url_rule is not None else UNMATCHED_ROUTE
+        registry.record(request.method, route, response.status_code, total, stages)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus指标接口"""
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    app.extensions['metrics'] = registry
+    return registry
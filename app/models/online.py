@@ -0,0 +1,225 @@
+"""
+在线更新
+Incremental model updates from streamed labelled outcomes.
+
+Each mini-batch of labelled patients refreshes the current published model
+of a disease instead of retraining it from scratch:
+
+* scikit-learn models whose final step has ``partial_fit`` (``sgd_logistic``
+  from the training pipeline) take one ``partial_fit`` pass; a leading
+  scaler keeps the statistics it was trained with
+* Panda models (``estimator == 'panda'``, breast cancer only) take one
+  ``PandaAlgorithm.partial_fit`` gradient step on their feature weights
+
+The update copies the current version, applies the batch and publishes the
+result as a new version through ``ModelRegistry`` under the registry's
+per-disease lock, so concurrent updaters never lose each other's batches.
+Updates start from a trained base model (``python -m app.models.training
+--estimator sgd_logistic``). Only the CLI can start a new model from the
+stream itself (``--estimator``), and only from a first batch of at least
+``MIN_BASE_ROWS`` rows with ``MIN_BASE_CLASS_ROWS`` cases of each outcome.
+Serving picks the new version up through ``ModelCache`` without blocking
+requests. The batch Brier score before the update is recorded too, which is
+a running estimate of how the model does on unseen data.
+
+    python -m app.models.online outcomes.csv --disease diabetes --batch-rows 1000
+"""
+
+import copy
+import os
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from app.models.registry import score
+from app.models.training import ESTIMATORS, TrainingError, build_estimator
+
+ONLINE_ESTIMATORS = ('sgd_logistic', 'panda')
+# Panda模型只对乳腺癌的风险因子建模
+PANDA_DISEASES = ('breast_cancer',)
+KEEP_VERSIONS = 10
+# 从数据流新建模型时第一批数据的最少行数及每类结局的最少例数
+MIN_BASE_ROWS = 200
+MIN_BASE_CLASS_ROWS = 20
+
+
+class OnlineError(TrainingError):
+    """Model or batch that cannot be updated incrementally"""
+
+
+def supports_partial_fit(model) -> bool:
+    final = model.steps[-1][1] if hasattr(model, 'steps') else model
+    return hasattr(final, 'partial_fit')
+
+
+def partial_fit(model, X: np.ndarray, y: np.ndarray):
+    """``partial_fit`` the final step of a model, transforming through the fitted earlier steps"""
+    if hasattr(model, 'steps'):
+        for _, step in model.steps[:-1]:
+            X = step.transform(X)
+        model = model.steps[-1][1]
+    model.partial_fit(X, y, classes=np.array([0, 1]))
+
+
+def _brier(scores: np.ndarray, labels: np.ndarray) -> float:
+    return round(float(np.mean((scores / 100 - labels) ** 2)), 6)
+
+
+class OnlineUpdater:
+    """Applies labelled mini-batches to one disease's published model"""
+
+    def __init__(self, registry, disease_id: str, validator, imputer, estimator: Optional[str] = None,
+                 learning_rate: float = 0.05, keep_versions: int = KEEP_VERSIONS, seed: int = 0):
+        """
+        Args:
+            registry: ``ModelRegistry`` to read from and publish to
+            validator: ``FactorValidator`` of the disease
+            imputer: ``Imputer`` used by serving
+            estimator: Model to start from when nothing is published yet;
+                None requires a published base model
+            learning_rate: Step size of Panda weight updates
+            keep_versions: Versions kept after each publish
+        """
+        if estimator is not None and estimator not in ONLINE_ESTIMATORS:
+            raise OnlineError(f'{estimator} cannot be trained incrementally')
+        if estimator == 'panda' and disease_id not in PANDA_DISEASES:
+            raise OnlineError(f'panda models only cover {", ".join(PANDA_DISEASES)}')
+        self.registry = registry
+        self.disease_id = disease_id
+        self.validator = validator
+        self.imputer = imputer
+        self.estimator = estimator
+        self.learning_rate = learning_rate
+        self.keep_versions = keep_versions
+        self.seed = seed
+        # (version, model, metadata) of the last version seen
+        self._latest = None
+
+    def _current(self):
+        version = self.registry.current_version(self.disease_id)
+        if version is None:
+            return None
+        if self._latest is None or self._latest[0] != version:
+            model, metadata = self.registry.load(self.disease_id, version)
+            self._latest = (version, model, metadata)
+        return self._latest
+
+    def _new_model(self, X: np.ndarray, labels: np.ndarray):
+        if self.estimator is None:
+            raise OnlineError(f'no {self.disease_id} model is published; train a base model first')
+        counts = np.bincount(labels.astype(int), minlength=2)
+        if labels.size < MIN_BASE_ROWS or counts.min() < MIN_BASE_CLASS_ROWS:
+            raise OnlineError(f'a new model needs a first batch of at least {MIN_BASE_ROWS} rows with '
+                              f'{MIN_BASE_CLASS_ROWS} cases of each outcome, got {counts[0]} negative '
+                              f'and {counts[1]} positive')
+        features = list(self.validator.fields)
+        if self.estimator == 'panda':
+            from algorithms.panda_algorithm import PandaAlgorithm
+            model = PandaAlgorithm(federated_mode=False, privacy_level='low')
+            params = {'learning_rate': self.learning_rate}
+        else:
+            model = build_estimator(self.estimator, seed=self.seed)
+            # 标准化参数取自第一批数据，之后保持不变
+            for _, step in model.steps[:-1]:
+                X = step.fit_transform(X)
+            params = dict(ESTIMATORS[self.estimator])
+        return model, {'estimator': self.estimator, 'params': params, 'features': features}
+
+    def update(self, values: Dict[str, np.ndarray], labels: Sequence) -> Dict:
+        """
+        Apply one mini-batch and publish the updated model
+
+        Args:
+            values: Validated float64 columns (NaN for missing); completed in place
+            labels: 0/1 outcome per row
+
+        Returns:
+            Metadata of the published version
+
+        Raises:
+            OnlineError: Empty batch, no published model to start from, or a
+                current model without incremental updates
+        """
+        labels = np.asarray(labels, dtype=np.float64)
+        if not labels.size:
+            raise OnlineError('empty batch')
+        self.imputer.complete_columns(self.disease_id, values, labels.size)
+
+        with self.registry.lock(self.disease_id):
+            current = self._current()
+            if current is None:
+                base_version, online = None, {}
+                X = np.column_stack([values[field] for field in self.validator.fields])
+                model, metadata = self._new_model(X, labels)
+                before = None
+            else:
+                base_version, model, metadata = current
+                estimator = metadata.get('estimator')
+                if estimator != 'panda' and not supports_partial_fit(model):
+                    raise OnlineError(f'{estimator} models cannot be updated incrementally; retrain them')
+                model = copy.deepcopy(model)
+                online = dict(metadata.get('online') or {})
+                before = _brier(score(model, metadata, values), labels)
+
+            features = metadata['features']
+            if metadata['estimator'] == 'panda':
+                patients = [{field: float(values[field][i]) for field in features} for i in range(labels.size)]
+                model.partial_fit(patients, labels, self.learning_rate)
+            else:
+                partial_fit(model, np.column_stack([values[field] for field in features]), labels.astype(int))
+            after = _brier(score(model, metadata, values), labels)
+
+            online.update({
+                'base_version': base_version,
+                'updates': online.get('updates', 0) + 1,
+                'rows_seen': online.get('rows_seen', 0) + int(labels.size),
+                'positives_seen': online.get('positives_seen', 0) + int(labels.sum()),
+                'last_batch': {'rows': int(labels.size), 'brier_before': before, 'brier_after': after}
+            })
+            document = {key: value for key, value in metadata.items()
+                        if key not in ('disease_id', 'version', 'published_at')}
+            document['online'] = online
+            version = self.registry.publish(self.disease_id, model, document)
+            self.registry.prune(self.disease_id, self.keep_versions)
+            self._latest = (version, model, self.registry.metadata(self.disease_id, version))
+        return self._latest[2]
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """python -m app.models.online OUTCOMES.csv --disease ID 按小批量增量更新模型"""
+    import argparse
+
+    from app.evaluation import LabelledCsv
+    from app.imputation import load
+    from app.models.registry import ModelRegistry
+    from app.validation import build_validators
+    from run import DISEASE_MODELS
+
+    parser = argparse.ArgumentParser(prog='python -m app.models.online',
+                                     description='Update a published model from labelled mini-batches')
+    parser.add_argument('outcomes', help='CSV with one column per risk factor and an outcome column')
+    parser.add_argument('--disease', required=True, choices=sorted(DISEASE_MODELS))
+    parser.add_argument('--batch-rows', type=int, default=1000)
+    parser.add_argument('--estimator', default=None, choices=ONLINE_ESTIMATORS,
+                        help='Start a new model from the first batch when nothing is published yet')
+    parser.add_argument('--learning-rate', type=float, default=0.05)
+    parser.add_argument('--outcome-column', default=None)
+    parser.add_argument('--model-dir', default=os.environ.get('MODEL_DIR', os.path.join('data', 'models')))
+    parser.add_argument('--imputation-stats', default=os.environ.get('IMPUTATION_STATS_PATH',
+                                                                    os.path.join('data', 'imputation.json')))
+    args = parser.parse_args(argv)
+
+    validator = build_validators(DISEASE_MODELS)[args.disease]
+    imputer = load(args.imputation_stats, DISEASE_MODELS)
+    updater = OnlineUpdater(ModelRegistry(args.model_dir), args.disease, validator, imputer, args.estimator,
+                            args.learning_rate)
+    for values, labels in LabelledCsv(args.outcomes, args.disease, validator, imputer, args.outcome_column,
+                                      args.batch_rows):
+        metadata = updater.update(values, labels)
+        batch = metadata['online']['last_batch']
+        print(f"{args.disease} v{metadata['version']}: {batch['rows']} rows, "
+              f"Brier {batch['brier_before']} -> {batch['brier_after']}")
+
+
+if __name__ == '__main__':
+    main()
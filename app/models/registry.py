@@ -0,0 +1,219 @@
+"""
+模型注册表
+Versioned, atomically published model artifacts.
+
+Each disease has a directory of immutable versions and a ``CURRENT``
+pointer::
+
+    MODEL_DIR/diabetes/CURRENT          "3"
+    MODEL_DIR/diabetes/v3/model.joblib
+    MODEL_DIR/diabetes/v3/metadata.json
+
+A version is written to a staging directory and renamed into place, and
+the pointer is replaced with ``os.replace``, so a reader sees either the
+previous version or the complete new one, never a partial artifact.
+joblib is only imported when a model is saved or loaded.
+
+``ModelCache`` serves the current versions: it re-reads a disease's pointer
+at most once per ``check_interval`` seconds and loads a new version beside
+the old one before swapping it in, so requests are never blocked on, or
+fail during, a publish.
+"""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+_DISEASE_RE = re.compile(r'^[a-z0-9_]+$')
+_VERSION_RE = re.compile(r'^v([0-9]+)$')
+MODEL_FILE = 'model.joblib'
+METADATA_FILE = 'metadata.json'
+
+
+class ModelRegistry:
+    """Directory of published model versions per disease"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, disease_id: str, version: Optional[int] = None) -> str:
+        if not _DISEASE_RE.match(disease_id or ''):
+            raise KeyError(disease_id)
+        directory = os.path.join(self.root, disease_id)
+        return directory if version is None else os.path.join(directory, f'v{int(version)}')
+
+    def versions(self, disease_id: str) -> List[int]:
+        try:
+            names = os.listdir(self.path(disease_id))
+        except FileNotFoundError:
+            return []
+        return sorted(int(m.group(1)) for m in map(_VERSION_RE.match, names) if m)
+
+    def current_version(self, disease_id: str) -> Optional[int]:
+        try:
+            with open(os.path.join(self.path(disease_id), 'CURRENT')) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def publish(self, disease_id: str, model: Any, metadata: Dict) -> int:
+        """
+        Store a new version and make it current
+
+        Returns:
+            The new version number
+        """
+        import joblib
+
+        directory = self.path(disease_id)
+        os.makedirs(directory, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=directory)
+        try:
+            joblib.dump(model, os.path.join(staging, MODEL_FILE))
+            while True:
+                version = max(self.versions(disease_id), default=0) + 1
+                document = dict(metadata, disease_id=disease_id, version=version,
+                                published_at=datetime.now().isoformat())
+                with open(os.path.join(staging, METADATA_FILE), 'w', encoding='utf-8') as f:
+                    json.dump(document, f, ensure_ascii=False, indent=2)
+                try:
+                    os.rename(staging, self.path(disease_id, version))
+                    break
+                except OSError:
+                    # 另一个进程已发布同一版本号，取下一个
+                    if not os.path.isdir(self.path(disease_id, version)):
+                        raise
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        pointer = os.path.join(directory, f'CURRENT.{os.getpid()}.tmp')
+        with open(pointer, 'w') as f:
+            f.write(str(version))
+        os.replace(pointer, os.path.join(directory, 'CURRENT'))
+        return version
+
+    @contextmanager
+    def lock(self, disease_id: str):
+        """Exclusive lock across processes, held while a version is derived from the current one"""
+        import fcntl
+
+        directory = self.path(disease_id)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def prune(self, disease_id: str, keep: int) -> List[int]:
+        """Delete all but the newest ``keep`` versions (never the current one)"""
+        current = self.current_version(disease_id)
+        versions = self.versions(disease_id)
+        removed = [v for v in versions[:-keep] if v != current] if keep > 0 else []
+        for version in removed:
+            shutil.rmtree(self.path(disease_id, version), ignore_errors=True)
+        return removed
+
+    def metadata(self, disease_id: str, version: Optional[int] = None) -> Dict:
+        version = self.current_version(disease_id) if version is None else version
+        if version is None:
+            raise KeyError(disease_id)
+        try:
+            with open(os.path.join(self.path(disease_id, version), METADATA_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(f'{disease_id} v{version}')
+
+    def load(self, disease_id: str, version: Optional[int] = None) -> Tuple[Any, Dict]:
+        """Return ``(model, metadata)`` of a version, the current one by default"""
+        import joblib
+
+        metadata = self.metadata(disease_id, version)
+        model = joblib.load(os.path.join(self.path(disease_id, metadata['version']), MODEL_FILE))
+        return model, metadata
+
+    def catalog(self) -> Dict[str, Dict]:
+        """Metadata of the current version of every disease"""
+        catalog = {}
+        if os.path.isdir(self.root):
+            for disease_id in sorted(os.listdir(self.root)):
+                if _DISEASE_RE.match(disease_id) and self.current_version(disease_id) is not None:
+                    catalog[disease_id] = self.metadata(disease_id)
+        return catalog
+
+
+def score(model: Any, metadata: Dict, columns: Mapping[str, 'np.ndarray']) -> 'np.ndarray':
+    """
+    Risk scores (0-100) of a published model for imputed float64 columns
+
+    scikit-learn models are scored on ``metadata['features']`` in order; Panda
+    weights (``estimator == 'panda'``) on the patient rows.
+    """
+    import numpy as np
+
+    features = metadata['features']
+    n_rows = len(next(iter(columns.values()))) if columns else 0
+    if metadata.get('estimator') == 'panda':
+        patients = [{field: float(columns[field][i]) for field in features if field in columns}
+                    for i in range(n_rows)]
+        return model.predict_scores(patients)
+    X = np.column_stack([columns[field] for field in features]) if features else np.empty((n_rows, 0))
+    return model.predict_proba(X)[:, 1] * 100
+
+
+class ModelCache:
+    """Current model versions for serving, reloaded when a new version is published"""
+
+    def __init__(self, registry: ModelRegistry, check_interval: float = 1.0):
+        self.registry = registry
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # disease_id -> (version, model, metadata)
+        self._models: Dict[str, Tuple[int, Any, Dict]] = {}
+        self._checked: Dict[str, float] = {}
+        self.loads = 0
+
+    def get(self, disease_id: str) -> Optional[Tuple[Any, Dict]]:
+        """``(model, metadata)`` of the current version, or None when nothing is published"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._models.get(disease_id)
+            if now - self._checked.get(disease_id, -self.check_interval) < self.check_interval:
+                return entry[1:] if entry else None
+            self._checked[disease_id] = now
+
+        version = self.registry.current_version(disease_id)
+        if version is None:
+            return entry[1:] if entry else None
+        if entry is None or entry[0] != version:
+            # 在锁外加载新版本，期间其他请求继续使用旧版本
+            try:
+                model, metadata = self.registry.load(disease_id, version)
+            except KeyError:
+                return entry[1:] if entry else None
+            entry = (version, model, metadata)
+            with self._lock:
+                current = self._models.get(disease_id)
+                if current is None or current[0] < version:
+                    self._models[disease_id] = entry
+                    self.loads += 1
+        return entry[1:]
+
+
+def init_app(app) -> ModelRegistry:
+    """Create the registry configured by ``MODEL_DIR``"""
+    registry = ModelRegistry(app.config['MODEL_DIR'])
+    app.extensions['models'] = registry
+    return registry
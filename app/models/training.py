@@ -0,0 +1,341 @@
+"""
+模型训练
+Cross-validated training of per-disease scikit-learn models.
+
+    python -m app.models.training cohort.csv --disease diabetes --disease stroke --folds 5 --workers 8
+
+For each disease the labelled cohort is read through ``LabelledCsv``
+(validation plus the serving imputer, so training sees the same inputs as
+prediction) into a feature matrix in ``risk_factors`` order, and rows are
+assigned to stratified folds. The matrix, labels and fold assignment are
+cached under ``TRAINING_CACHE_DIR``, keyed by the sha256 of the cohort file,
+the disease, the imputation tables and the fold settings, so a re-run with
+another estimator skips parsing entirely::
+
+    TRAINING_CACHE_DIR/<key>/X.npy  y.npy  folds.npy  manifest.json
+
+Every fold fit and the final fit on all rows, for every disease, are
+submitted to one process pool. Workers memory-map the cached arrays instead
+of receiving them pickled. The final model is published through
+``ModelRegistry`` together with the per-fold metrics and their mean and
+standard deviation.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from app.evaluation import LabelledCsv
+
+CACHE_VERSION = 1
+DEFAULT_FOLDS = 5
+
+# 估计器名称 -> 默认超参数
+ESTIMATORS = {
+    'random_forest': {'n_estimators': 200, 'min_samples_leaf': 5},
+    'gradient_boosting': {'max_iter': 200, 'learning_rate': 0.1},
+    'logistic_regression': {'C': 1.0},
+    # 支持 partial_fit，可由 app.models.online 增量更新
+    'sgd_logistic': {'alpha': 0.0001}
+}
+METRICS = ('auc', 'average_precision', 'brier_score', 'log_loss', 'accuracy')
+
+
+class TrainingError(ValueError):
+    """Cohort or settings that cannot be trained on"""
+
+
+def build_estimator(name: str, params: Optional[Dict] = None, seed: int = 0):
+    """Unfitted estimator with the default parameters overridden by ``params``"""
+    if name not in ESTIMATORS:
+        raise TrainingError(f'unknown estimator {name}')
+    params = dict(ESTIMATORS[name], **(params or {}))
+    if name == 'random_forest':
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(random_state=seed, n_jobs=1, **params)
+    if name == 'gradient_boosting':
+        from sklearn.ensemble import HistGradientBoostingClassifier
+        return HistGradientBoostingClassifier(random_state=seed, **params)
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    if name == 'sgd_logistic':
+        from sklearn.linear_model import SGDClassifier
+        return make_pipeline(StandardScaler(), SGDClassifier(loss='log_loss', random_state=seed, **params))
+    from sklearn.linear_model import LogisticRegression
+    return make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000, **params))
+
+
+def fold_metrics(labels: np.ndarray, probabilities: np.ndarray) -> Dict:
+    from sklearn import metrics
+
+    return {
+        'auc': round(float(metrics.roc_auc_score(labels, probabilities)), 4),
+        'average_precision': round(float(metrics.average_precision_score(labels, probabilities)), 4),
+        'brier_score': round(float(metrics.brier_score_loss(labels, probabilities)), 4),
+        'log_loss': round(float(metrics.log_loss(labels, probabilities, labels=[0, 1])), 4),
+        'accuracy': round(float(((probabilities >= 0.5) == labels).mean()), 4)
+    }
+
+
+def summarize(per_fold: Sequence[Dict]) -> Dict:
+    """Mean and standard deviation of each metric over the folds"""
+    return {name: {'mean': round(float(np.mean([fold[name] for fold in per_fold])), 4),
+                   'std': round(float(np.std([fold[name] for fold in per_fold])), 4)}
+            for name in METRICS}
+
+
+def cache_key(cohort_digest: str, disease_id: str, imputer, outcome_column: Optional[str],
+              folds: int, seed: int) -> str:
+    tables = {factor['id']: imputer.table(disease_id, factor['id']) for factor in imputer.fields[disease_id]}
+    material = json.dumps([CACHE_VERSION, cohort_digest, disease_id, outcome_column, folds, seed, tables],
+                          sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def prepare(cohort: str, disease_id: str, validator, imputer, cache_dir: str, folds: int = DEFAULT_FOLDS,
+            seed: int = 0, outcome_column: Optional[str] = None) -> str:
+    """
+    Build (or reuse) the cached feature matrix and fold assignment of a disease
+
+    Returns:
+        Cache directory holding ``X.npy``, ``y.npy``, ``folds.npy`` and ``manifest.json``
+
+    Raises:
+        TrainingError: Too few cases of a class for the number of folds
+    """
+    from app.imaging import file_digest
+
+    digest = file_digest(cohort)
+    path = os.path.join(cache_dir, cache_key(digest, disease_id, imputer, outcome_column, folds, seed))
+    if os.path.exists(os.path.join(path, 'manifest.json')):
+        return path
+
+    from sklearn.model_selection import StratifiedKFold
+
+    reader = LabelledCsv(cohort, disease_id, validator, imputer, outcome_column)
+    features = list(validator.fields)
+    matrices, labels = [], []
+    for values, chunk_labels in reader:
+        imputer.complete_columns(disease_id, values, len(chunk_labels))
+        matrices.append(np.column_stack([values[field] for field in features]))
+        labels.append(chunk_labels.astype(np.int8))
+    X = np.concatenate(matrices) if matrices else np.empty((0, len(features)))
+    y = np.concatenate(labels) if labels else np.empty(0, dtype=np.int8)
+
+    smallest = int(min(np.bincount(y, minlength=2))) if y.size else 0
+    if smallest < folds:
+        raise TrainingError(f'{disease_id}: need at least {folds} positive and negative cases, got {smallest}')
+    assignment = np.empty(len(y), dtype=np.int8)
+    for fold, (_, test) in enumerate(StratifiedKFold(folds, shuffle=True, random_state=seed).split(X, y)):
+        assignment[test] = fold
+
+    manifest = {
+        'disease_id': disease_id,
+        'cohort_sha256': digest,
+        'outcome_column': reader.outcome,
+        'features': features,
+        'observed_features': reader.fields,
+        'rows': int(len(y)),
+        'positives': int(y.sum()),
+        'skipped_rows': reader.skipped_rows,
+        'rows_with_invalid_values': reader.rows_with_invalid_values,
+        'folds': folds,
+        'seed': seed
+    }
+    staging = f'{path}.{os.getpid()}.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    np.save(os.path.join(staging, 'X.npy'), X)
+    np.save(os.path.join(staging, 'y.npy'), y)
+    np.save(os.path.join(staging, 'folds.npy'), assignment)
+    with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    try:
+        os.replace(staging, path)
+    except OSError:
+        # 另一个进程已写入同一缓存
+        shutil.rmtree(staging, ignore_errors=True)
+    return path
+
+
+def load_manifest(path: str) -> Dict:
+    with open(os.path.join(path, 'manifest.json')) as f:
+        return json.load(f)
+
+
+def _init_worker():
+    # 并行度来自进程池，每个进程内的估计器只用单线程
+    os.environ['OMP_NUM_THREADS'] = '1'
+
+
+def fit_fold(path: str, estimator: str, params: Optional[Dict], seed: int, fold: Optional[int],
+             row_fraction: float = 1.0):
+    """
+    Fit on one fold's training rows and score its held-out rows
+
+    ``fold=None`` fits on all rows. ``row_fraction`` < 1 fits on a
+    stratified subsample of the training rows (the held-out rows are
+    unchanged). Runs in pool workers.
+
+    Returns:
+        ``(model, metrics)``; the model is only returned for ``fold=None``
+    """
+    X = np.load(os.path.join(path, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(path, 'y.npy'), mmap_mode='r')
+    train = np.ones(len(y), dtype=bool) if fold is None else np.load(os.path.join(path, 'folds.npy')) != fold
+    test = ~train
+    if row_fraction < 1:
+        # 按类别抽取同一比例，子样本随预算增大而嵌套
+        rng = np.random.default_rng([seed, -1 if fold is None else fold])
+        subsample = np.zeros(len(y), dtype=bool)
+        for label in (0, 1):
+            rows = rng.permutation(np.flatnonzero(train & (y == label)))
+            subsample[rows[:max(1, int(np.ceil(len(rows) * row_fraction)))]] = True
+        train = subsample
+
+    model = build_estimator(estimator, params, seed)
+    start = time.perf_counter()
+    model.fit(X[train], y[train])
+    fit_seconds = round(time.perf_counter() - start, 3)
+    if fold is None:
+        return model, {'fit_seconds': fit_seconds, 'n_train': int(train.sum())}
+
+    probabilities = model.predict_proba(X[test])[:, 1]
+    metrics = fold_metrics(np.asarray(y[test]), probabilities)
+    metrics.update({'fold': fold, 'fit_seconds': fit_seconds, 'n_train': int(train.sum()),
+                    'n_test': int(test.sum())})
+    return None, metrics
+
+
+def make_pool(workers: Optional[int]) -> ProcessPoolExecutor:
+    import multiprocessing
+    # 使用spawn，避免从多线程的服务进程fork
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               mp_context=multiprocessing.get_context('spawn'))
+
+
+def train(cohort: str, disease_ids: Sequence[str], validators: Dict, imputer, registry, cache_dir: str,
+          estimator: str = 'random_forest', params: Optional[Dict] = None, folds: int = DEFAULT_FOLDS,
+          seed: int = 0, workers: Optional[int] = None, outcome_column: Optional[str] = None,
+          metadata: Optional[Dict] = None) -> Dict[str, Dict]:
+    """
+    Cross-validate and publish one model per disease
+
+    Args:
+        cohort: Labelled CSV (see ``LabelledCsv`` for the outcome column)
+        disease_ids: Diseases to train
+        validators: FACTOR_VALIDATORS
+        imputer: ``Imputer`` used by serving
+        registry: ``ModelRegistry`` to publish to
+        cache_dir: Fold cache root
+        workers: Pool size; 1 trains in-process
+        metadata: Extra metadata stored with every published model
+
+    Returns:
+        Disease id -> published metadata
+    """
+    build_estimator(estimator, params)
+    if folds < 2:
+        raise TrainingError('folds must be at least 2')
+    paths = {disease_id: prepare(cohort, disease_id, validators[disease_id], imputer, cache_dir, folds, seed,
+                                 outcome_column)
+             for disease_id in disease_ids}
+    tasks = [(disease_id, fold) for disease_id in disease_ids for fold in [*range(folds), None]]
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = [fit_fold(paths[d], estimator, params, seed, fold) for d, fold in tasks]
+    else:
+        with make_pool(workers) as pool:
+            futures = [pool.submit(fit_fold, paths[d], estimator, params, seed, fold) for d, fold in tasks]
+            results = [future.result() for future in futures]
+    elapsed = round(time.perf_counter() - start, 3)
+
+    published = {}
+    for disease_id in disease_ids:
+        outcomes = [result for (d, _), result in zip(tasks, results) if d == disease_id]
+        per_fold = [metrics for model, metrics in outcomes if model is None]
+        model, final = next((model, metrics) for model, metrics in outcomes if model is not None)
+        manifest = load_manifest(paths[disease_id])
+        document = dict(metadata or {})
+        document.update({
+            'estimator': estimator,
+            'params': dict(ESTIMATORS[estimator], **(params or {})),
+            'features': manifest['features'],
+            'training': {key: manifest[key] for key in ('cohort_sha256', 'outcome_column', 'rows', 'positives',
+                                                        'skipped_rows', 'seed')},
+            'cv': {'folds': folds, 'metrics': summarize(per_fold), 'per_fold': per_fold},
+            'fit_seconds': final['fit_seconds'],
+            'wall_seconds': elapsed
+        })
+        version = registry.publish(disease_id, model, document)
+        published[disease_id] = registry.metadata(disease_id, version)
+    return published
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """python -m app.models.training COHORT.csv --disease ID 交叉验证训练并发布模型"""
+    import argparse
+
+    from app.imputation import load
+    from app.models.registry import ModelRegistry
+    from app.validation import build_validators
+    from run import DISEASE_MODELS
+
+    parser = argparse.ArgumentParser(prog='python -m app.models.training',
+                                     description='Cross-validate and publish per-disease models')
+    parser.add_argument('cohort', help='CSV with one column per risk factor and an outcome column')
+    parser.add_argument('--disease', action='append', choices=sorted(DISEASE_MODELS),
+                        help='Disease to train (repeatable; default all)')
+    parser.add_argument('--estimator', default='random_forest', choices=sorted(ESTIMATORS))
+    parser.add_argument('--params', type=json.loads, default=None, help='JSON estimator parameters')
+    parser.add_argument('--folds', type=int, default=DEFAULT_FOLDS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--outcome-column', default=None)
+    parser.add_argument('--model-dir', default=os.environ.get('MODEL_DIR', os.path.join('data', 'models')))
+    parser.add_argument('--cache-dir', default=os.environ.get('TRAINING_CACHE_DIR',
+                                                             os.path.join('data', 'training_cache')))
+    parser.add_argument('--imputation-stats', default=os.environ.get('IMPUTATION_STATS_PATH',
+                                                                    os.path.join('data', 'imputation.json')))
+    search_args = parser.add_argument_group('hyperparameter search')
+    search_args.add_argument('--search', choices=('halving', 'hyperband'),
+                             help='Search hyperparameters before training (--params are fixed for every candidate)')
+    search_args.add_argument('--space', type=json.loads, default=None, help='JSON search space')
+    search_args.add_argument('--resource', default=None, help='Budget parameter, or "rows"')
+    search_args.add_argument('--min-budget', type=float, default=None)
+    search_args.add_argument('--max-budget', type=float, default=None)
+    search_args.add_argument('--eta', type=int, default=3)
+    search_args.add_argument('--candidates', type=int, default=None, help='Starting candidates (halving)')
+    search_args.add_argument('--checkpoint-dir', default=os.environ.get('TUNING_CHECKPOINT_DIR',
+                                                                       os.path.join('data', 'tuning')))
+    args = parser.parse_args(argv)
+
+    disease_ids = args.disease or sorted(DISEASE_MODELS)
+    validators = build_validators(DISEASE_MODELS)
+    imputer = load(args.imputation_stats, DISEASE_MODELS)
+    registry = ModelRegistry(args.model_dir)
+    if args.search:
+        from app.models.tuning import search_and_train
+        published = search_and_train(args.cohort, disease_ids, validators, imputer, registry, args.cache_dir,
+                                     args.checkpoint_dir, args.estimator, args.search, args.folds, args.seed,
+                                     args.workers, args.outcome_column, space=args.space, resource=args.resource,
+                                     min_budget=args.min_budget, max_budget=args.max_budget, eta=args.eta,
+                                     n_candidates=args.candidates, fixed=args.params)
+    else:
+        published = train(args.cohort, disease_ids, validators, imputer, registry, args.cache_dir,
+                           args.estimator, args.params, args.folds, args.seed, args.workers, args.outcome_column)
+    for disease_id, metadata in published.items():
+        auc = metadata['cv']['metrics']['auc']
+        print(f"{disease_id} v{metadata['version']}: {metadata['training']['rows']} rows, "
+              f"AUC {auc['mean']:.3f} ± {auc['std']:.3f}")
+
+
+if __name__ == '__main__':
+    main()
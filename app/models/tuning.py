@@ -0,0 +1,300 @@
+"""
+超参数搜索
+Successive-halving and Hyperband hyperparameter search.
+
+Many candidate configurations are first cross-validated with a small
+budget; only the best ``1/eta`` of each rung are promoted to a budget
+``eta`` times larger, so most of the compute goes to the few promising
+configurations. The budget is the estimator's size parameter
+(``n_estimators`` of a random forest, ``max_iter`` of gradient boosting)
+or, with ``resource='rows'``, the fraction of training rows.
+
+``method='halving'`` runs one successive-halving bracket. ``hyperband``
+runs several brackets that trade the number of candidates against the
+starting budget, which hedges against configurations that only pay off at
+large budgets.
+
+Candidates are cross-validated on the fold cache built by
+``training.prepare``; every (candidate, fold) fit of a rung is submitted to
+one process pool. Each finished candidate is written to a JSON checkpoint
+(atomically), and results are keyed by parameters and budget, so a resumed
+search, or a later bracket asking for the same evaluation, reuses them
+instead of fitting again.
+"""
+
+import json
+import math
+import os
+from concurrent.futures import as_completed
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.models.training import ESTIMATORS, TrainingError, fit_fold, load_manifest, make_pool, prepare, train
+
+METHODS = ('halving', 'hyperband')
+CHECKPOINT_VERSION = 1
+
+# 以估计器自身规模参数作为预算
+BUDGET_PARAMS = {'random_forest': 'n_estimators', 'gradient_boosting': 'max_iter'}
+DEFAULT_BUDGETS = {'n_estimators': (10, 270), 'max_iter': (10, 270), 'rows': (1 / 27, 1.0)}
+
+# 取值列表为离散选择；{"low", "high", "log", "int"} 为区间采样
+DEFAULT_SPACES = {
+    'random_forest': {
+        'max_depth': [None, 4, 8, 16],
+        'min_samples_leaf': [1, 2, 5, 10, 20],
+        'max_features': ['sqrt', 0.5, 1.0]
+    },
+    'gradient_boosting': {
+        'learning_rate': {'low': 0.01, 'high': 0.3, 'log': True},
+        'max_leaf_nodes': [15, 31, 63],
+        'min_samples_leaf': [10, 20, 50],
+        'l2_regularization': [0.0, 0.1, 1.0]
+    },
+    'logistic_regression': {
+        'C': {'low': 0.001, 'high': 100.0, 'log': True}
+    },
+    'sgd_logistic': {
+        'alpha': {'low': 1e-6, 'high': 0.01, 'log': True}
+    }
+}
+
+
+class SearchError(TrainingError):
+    """Search settings that cannot be run or resumed"""
+
+
+def _python(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def sample_candidates(space: Dict, n: int, rng: np.random.Generator, fixed: Optional[Dict] = None) -> List[Dict]:
+    """Draw up to ``n`` distinct configurations from ``space``"""
+    candidates, seen = [], set()
+    for _ in range(n * 20):
+        params = dict(fixed or {})
+        for name, spec in sorted(space.items()):
+            if isinstance(spec, list):
+                params[name] = _python(spec[rng.integers(len(spec))])
+            elif isinstance(spec, dict) and 'low' in spec and 'high' in spec:
+                low, high = float(spec['low']), float(spec['high'])
+                value = (math.exp(rng.uniform(math.log(low), math.log(high))) if spec.get('log')
+                         else rng.uniform(low, high))
+                params[name] = int(round(value)) if spec.get('int') else float(f'{value:.4g}')
+            else:
+                raise SearchError(f'invalid search space for {name}')
+        key = json.dumps(params, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            candidates.append(params)
+            if len(candidates) == n:
+                break
+    return candidates
+
+
+def rung_budgets(min_budget: float, max_budget: float, eta: int) -> List[float]:
+    """Budgets of one bracket, growing by ``eta`` and ending at ``max_budget``"""
+    if not 0 < min_budget <= max_budget or eta < 2:
+        raise SearchError('need 0 < min_budget <= max_budget and eta >= 2')
+    rungs = int(math.floor(math.log(max_budget / min_budget, eta) + 1e-9)) + 1
+    return [max_budget / eta ** (rungs - 1 - i) for i in range(rungs)]
+
+
+def brackets(method: str, min_budget: float, max_budget: float, eta: int,
+             n_candidates: Optional[int] = None) -> List[List[Tuple[int, float]]]:
+    """
+    ``(candidates, budget)`` of every rung of every bracket
+
+    Hyperband bracket ``s`` starts ``ceil((s_max + 1) / (s + 1) * eta ** s)``
+    candidates at ``max_budget / eta ** s``.
+    """
+    budgets = rung_budgets(min_budget, max_budget, eta)
+    s_max = len(budgets) - 1
+    if method == 'halving':
+        starts = [(n_candidates or eta ** s_max, s_max)]
+    elif method == 'hyperband':
+        starts = [(int(math.ceil((s_max + 1) / (s + 1) * eta ** s)), s) for s in range(s_max, -1, -1)]
+    else:
+        raise SearchError(f'unknown search method {method}')
+    return [[(max(1, n // eta ** i), budgets[s_max - s + i]) for i in range(s + 1)] for n, s in starts]
+
+
+class Checkpoint:
+    """Evaluated (parameters, budget) scores, persisted after every candidate"""
+
+    def __init__(self, path: Optional[str], settings: Dict):
+        self.path = path
+        self.settings = settings
+        self.results: Dict[str, Dict] = {}
+        self.reused = 0
+        if path and os.path.exists(path):
+            with open(path) as f:
+                document = json.load(f)
+            if document.get('version') != CHECKPOINT_VERSION or document.get('settings') != settings:
+                raise SearchError(f'checkpoint {path} was written for different search settings')
+            self.results = document['results']
+
+    @staticmethod
+    def key(params: Dict, budget: float) -> str:
+        return json.dumps([params, round(budget, 6)], sort_keys=True)
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': CHECKPOINT_VERSION, 'settings': self.settings, 'results': self.results}, f)
+        os.replace(tmp, self.path)
+
+
+def search(path: str, estimator: str = 'random_forest', method: str = 'hyperband', space: Optional[Dict] = None,
+           resource: Optional[str] = None, min_budget: Optional[float] = None, max_budget: Optional[float] = None,
+           eta: int = 3, n_candidates: Optional[int] = None, fixed: Optional[Dict] = None, seed: int = 0,
+           workers: Optional[int] = None, checkpoint: Optional[str] = None) -> Dict:
+    """
+    Search hyperparameters on a prepared fold cache
+
+    Args:
+        path: Cache directory returned by ``training.prepare``
+        estimator: ``training.ESTIMATORS`` key
+        method: ``halving`` or ``hyperband``
+        space: Parameter -> choices or range (``DEFAULT_SPACES`` by default)
+        resource: Budget parameter, or ``rows`` for the training-row fraction
+        eta: Promotion ratio between rungs
+        n_candidates: Starting candidates of a ``halving`` bracket
+        fixed: Parameters applied to every candidate
+        workers: Pool size; 1 fits in-process
+        checkpoint: JSON file to resume from and write to
+
+    Returns:
+        ``best_params`` (including the budget parameter), ``best_score``
+        (mean CV AUC), the rung history and evaluation counts
+
+    Raises:
+        SearchError: Invalid settings, or a checkpoint of another search
+    """
+    if estimator not in ESTIMATORS:
+        raise SearchError(f'unknown estimator {estimator}')
+    resource = resource or BUDGET_PARAMS.get(estimator, 'rows')
+    if resource != 'rows' and resource != BUDGET_PARAMS.get(estimator):
+        raise SearchError(f'{estimator} cannot use {resource} as budget')
+    default_min, default_max = DEFAULT_BUDGETS[resource]
+    min_budget = default_min if min_budget is None else min_budget
+    max_budget = default_max if max_budget is None else max_budget
+    if resource == 'rows' and max_budget > 1:
+        raise SearchError('row budgets are fractions of at most 1')
+    space = DEFAULT_SPACES[estimator] if space is None else space
+    plan = brackets(method, min_budget, max_budget, eta, n_candidates)
+
+    manifest = load_manifest(path)
+    settings = {'cache': os.path.basename(os.path.normpath(path)), 'estimator': estimator, 'method': method,
+                'space': space, 'resource': resource, 'budgets': [min_budget, max_budget], 'eta': eta,
+                'n_candidates': n_candidates, 'fixed': fixed or {}, 'seed': seed}
+    state = Checkpoint(checkpoint, settings)
+    rng = np.random.default_rng(seed)
+    folds = range(manifest['folds'])
+    history = []
+
+    def fit_args(params, budget):
+        if resource == 'rows':
+            return params, float(budget)
+        return dict(params, **{resource: int(round(budget))}), 1.0
+
+    pool = None if workers == 1 else make_pool(workers)
+    try:
+        for bracket, rungs in enumerate(plan):
+            candidates = sample_candidates(space, rungs[0][0], rng, fixed)
+            alive = list(range(len(candidates)))
+            for rung, (_, budget) in enumerate(rungs):
+                pending = [i for i in alive if Checkpoint.key(candidates[i], budget) not in state.results]
+                state.reused += len(alive) - len(pending)
+                _evaluate(pool, path, estimator, seed, folds, state,
+                          [(candidates[i], budget) + fit_args(candidates[i], budget) for i in pending])
+
+                scores = {i: state.results[Checkpoint.key(candidates[i], budget)]['score'] for i in alive}
+                ranked = sorted(alive, key=lambda i: (-scores[i], i))
+                history.append({
+                    'bracket': bracket, 'rung': rung, 'budget': round(budget, 6),
+                    'candidates': [{'params': candidates[i], 'score': scores[i]} for i in ranked]
+                })
+                if rung + 1 < len(rungs):
+                    alive = ranked[:rungs[rung + 1][0]]
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    # 只在最大预算上比较，低预算的得分不可比
+    final = [entry for entry in history if entry['budget'] == max(e['budget'] for e in history)]
+    best = max((candidate for entry in final for candidate in entry['candidates']), key=lambda c: c['score'])
+    best_params, _ = fit_args(best['params'], max(e['budget'] for e in history))
+    return {
+        'method': method,
+        'estimator': estimator,
+        'resource': resource,
+        'best_params': best_params,
+        'best_score': best['score'],
+        'evaluations': len(state.results),
+        'reused_evaluations': state.reused,
+        'history': history
+    }
+
+
+def search_and_train(cohort: str, disease_ids: Sequence[str], validators: Dict, imputer, registry, cache_dir: str,
+                     checkpoint_dir: Optional[str], estimator: str = 'random_forest', method: str = 'hyperband',
+                     folds: int = 5, seed: int = 0, workers: Optional[int] = None,
+                     outcome_column: Optional[str] = None, **options) -> Dict[str, Dict]:
+    """
+    Search each disease's hyperparameters, then train and publish the best
+
+    ``options`` are passed to ``search``. Checkpoints are kept per disease
+    in ``checkpoint_dir``, so re-running an interrupted command resumes it.
+
+    Returns:
+        Disease id -> published metadata (with a ``search`` summary)
+    """
+    published = {}
+    for disease_id in disease_ids:
+        path = prepare(cohort, disease_id, validators[disease_id], imputer, cache_dir, folds, seed, outcome_column)
+        checkpoint = (os.path.join(checkpoint_dir, f'{disease_id}_{estimator}_{method}.json')
+                      if checkpoint_dir else None)
+        result = search(path, estimator, method, seed=seed, workers=workers, checkpoint=checkpoint, **options)
+        summary = {key: result[key] for key in ('method', 'resource', 'best_score', 'evaluations',
+                                                'reused_evaluations')}
+        published.update(train(cohort, [disease_id], validators, imputer, registry, cache_dir, estimator,
+                               result['best_params'], folds, seed, workers, outcome_column,
+                               metadata={'search': summary}))
+    return published
+
+
+def _evaluate(pool, path: str, estimator: str, seed: int, folds: Sequence[int], state: Checkpoint,
+              evaluations: List[Tuple[Dict, float, Dict, float]]):
+    """Cross-validate ``(params, budget, fit_params, row_fraction)`` items and checkpoint each"""
+    if not evaluations:
+        return
+    remaining: Dict[int, Dict[int, float]] = {}
+
+    def record(index, metrics):
+        aucs = remaining.setdefault(index, {})
+        aucs[metrics['fold']] = metrics['auc']
+        if len(aucs) == len(folds):
+            params, budget = evaluations[index][:2]
+            del remaining[index]
+            state.results[Checkpoint.key(params, budget)] = {
+                'score': round(float(np.mean(list(aucs.values()))), 4),
+                'fold_auc': [aucs[fold] for fold in folds]
+            }
+            state.save()
+
+    if pool is None:
+        for index, (_, _, fit_params, fraction) in enumerate(evaluations):
+            for fold in folds:
+                record(index, fit_fold(path, estimator, fit_params, seed, fold, fraction)[1])
+        return
+    futures = {pool.submit(fit_fold, path, estimator, fit_params, seed, fold, fraction): index
+               for index, (_, _, fit_params, fraction) in enumerate(evaluations) for fold in folds}
+    for future in as_completed(futures):
+        record(futures[future], future.result()[1])
@@ -0,0 +1,418 @@
+"""
+组学矩阵存储
+Chunked, memory-mapped storage for feature x sample omics matrices.
+
+A matrix lives in its own directory::
+
+    manifest.json        shape, dtype, chunk shape
+    rows.txt / cols.txt  feature ids (gene/protein/metabolite) and sample ids
+    chunks/r{i}_c{j}.npy one chunk_rows x chunk_cols tile per file
+    stats.npz            per-feature summary statistics
+
+Tiles are opened with ``np.load(mmap_mode='r')``, so a read only pages in
+the tiles it touches: a row slice reads one band of tiles, a column slice
+one column of tiles and a sub-matrix only the tiles at the intersection.
+Matrices are written row band by row band and never have to fit in memory.
+Each writer stages into its own hidden temporary directory and publishes
+by renaming it into place (an existing matrix is first renamed aside), and
+``OmicsStore.open`` reopens a matrix whose files were replaced.
+The writer accumulates per-feature summary statistics from each band as it
+is flushed (Chan's parallel variant of Welford's algorithm) and stores them
+with the tiles, so serving them never scans the matrix. Matrices written
+before that get their statistics computed once, tile by tile, on first use.
+
+This module imports numpy at import time; ``run.py`` loads it on first use.
+"""
+
+import errno
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_CHUNK_ROWS = 1024
+DEFAULT_CHUNK_COLS = 256
+# 同时保持打开的内存映射分块数
+MAX_OPEN_TILES = 256
+
+_NAME_RE = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+class OmicsError(ValueError):
+    """Invalid matrix name, shape or id"""
+
+
+def _check_name(name: str) -> str:
+    if not name or not _NAME_RE.match(name) or name.startswith('.'):
+        raise OmicsError(f'invalid name: {name!r}')
+    return name
+
+
+def _read_ids(path: str) -> List[str]:
+    with open(path, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def _write_ids(path: str, ids: Sequence[str]):
+    ids = [str(i) for i in ids]
+    if len(set(ids)) != len(ids):
+        raise OmicsError(f'duplicate ids in {os.path.basename(path)}')
+    if any('\n' in i or not i for i in ids):
+        raise OmicsError('ids must be non-empty single-line strings')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(ids))
+
+
+class _FeatureMoments:
+    """Per-feature count, mean, M2, min and max, merged block by block with Chan's formula"""
+
+    def __init__(self, n_rows: int):
+        self.count = np.zeros(n_rows)
+        self.mean = np.zeros(n_rows)
+        self.m2 = np.zeros(n_rows)
+        self.minimum = np.full(n_rows, np.inf)
+        self.maximum = np.full(n_rows, -np.inf)
+
+    def update(self, row_start: int, block: np.ndarray):
+        """Merge a block of values (any subset of samples) for rows ``row_start:row_start + len(block)``"""
+        values = np.asarray(block, dtype=np.float64)
+        rows = slice(row_start, row_start + len(values))
+        valid = ~np.isnan(values)
+        block_count = valid.sum(axis=1)
+        filled = np.where(valid, values, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            block_mean = np.where(block_count > 0, filled.sum(axis=1) / block_count, 0.0)
+        block_m2 = (np.where(valid, values - block_mean[:, None], 0.0) ** 2).sum(axis=1)
+
+        total = self.count[rows] + block_count
+        delta = block_mean - self.mean[rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(total > 0, block_count / total, 0.0)
+        self.m2[rows] += block_m2 + delta ** 2 * self.count[rows] * weight
+        self.mean[rows] += delta * weight
+        self.count[rows] = total
+        self.minimum[rows] = np.fmin(self.minimum[rows], np.where(valid, values, np.inf).min(axis=1))
+        self.maximum[rows] = np.fmax(self.maximum[rows], np.where(valid, values, -np.inf).max(axis=1))
+
+    def stats(self) -> Dict[str, np.ndarray]:
+        count = self.count
+        empty = count == 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(self.m2 / np.maximum(count - 1, 1))
+        return {
+            'count': count.astype(np.int64),
+            'mean': np.where(empty, np.nan, self.mean),
+            'std': np.where(count > 1, std, np.nan),
+            'min': np.where(empty, np.nan, self.minimum),
+            'max': np.where(empty, np.nan, self.maximum)
+        }
+
+
+def _save_stats(path: str, stats: Dict[str, np.ndarray]):
+    cache = os.path.join(path, 'stats.npz')
+    tmp = f'{cache}.{os.getpid()}.tmp.npz'
+    np.savez(tmp, **stats)
+    os.replace(tmp, cache)
+
+
+class MatrixWriter:
+    """Streams rows into tiles; only one band of chunk_rows rows is held in memory"""
+
+    def __init__(self, path: str, row_ids: Sequence[str], col_ids: Sequence[str],
+                 dtype='float32', chunk_rows: int = DEFAULT_CHUNK_ROWS, chunk_cols: int = DEFAULT_CHUNK_COLS):
+        self.path = path
+        self.shape = (len(row_ids), len(col_ids))
+        self.dtype = np.dtype(dtype)
+        self.chunk_rows = chunk_rows
+        self.chunk_cols = chunk_cols
+        self.rows_written = 0
+        self._band = np.empty((0, self.shape[1]), dtype=self.dtype)
+        self._band_index = 0
+        self._moments = _FeatureMoments(self.shape[0])
+
+        # 每个写入者使用独立的临时目录，close时整体改名，读者不会看到写了一半的矩阵；
+        # 以点开头的目录名不是合法的矩阵名，列表时跳过
+        directory, name = os.path.split(path)
+        os.makedirs(directory, exist_ok=True)
+        self._tmp = tempfile.mkdtemp(prefix=f'.{name}.', suffix='.tmp', dir=directory)
+        os.chmod(self._tmp, 0o755)
+        os.makedirs(os.path.join(self._tmp, 'chunks'))
+        _write_ids(os.path.join(self._tmp, 'rows.txt'), row_ids)
+        _write_ids(os.path.join(self._tmp, 'cols.txt'), col_ids)
+
+    def write_rows(self, block):
+        """Append rows (2-D array-like with one column per sample)"""
+        block = np.asarray(block, dtype=self.dtype)
+        if block.ndim != 2 or block.shape[1] != self.shape[1]:
+            raise OmicsError(f'expected rows with {self.shape[1]} columns')
+        if self.rows_written + len(self._band) + len(block) > self.shape[0]:
+            raise OmicsError(f'matrix has only {self.shape[0]} rows')
+        self._band = np.concatenate([self._band, block]) if len(self._band) else block
+        while len(self._band) >= self.chunk_rows:
+            self._flush_band(self._band[:self.chunk_rows])
+            self._band = self._band[self.chunk_rows:]
+
+    def _flush_band(self, band):
+        for j, start in enumerate(range(0, self.shape[1], self.chunk_cols)):
+            tile = np.ascontiguousarray(band[:, start:start + self.chunk_cols])
+            np.save(os.path.join(self._tmp, 'chunks', f'r{self._band_index}_c{j}.npy'), tile)
+        # 整行都在当前行带中，顺便累计各特征的统计量
+        self._moments.update(self.rows_written, band)
+        self.rows_written += len(band)
+        self._band_index += 1
+
+    def close(self) -> 'OmicsMatrix':
+        if len(self._band):
+            self._flush_band(self._band)
+            self._band = self._band[:0]
+        if self.rows_written != self.shape[0]:
+            raise OmicsError(f'wrote {self.rows_written} of {self.shape[0]} rows')
+        manifest = {
+            'shape': list(self.shape),
+            'dtype': self.dtype.str,
+            'chunk_rows': self.chunk_rows,
+            'chunk_cols': self.chunk_cols
+        }
+        with open(os.path.join(self._tmp, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        _save_stats(self._tmp, self._moments.stats())
+        self._publish()
+        return OmicsMatrix(self.path)
+
+    def _publish(self):
+        """Rename the staged matrix into place, moving any existing version aside first"""
+        directory, name = os.path.split(self.path)
+        replaced = []
+        while True:
+            try:
+                os.replace(self._tmp, self.path)
+                break
+            except OSError as e:
+                if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                    raise
+            # 旧版本先改名到空的临时目录上，再把新版本改名到位；并发写入时后完成者生效
+            aside = tempfile.mkdtemp(prefix=f'.{name}.', suffix='.old', dir=directory)
+            try:
+                os.replace(self.path, aside)
+            except FileNotFoundError:
+                pass
+            replaced.append(aside)
+        for aside in replaced:
+            shutil.rmtree(aside, ignore_errors=True)
+
+
+class OmicsMatrix:
+    """Read-only view of a stored matrix"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        self.shape = tuple(manifest['shape'])
+        self.dtype = np.dtype(manifest['dtype'])
+        self.chunk_rows = manifest['chunk_rows']
+        self.chunk_cols = manifest['chunk_cols']
+        self._row_ids: Optional[List[str]] = None
+        self._col_ids: Optional[List[str]] = None
+        self._row_index: Optional[Dict[str, int]] = None
+        self._col_index: Optional[Dict[str, int]] = None
+        self._tiles: 'OrderedDict[tuple, np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Optional[Dict[str, np.ndarray]] = None
+        self._stats_lock = threading.Lock()
+
+    @property
+    def row_ids(self) -> List[str]:
+        if self._row_ids is None:
+            self._row_ids = _read_ids(os.path.join(self.path, 'rows.txt'))
+        return self._row_ids
+
+    @property
+    def col_ids(self) -> List[str]:
+        if self._col_ids is None:
+            self._col_ids = _read_ids(os.path.join(self.path, 'cols.txt'))
+        return self._col_ids
+
+    def row_positions(self, ids: Sequence[str]) -> np.ndarray:
+        if self._row_index is None:
+            self._row_index = {row_id: i for i, row_id in enumerate(self.row_ids)}
+        return self._positions(ids, self._row_index, 'feature')
+
+    def col_positions(self, ids: Sequence[str]) -> np.ndarray:
+        if self._col_index is None:
+            self._col_index = {col_id: i for i, col_id in enumerate(self.col_ids)}
+        return self._positions(ids, self._col_index, 'sample')
+
+    @staticmethod
+    def _positions(ids, index, kind) -> np.ndarray:
+        missing = [i for i in ids if i not in index]
+        if missing:
+            raise OmicsError(f'unknown {kind} ids: {", ".join(map(str, missing[:10]))}')
+        return np.fromiter((index[i] for i in ids), dtype=np.int64, count=len(ids))
+
+    def _tile(self, band: int, column: int) -> np.ndarray:
+        key = (band, column)
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                return tile
+        tile = np.load(os.path.join(self.path, 'chunks', f'r{band}_c{column}.npy'), mmap_mode='r')
+        with self._lock:
+            self._tiles[key] = tile
+            if len(self._tiles) > MAX_OPEN_TILES:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def take(self, rows: Optional[np.ndarray] = None, cols: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Read a sub-matrix by positions
+
+        Args:
+            rows: Row positions (None for all rows)
+            cols: Column positions (None for all columns)
+
+        Returns:
+            ``len(rows) x len(cols)`` array in the requested order
+        """
+        rows = np.arange(self.shape[0]) if rows is None else np.asarray(rows, dtype=np.int64)
+        cols = np.arange(self.shape[1]) if cols is None else np.asarray(cols, dtype=np.int64)
+        for positions, size in ((rows, self.shape[0]), (cols, self.shape[1])):
+            if len(positions) and (positions.min() < 0 or positions.max() >= size):
+                raise OmicsError('position out of range')
+        out = np.empty((len(rows), len(cols)), dtype=self.dtype)
+        row_bands, col_bands = rows // self.chunk_rows, cols // self.chunk_cols
+        # 只访问请求行列所在的分块
+        for band in np.unique(row_bands):
+            row_mask = row_bands == band
+            local_rows = rows[row_mask] - band * self.chunk_rows
+            for column in np.unique(col_bands):
+                col_mask = col_bands == column
+                tile = self._tile(int(band), int(column))
+                out[np.ix_(row_mask, col_mask)] = tile[np.ix_(local_rows, cols[col_mask] - column * self.chunk_cols)]
+        return out
+
+    def block(self, row_start: int, row_stop: int, col_start: int = 0, col_stop: Optional[int] = None) -> np.ndarray:
+        """Read a contiguous ``[row_start:row_stop, col_start:col_stop]`` block"""
+        col_stop = self.shape[1] if col_stop is None else col_stop
+        row_start, row_stop = max(row_start, 0), min(row_stop, self.shape[0])
+        col_start, col_stop = max(col_start, 0), min(col_stop, self.shape[1])
+        out = np.empty((max(row_stop - row_start, 0), max(col_stop - col_start, 0)), dtype=self.dtype)
+        if not out.size:
+            return out
+        for band in range(row_start // self.chunk_rows, (row_stop - 1) // self.chunk_rows + 1):
+            band_start = band * self.chunk_rows
+            r0, r1 = max(row_start, band_start), min(row_stop, band_start + self.chunk_rows)
+            for column in range(col_start // self.chunk_cols, (col_stop - 1) // self.chunk_cols + 1):
+                column_start = column * self.chunk_cols
+                c0, c1 = max(col_start, column_start), min(col_stop, column_start + self.chunk_cols)
+                tile = self._tile(band, column)
+                out[r0 - row_start:r1 - row_start, c0 - col_start:c1 - col_start] = \
+                    tile[r0 - band_start:r1 - band_start, c0 - column_start:c1 - column_start]
+        return out
+
+    def rows(self, ids: Sequence[str], col_ids: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Feature rows by id (optionally restricted to some samples)"""
+        cols = None if col_ids is None else self.col_positions(col_ids)
+        return self.take(self.row_positions(ids), cols)
+
+    def columns(self, ids: Sequence[str], row_ids: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Sample columns by id, returned as a features x samples matrix"""
+        rows = None if row_ids is None else self.row_positions(row_ids)
+        return self.take(rows, self.col_positions(ids))
+
+    def iter_tiles(self):
+        """Yield ``(row_start, col_start, tile)`` for every tile in storage order"""
+        n_bands = -(-self.shape[0] // self.chunk_rows)
+        n_columns = -(-self.shape[1] // self.chunk_cols)
+        for band in range(n_bands):
+            for column in range(n_columns):
+                yield band * self.chunk_rows, column * self.chunk_cols, self._tile(band, column)
+
+    def feature_stats(self) -> Dict[str, np.ndarray]:
+        """
+        Per-feature count, mean, std, min and max over samples, ignoring NaN
+
+        Read from ``stats.npz``, written by ``MatrixWriter.close``. For a
+        matrix stored without it, one streaming pass over the tiles computes
+        and stores it; concurrent callers wait for that pass instead of
+        repeating it.
+        """
+        with self._stats_lock:
+            if self._stats is None:
+                cache = os.path.join(self.path, 'stats.npz')
+                if not os.path.exists(cache):
+                    moments = _FeatureMoments(self.shape[0])
+                    for row_start, _, tile in self.iter_tiles():
+                        moments.update(row_start, tile)
+                    _save_stats(self.path, moments.stats())
+                with np.load(cache) as stored:
+                    self._stats = {name: stored[name] for name in stored.files}
+            return self._stats
+
+
+class OmicsStore:
+    """Directory of matrices grouped by omics subcategory"""
+
+    def __init__(self, root: str, subcategories: Sequence[str] = ('genomics', 'proteomics', 'metabolomics')):
+        self.root = root
+        self.subcategories = tuple(subcategories)
+        # (subcategory, name) -> (manifest的inode, 矩阵)；矩阵被替换后inode改变
+        self._open: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, subcategory: str, name: str) -> str:
+        if subcategory not in self.subcategories:
+            raise OmicsError(f'unknown subcategory: {subcategory}')
+        return os.path.join(self.root, subcategory, _check_name(name))
+
+    def create(self, subcategory: str, name: str, row_ids: Sequence[str], col_ids: Sequence[str],
+               dtype='float32', chunk_rows: int = DEFAULT_CHUNK_ROWS,
+               chunk_cols: int = DEFAULT_CHUNK_COLS) -> MatrixWriter:
+        """Start writing a matrix; it becomes visible when the writer is closed"""
+        path = self._path(subcategory, name)
+        with self._lock:
+            self._open.pop((subcategory, name), None)
+        return MatrixWriter(path, row_ids, col_ids, dtype, chunk_rows, chunk_cols)
+
+    def open(self, subcategory: str, name: str) -> OmicsMatrix:
+        """Open a matrix, reopening it if it was replaced since it was last opened"""
+        path = self._path(subcategory, name)
+        key = (subcategory, name)
+        with self._lock:
+            cached = self._open.get(key)
+            try:
+                inode = os.stat(os.path.join(path, 'manifest.json')).st_ino
+            except FileNotFoundError:
+                if cached is None:
+                    raise KeyError(name)
+                # 正在替换，新版本改名到位之前继续使用旧版本
+                return cached[1]
+            if cached is None or cached[0] != inode:
+                cached = self._open[key] = (inode, OmicsMatrix(path))
+            return cached[1]
+
+    def list(self, subcategory: str) -> List[Dict]:
+        directory = os.path.join(self.root, subcategory)
+        if subcategory not in self.subcategories or not os.path.isdir(directory):
+            return []
+        matrices = []
+        for name in sorted(os.listdir(directory)):
+            if not name.startswith('.') and os.path.exists(os.path.join(directory, name, 'manifest.json')):
+                matrix = self.open(subcategory, name)
+                matrices.append({'name': name, 'features': matrix.shape[0], 'samples': matrix.shape[1],
+                                 'dtype': matrix.dtype.name})
+        return matrices
+
+
+def init_app(app) -> OmicsStore:
+    """Create the matrix store configured by ``OMICS_DATA_DIR``"""
+    store = OmicsStore(app.config['OMICS_DATA_DIR'])
+    app.extensions['omics'] = store
+    return store
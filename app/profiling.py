@@ -0,0 +1,284 @@
+"""
+按需性能剖析
+On-demand profiling of live requests.
+
+An admin starts a profiling session for one route, limited to the next N
+requests and/or T seconds. In ``sample`` mode a background thread samples
+the stacks of the threads serving matching requests and aggregates them
+into collapsed-stack lines (``frame;frame;frame count``) that flamegraph.pl
+or speedscope read directly. In ``cprofile`` mode each matching request
+runs under cProfile and the merged statistics are returned as text.
+
+While no session is active the only cost per request is one empty-dict
+check. Sessions live in the serving process, so under gunicorn each
+worker profiles the requests it handles.
+
+The admin endpoints are protected by ``app.auth.is_admin``.
+"""
+
+import io
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Optional
+
+from flask import Response, g, jsonify, request
+
+from app.auth import init_app as init_auth, is_admin
+
+SAMPLE = 'sample'
+CPROFILE = 'cprofile'
+
+# 单个会话的上限，防止误操作长时间开启剖析
+MAX_REQUESTS = 10000
+MAX_SECONDS = 600
+# 保留的已结束会话数
+MAX_FINISHED_SESSIONS = 20
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{os.path.basename(code.co_filename)}:{name}'
+
+
+def _collapse(frame) -> str:
+    """Render a frame and its callers as a root-first collapsed stack"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels)
+
+
+class ProfileSession:
+    """One profiling run on a single route"""
+
+    def __init__(self, route: str, mode: str, max_requests: Optional[int],
+                 seconds: Optional[float], interval: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.route = route
+        self.mode = mode
+        self.max_requests = max_requests
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.interval = interval
+        self.started = time.time()
+        self.requests_profiled = 0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self.stats = None
+        self.finished = False
+        self._threads: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def begin_request(self) -> bool:
+        """Claim a slot for the current request; False once the budget is spent"""
+        with self._lock:
+            if self.finished or self.expired():
+                return False
+            if self.max_requests is not None and self.requests_profiled >= self.max_requests:
+                return False
+            self.requests_profiled += 1
+            ident = threading.get_ident()
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+            return True
+
+    def end_request(self, profile=None):
+        with self._lock:
+            ident = threading.get_ident()
+            remaining = self._threads.get(ident, 0) - 1
+            if remaining > 0:
+                self._threads[ident] = remaining
+            else:
+                self._threads.pop(ident, None)
+            if profile is not None:
+                if self.stats is None:
+                    import pstats
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+            budget_spent = self.max_requests is not None and self.requests_profiled >= self.max_requests
+            if (budget_spent or self.expired()) and not self._threads:
+                self.finished = True
+
+    def sample(self):
+        """Record the current stack of every thread serving a matching request"""
+        with self._lock:
+            idents = list(self._threads)
+        if not idents:
+            return
+        frames = sys._current_frames()
+        collapsed = [_collapse(frames[ident]) for ident in idents if ident in frames]
+        with self._lock:
+            for stack in collapsed:
+                self.stacks[stack] += 1
+            self.samples += len(collapsed)
+
+    def summary(self) -> Dict:
+        return {
+            'profile_id': self.id,
+            'route': self.route,
+            'mode': self.mode,
+            'status': 'finished' if self.finished else 'running',
+            'requests_profiled': self.requests_profiled,
+            'max_requests': self.max_requests,
+            'samples': self.samples,
+            'started': self.started
+        }
+
+    def output(self) -> str:
+        with self._lock:
+            if self.mode == SAMPLE:
+                return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+            if self.stats is None:
+                return ''
+            buffer = io.StringIO()
+            self.stats.stream = buffer
+            self.stats.sort_stats('cumulative').print_stats(100)
+            return buffer.getvalue()
+
+
+class Profiler:
+    """Registry of profiling sessions attached to a Flask app"""
+
+    def __init__(self):
+        # 路由规则 -> 正在运行的会话；为空时请求钩子立即返回
+        self.active: Dict[str, ProfileSession] = {}
+        self.sessions: Dict[str, ProfileSession] = {}
+        self._lock = threading.Lock()
+
+    def start(self, route: str, mode: str = SAMPLE, max_requests: Optional[int] = None,
+              seconds: Optional[float] = None, interval: float = 0.005) -> ProfileSession:
+        session = ProfileSession(route, mode, max_requests, seconds, interval)
+        with self._lock:
+            previous = self.active.get(route)
+            if previous is not None:
+                previous.finished = True
+            self.active[route] = session
+            self.sessions[session.id] = session
+            self._prune()
+        if mode == SAMPLE:
+            threading.Thread(target=self._sample_loop, args=(session,),
+                             name=f'profiler-{session.id}', daemon=True).start()
+        return session
+
+    def stop(self, session: ProfileSession):
+        session.finished = True
+        with self._lock:
+            if self.active.get(session.route) is session:
+                del self.active[session.route]
+
+    def _prune(self):
+        finished = [s for s in self.sessions.values() if s.finished]
+        for session in finished[:max(0, len(finished) - MAX_FINISHED_SESSIONS)]:
+            del self.sessions[session.id]
+
+    def _sample_loop(self, session: ProfileSession):
+        while not session.finished:
+            if session.expired() and not session._threads:
+                break
+            session.sample()
+            time.sleep(session.interval)
+        self.stop(session)
+
+    def before_request(self):
+        if not self.active or request.url_rule is None:
+            return
+        session = self.active.get(request.url_rule.rule)
+        if session is None:
+            return
+        if not session.begin_request():
+            if session.finished or session.expired():
+                self.stop(session)
+            return
+        g.profile_session = session
+        if session.mode == CPROFILE:
+            import cProfile
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # 其他剖析工具正在运行（Python 3.12+只允许一个）
+                profile = None
+            g.profile = profile
+
+    def teardown_request(self, exc=None):
+        session = g.pop('profile_session', None)
+        if session is None:
+            return
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile.disable()
+        session.end_request(profile)
+        if session.finished:
+            self.stop(session)
+
+
+def _positive_number(value, cast, limit):
+    if value is None:
+        return None
+    number = cast(value)
+    if number <= 0:
+        raise ValueError
+    return min(number, limit)
+
+
+def init_app(app, profiler: Profiler = None) -> Profiler:
+    """Install the profiling hooks and admin endpoints on a Flask app"""
+    profiler = profiler or Profiler()
+    init_auth(app)
+    app.before_request(profiler.before_request)
+    app.teardown_request(profiler.teardown_request)
+
+    @app.route('/admin/profile', methods=['POST'])
+    def start_profile():
+        """开始剖析指定路由"""
+        if not is_admin():
+            return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'status': 'error', 'message': 'Invalid request data'}), 400
+
+        route = data.get('route')
+        if route not in {rule.rule for rule in app.url_map.iter_rules()}:
+            return jsonify({'status': 'error', 'message': 'Unknown route'}), 400
+        mode = data.get('mode', SAMPLE)
+        if mode not in (SAMPLE, CPROFILE):
+            return jsonify({'status': 'error', 'message': 'mode must be sample or cprofile'}), 400
+        try:
+            max_requests = _positive_number(data.get('requests'), int, MAX_REQUESTS)
+            seconds = _positive_number(data.get('seconds'), float, MAX_SECONDS)
+            interval = _positive_number(data.get('interval_ms', 5), float, 1000) / 1000
+        except (TypeError, ValueError):
+            return jsonify({'status': 'error', 'message': 'requests, seconds and interval_ms must be positive numbers'}), 400
+        if seconds is None:
+            seconds = 30.0 if max_requests is None else float(MAX_SECONDS)
+
+        session = profiler.start(route, mode, max_requests, seconds, interval)
+        return jsonify({'status': 'success', **session.summary()})
+
+    @app.route('/admin/profile/<profile_id>', methods=['GET', 'DELETE'])
+    def profile_result(profile_id):
+        """获取或停止剖析会话；结果为collapsed stack格式文本"""
+        if not is_admin():
+            return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+        session = profiler.sessions.get(profile_id)
+        if session is None:
+            return jsonify({'status': 'error', 'message': 'Profile not found'}), 404
+        if request.method == 'DELETE' or session.expired():
+            profiler.stop(session)
+        response = Response(session.output(), mimetype='text/plain')
+        response.headers['X-Profile-Status'] = 'finished' if session.finished else 'running'
+        response.headers['X-Profile-Requests'] = str(session.requests_profiled)
+        response.headers['X-Profile-Samples'] = str(session.samples)
+        return response
+
+    app.extensions['profiler'] = profiler
+    return profiler
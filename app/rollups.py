@@ -0,0 +1,166 @@
+"""
+预测结果汇总
+Incremental cohort rollups over the prediction history.
+
+Every batch the history writer persists is also folded into
+``prediction_rollups``: one row per disease x day x risk level x age band
+holding the count, score sum, sum of squares and a ten-bin score histogram.
+The rollup is updated in the same transaction as the raw rows, so the two
+never disagree. Dashboard queries only read the rollup table, whose size
+depends on the number of distinct groups rather than on how many
+predictions have been recorded.
+"""
+
+import sqlite3
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence
+
+HISTOGRAM_BINS = 10
+BIN_COLUMNS = [f'bin_{i}' for i in range(HISTOGRAM_BINS)]
+
+# (上界, 标签)，上界不含
+AGE_BANDS = ((30, '18-29'), (45, '30-44'), (60, '45-59'), (75, '60-74'), (float('inf'), '75+'))
+UNKNOWN_AGE = 'unknown'
+
+GROUP_COLUMNS = ('disease_id', 'day', 'risk_level', 'age_band')
+
+ROLLUP_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS prediction_rollups (
+    disease_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    risk_level TEXT NOT NULL,
+    age_band TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    score_sum REAL NOT NULL,
+    score_sq_sum REAL NOT NULL,
+    {', '.join(f'{column} INTEGER NOT NULL DEFAULT 0' for column in BIN_COLUMNS)},
+    PRIMARY KEY (disease_id, day, risk_level, age_band)
+) WITHOUT ROWID;
+"""
+
+UPSERT_SQL = f"""
+INSERT INTO prediction_rollups (disease_id, day, risk_level, age_band, count, score_sum, score_sq_sum,
+                                {', '.join(BIN_COLUMNS)})
+VALUES ({', '.join('?' * (7 + HISTOGRAM_BINS))})
+ON CONFLICT (disease_id, day, risk_level, age_band) DO UPDATE SET
+    count = count + excluded.count,
+    score_sum = score_sum + excluded.score_sum,
+    score_sq_sum = score_sq_sum + excluded.score_sq_sum,
+    {', '.join(f'{column} = {column} + excluded.{column}' for column in BIN_COLUMNS)}
+"""
+
+
+def age_band(age) -> str:
+    if age is None:
+        return UNKNOWN_AGE
+    for upper, label in AGE_BANDS:
+        if age < upper:
+            return label
+    return UNKNOWN_AGE
+
+
+def score_bin(score: float) -> int:
+    return min(max(int(score // (100 / HISTOGRAM_BINS)), 0), HISTOGRAM_BINS - 1)
+
+
+def utc_day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d')
+
+
+def aggregate(records: Iterable) -> List[tuple]:
+    """
+    Pre-aggregate history records into rollup rows
+
+    Args:
+        records: ``(disease_id, risk_score, risk_level, factors, created_at)`` tuples
+
+    Returns:
+        Rows ready for UPSERT_SQL, one per distinct group in the batch
+    """
+    groups: Dict[tuple, list] = defaultdict(lambda: [0, 0.0, 0.0] + [0] * HISTOGRAM_BINS)
+    for disease_id, score, level, factors, created_at in records:
+        group = groups[(disease_id, utc_day(created_at), level, age_band(factors.get('age')))]
+        group[0] += 1
+        group[1] += score
+        group[2] += score * score
+        group[3 + score_bin(score)] += 1
+    return [key + tuple(values) for key, values in groups.items()]
+
+
+def upsert(connection: sqlite3.Connection, records: Sequence):
+    """Fold records into the rollup table (call inside the writer's transaction)"""
+    connection.executemany(UPSERT_SQL, aggregate(records))
+
+
+def rebuild(connection: sqlite3.Connection):
+    """Recompute every rollup from the raw predictions table"""
+    import json
+
+    with connection:
+        connection.execute('DELETE FROM prediction_rollups')
+        cursor = connection.execute(
+            'SELECT disease_id, risk_score, risk_level, factors, created_at FROM predictions')
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            upsert(connection, [(d, s, l, json.loads(f), c) for d, s, l, f, c in rows])
+
+
+def query(connection: sqlite3.Connection, disease_id: Optional[str] = None,
+          start_day: Optional[str] = None, end_day: Optional[str] = None,
+          group_by: Sequence[str] = ('disease_id', 'risk_level')) -> List[Dict]:
+    """
+    Aggregate the rollup table over the requested dimensions
+
+    Args:
+        disease_id: Restrict to one disease
+        start_day, end_day: Inclusive ``YYYY-MM-DD`` bounds
+        group_by: Any of disease_id, day, risk_level, age_band
+
+    Returns:
+        One dict per group with count, mean/std score and the score histogram
+    """
+    invalid = [column for column in group_by if column not in GROUP_COLUMNS]
+    if invalid:
+        raise ValueError(f'cannot group by {", ".join(invalid)}')
+    for value in (start_day, end_day):
+        if value is not None:
+            date.fromisoformat(value)
+
+    conditions, params = [], []
+    if disease_id:
+        conditions.append('disease_id = ?')
+        params.append(disease_id)
+    if start_day:
+        conditions.append('day >= ?')
+        params.append(start_day)
+    if end_day:
+        conditions.append('day <= ?')
+        params.append(end_day)
+
+    columns = list(group_by)
+    select = columns + ['SUM(count)', 'SUM(score_sum)', 'SUM(score_sq_sum)'] + [f'SUM({c})' for c in BIN_COLUMNS]
+    sql = f'SELECT {", ".join(select)} FROM prediction_rollups'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    if columns:
+        sql += f' GROUP BY {", ".join(columns)} ORDER BY {", ".join(columns)}'
+
+    results = []
+    for row in connection.execute(sql, params):
+        count, score_sum, score_sq_sum = row[len(columns):len(columns) + 3]
+        if not count:
+            continue
+        mean = score_sum / count
+        variance = max(score_sq_sum / count - mean * mean, 0.0)
+        result = dict(zip(columns, row))
+        result.update({
+            'count': count,
+            'mean_score': round(mean, 3),
+            'std_score': round(variance ** 0.5, 3),
+            'histogram': list(row[len(columns) + 3:])
+        })
+        results.append(result)
+    return results
@@ -5,6 +5,8 @@ import os
 import json
 from datetime import datetime
 
+from app.validation import build_validators
+
 predict_bp = Blueprint('predict', __name__)
 
 # 疾病预测模型配置
@@ -36,6 +38,9 @@ DISEASE_MODELS = {
     # 可以继续添加其他疾病模型...
 }
 
+# 按疾病预编译的输入校验器
+FACTOR_VALIDATORS = build_validators(DISEASE_MODELS)
+
 def calculate_risk_score(disease_id, factors):
     """计算疾病风险评分"""
     # 这里使用简化的风险计算模型
@@ -167,14 +172,21 @@ def api_predict(disease_id):
             return jsonify({'error': _('Disease not found')}), 404
 
         # 获取请求数据
-        data = request.get_json()
-        if not data:
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data, dict):
             return jsonify({'error': _('Invalid request data')}), 400
 
         factors = data.get('factors', {})
         if not factors:
             return jsonify({'error': _('Missing risk factors')}), 400
 
+        # 按风险因子定义校验输入
+        factors, field_errors = FACTOR_VALIDATORS[disease_id].validate(factors)
+        if field_errors:
+            return jsonify({'error': _('Invalid risk factors'), 'field_errors': field_errors}), 400
+        if not factors:
+            return jsonify({'error': _('Missing risk factors')}), 400
+
         # 计算风险评分
         risk_score = calculate_risk_score(disease_id, factors)
 
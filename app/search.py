@@ -0,0 +1,377 @@
+"""
+医学文本检索
+In-memory inverted index with BM25 ranking for the medical text catalog.
+
+Documents are numbered in insertion order, so every posting list is an
+append-only pair of arrays: doc-number gaps (``array('I')``) and term
+frequencies (``array('H')``). Postings are grouped in blocks (BLOCK_SIZE)
+with the block's last doc number, largest frequency and shortest document
+kept alongside, so a block can be decoded on its own (one vectorised
+cumulative sum from the previous block's last doc) and bounded without
+being decoded.
+
+Ranking is block-max MaxScore over windows of the doc-number space. The
+block bounds give every window an upper bound on the score of any of its
+documents; windows are visited best bound first and the search stops as
+soon as no remaining window can beat the current k-th score. Within a
+window, the terms whose combined bound cannot reach the k-th score are
+non-essential: documents matching only those are never scored, and the
+non-essential lists are decoded only for candidates that can still make
+the top k.
+
+Updating a document re-adds it under a new number and removing one only
+marks it deleted; collection statistics (document count, average length,
+document frequencies) keep counting deleted documents until the index is
+rebuilt, which ``CatalogSearch`` does once they are COMPACT_FRACTION of it.
+
+Tokenization handles mixed Chinese/English text: text is NFKC-normalised
+and lowercased, runs of Latin letters/digits become words and runs of CJK
+characters become overlapping bigrams (a single character stays a unigram).
+"""
+
+import math
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+K1 = 1.2
+B = 0.75
+MAX_TERM_FREQUENCY = 0xFFFF
+BLOCK_SIZE = 128
+WINDOW_SIZE = 1 << 14
+COMPACT_FRACTION = 0.2
+# 界值与得分的浮点误差余量，界值只可偏大
+_SLACK = 1 + 1e-6
+
+_TOKEN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[a-z0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Split mixed Chinese/English text into index terms"""
+    tokens = []
+    for match in _TOKEN_RE.finditer(unicodedata.normalize('NFKC', text or '').lower()):
+        run = match.group()
+        if run[0] <= 'z' or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class _Postings:
+    __slots__ = ('gaps', 'frequencies', 'last', 'max_frequency',
+                 'block_last', 'block_max_frequency', 'block_min_length')
+
+    def __init__(self):
+        self.gaps = array('I')
+        self.frequencies = array('H')
+        self.last = -1
+        self.max_frequency = 0
+        # 每块最后一个文档编号、最大词频和最短文档长度
+        self.block_last = array('I')
+        self.block_max_frequency = array('H')
+        self.block_min_length = array('I')
+
+    def append(self, number: int, count: int, length: int, block_size: int):
+        if len(self.gaps) % block_size == 0:
+            self.block_last.append(number)
+            self.block_max_frequency.append(count)
+            self.block_min_length.append(length)
+        else:
+            self.block_last[-1] = number
+            if count > self.block_max_frequency[-1]:
+                self.block_max_frequency[-1] = count
+            if length < self.block_min_length[-1]:
+                self.block_min_length[-1] = length
+        self.gaps.append(number - self.last)
+        self.frequencies.append(count)
+        self.last = number
+        if count > self.max_frequency:
+            self.max_frequency = count
+
+
+class _QueryTerm:
+    """Snapshot of one query term's posting list taken under the index lock"""
+
+    __slots__ = ('postings', 'idf', 'size', 'block_last', 'block_bounds', 'window_bounds')
+
+    def __init__(self, postings: _Postings, idf: float):
+        import numpy as np
+
+        self.postings = postings
+        self.idf = idf
+        # 之后追加的倒排项不属于本次查询
+        self.size = len(postings.gaps)
+        self.block_last = np.array(postings.block_last, dtype=np.int64)
+        self.block_bounds = None
+        self.window_bounds = None
+
+
+class InvertedIndex:
+    """BM25 index keyed by external integer ids"""
+
+    def __init__(self, k1: float = K1, b: float = B, block_size: int = BLOCK_SIZE, window_size: int = WINDOW_SIZE):
+        self.k1 = k1
+        self.b = b
+        self.block_size = block_size
+        self.window_size = window_size
+        self.postings: Dict[str, _Postings] = {}
+        self.doc_ids = array('q')
+        self.lengths = array('I')
+        # 文档所属分组（如子分类）的编号，用于检索时过滤
+        self.groups = array('B')
+        self.group_codes: Dict[str, int] = {}
+        # 文档编号是否仍有效；删除与更新只清除旧编号
+        self.live = bytearray()
+        self.numbers: Dict[int, int] = {}
+        self.deleted = 0
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.doc_ids) - self.deleted
+
+    def add(self, doc_id: int, text: str, group: str = ''):
+        """Index one document, replacing any earlier version with the same id"""
+        counts = Counter(tokenize(text))
+        length = sum(counts.values())
+        with self._lock:
+            self._remove(doc_id)
+            number = len(self.doc_ids)
+            code = self.group_codes.setdefault(group, len(self.group_codes))
+            self.doc_ids.append(doc_id)
+            self.lengths.append(length)
+            self.groups.append(code)
+            self.live.append(1)
+            self.numbers[doc_id] = number
+            self.total_length += length
+            for term, count in counts.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = _Postings()
+                postings.append(number, min(count, MAX_TERM_FREQUENCY), length, self.block_size)
+
+    def remove(self, doc_id: int) -> bool:
+        """Drop a document from search results; returns whether it was indexed"""
+        with self._lock:
+            return self._remove(doc_id)
+
+    def _remove(self, doc_id: int) -> bool:
+        number = self.numbers.pop(doc_id, None)
+        if number is None:
+            return False
+        self.live[number] = 0
+        self.deleted += 1
+        return True
+
+    def _upper_bound(self, idf: float, max_frequency, min_length, avgdl: float):
+        # tf*(k1+1)/(tf+K) 随tf增大、随文档长度减小，故以最大词频与最短文档求上界
+        norm = self.k1 * (1 - self.b + self.b * min_length / avgdl)
+        return idf * max_frequency * (self.k1 + 1) / (max_frequency + norm)
+
+    def _decode(self, term: _QueryTerm, low: int, high: int):
+        """Doc numbers (relative to ``low``) and frequencies of a term's postings in ``[low, high)``"""
+        import numpy as np
+
+        first = int(np.searchsorted(term.block_last, low))
+        if first == len(term.block_last):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        last = min(int(np.searchsorted(term.block_last, high)), len(term.block_last) - 1)
+        start, end = first * self.block_size, min((last + 1) * self.block_size, term.size)
+        with self._lock:
+            gaps, frequencies = term.postings.gaps[start:end], term.postings.frequencies[start:end]
+        base = int(term.block_last[first - 1]) if first else -1
+        docs = np.cumsum(np.frombuffer(gaps, dtype=np.uint32), dtype=np.int64) + base
+        keep = (docs >= low) & (docs < high)
+        return docs[keep] - low, np.frombuffer(frequencies, dtype=np.uint16)[keep].astype(np.float64)
+
+    def search(self, query: str, k: int = 10, groups: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        Rank documents against a query with BM25
+
+        Args:
+            query: Free text in Chinese and/or English
+            k: Number of results
+            groups: Only return documents added with one of these groups
+
+        Returns:
+            ``[{'id': doc_id, 'score': score}]`` best first
+        """
+        import numpy as np
+
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self.doc_ids)
+            if not terms or n_docs == self.deleted or k <= 0:
+                return []
+            avgdl = self.total_length / n_docs or 1.0
+            allowed = None
+            if groups is not None:
+                codes = [self.group_codes[g] for g in groups if g in self.group_codes]
+                if not codes:
+                    return []
+                if len(codes) < len(self.group_codes):
+                    allowed = np.zeros(len(self.group_codes), dtype=bool)
+                    allowed[codes] = True
+
+            query_terms = []
+            for term in terms:
+                postings = self.postings.get(term)
+                if postings is None:
+                    continue
+                df = len(postings.gaps)
+                query_term = _QueryTerm(postings, math.log(1 + (n_docs - df + 0.5) / (df + 0.5)))
+                query_term.block_bounds = self._upper_bound(
+                    query_term.idf, np.array(postings.block_max_frequency, dtype=np.float64),
+                    np.array(postings.block_min_length, dtype=np.float64), avgdl)
+                query_terms.append(query_term)
+        if not query_terms:
+            return []
+
+        # 每个窗口的上界：与窗口相交的各块上界的最大值，块可能跨越多个窗口
+        n_windows = (n_docs - 1) // self.window_size + 1
+        for term in query_terms:
+            first = np.concatenate(([0], term.block_last[:-1] + 1)) // self.window_size
+            spans = term.block_last // self.window_size - first + 1
+            offsets = np.arange(int(spans.sum())) - np.repeat(np.cumsum(spans) - spans, spans)
+            term.window_bounds = np.zeros(n_windows)
+            np.maximum.at(term.window_bounds, np.repeat(first, spans) + offsets,
+                          np.repeat(term.block_bounds, spans))
+        window_bounds = sum(term.window_bounds for term in query_terms)
+
+        top_numbers = np.empty(0, dtype=np.int64)
+        top_scores = np.empty(0)
+        threshold = 0.0
+        for window in sorted(np.flatnonzero(window_bounds), key=lambda w: -window_bounds[w]):
+            if len(top_scores) == k and window_bounds[window] * _SLACK < threshold:
+                # 窗口按上界降序访问，其余窗口都不可能进入top-k
+                break
+            low = int(window) * self.window_size
+            high = min(low + self.window_size, n_docs)
+            with self._lock:
+                lengths = np.frombuffer(self.lengths[low:high], dtype=np.uint32)
+                live = np.frombuffer(self.live[low:high], dtype=np.uint8).astype(bool)
+                doc_groups = np.frombuffer(self.groups[low:high], dtype=np.uint8)
+            norm = self.k1 * (1 - self.b + self.b * lengths / avgdl)
+            if allowed is not None:
+                live &= allowed[doc_groups]
+
+            # 按窗口上界升序，累计上界不足阈值的前缀为非必要词
+            ordered = sorted((term for term in query_terms if term.window_bounds[window] > 0),
+                             key=lambda term: term.window_bounds[window])
+            optional_bound, split = 0.0, 0
+            for term in ordered:
+                if len(top_scores) < k or (optional_bound + term.window_bounds[window]) * _SLACK >= threshold:
+                    break
+                optional_bound += term.window_bounds[window]
+                split += 1
+
+            scores = np.zeros(high - low)
+            seen = np.zeros(high - low, dtype=bool)
+            for term in ordered[split:]:
+                docs, frequencies = self._decode(term, low, high)
+                scores[docs] += term.idf * frequencies * (self.k1 + 1) / (frequencies + norm[docs])
+                seen[docs] = True
+            candidates = np.flatnonzero(seen & live)
+            for term in reversed(ordered[:split]):
+                candidates = candidates[(scores[candidates] + optional_bound) * _SLACK >= threshold]
+                if not len(candidates):
+                    break
+                optional_bound -= term.window_bounds[window]
+                docs, frequencies = self._decode(term, low, high)
+                keep = np.zeros(high - low, dtype=bool)
+                keep[candidates] = True
+                keep = keep[docs]
+                docs, frequencies = docs[keep], frequencies[keep]
+                scores[docs] += term.idf * frequencies * (self.k1 + 1) / (frequencies + norm[docs])
+            if not len(candidates):
+                continue
+
+            top_numbers = np.concatenate((top_numbers, candidates + low))
+            top_scores = np.concatenate((top_scores, scores[candidates]))
+            if len(top_scores) > k:
+                best = np.lexsort((top_numbers, -top_scores))[:k]
+                top_numbers, top_scores = top_numbers[best], top_scores[best]
+            if len(top_scores) == k:
+                threshold = float(top_scores.min())
+
+        order = np.lexsort((top_numbers, -top_scores))
+        return [{'id': self.doc_ids[int(top_numbers[i])], 'score': round(float(top_scores[i]), 4)} for i in order]
+
+
+def _text(title: str, content: Optional[str]) -> str:
+    return f'{title}\n{content or ""}'
+
+
+class CatalogSearch:
+    """
+    BM25 search over the text records of one catalog category
+
+    The first query indexes the whole category. Later queries first replay
+    the catalog change log: every record inserted, updated or deleted since
+    the last sync is re-read and re-indexed or removed, so each worker also
+    picks up rows written by other workers, including ones with explicit
+    ids. Once deleted documents reach COMPACT_FRACTION of the index it is
+    rebuilt from the catalog.
+    """
+
+    def __init__(self, catalog, category: str = 'medical_text', batch_size: int = 5000):
+        self.catalog = catalog
+        self.category = category
+        self.batch_size = batch_size
+        self.index = InvertedIndex()
+        # 已应用的最后一条目录变更序号；None表示尚未建立索引
+        self.sequence = None
+        self._sync_lock = threading.Lock()
+
+    def sync(self) -> int:
+        """Apply catalog changes since the last sync; returns how many text records were (re)indexed or removed"""
+        with self._sync_lock:
+            if self.sequence is None:
+                return self._rebuild()
+            changed, record_ids = 0, []
+            for sequence, record_id in self.catalog.iter_changes(self.sequence, self.batch_size):
+                record_ids.append(record_id)
+                if len(record_ids) == self.batch_size:
+                    changed += self._apply(record_ids)
+                    self.sequence, record_ids = sequence, []
+            if record_ids:
+                changed += self._apply(record_ids)
+                self.sequence = sequence
+            if self.index.deleted > COMPACT_FRACTION * len(self.index.doc_ids):
+                self._rebuild()
+            return changed
+
+    def _rebuild(self) -> int:
+        # 先记下变更序号再全量扫描；扫描期间的变更在下次同步时重放，重放是幂等的
+        sequence = self.catalog.last_change()
+        index = InvertedIndex(self.index.k1, self.index.b, self.index.block_size, self.index.window_size)
+        for record_id, subcategory, title, content in self.catalog.iter_text(self.category, 0, self.batch_size):
+            index.add(record_id, _text(title, content), subcategory)
+        self.index, self.sequence = index, sequence
+        return len(index)
+
+    def _apply(self, record_ids: List[int]) -> int:
+        record_ids = list(dict.fromkeys(record_ids))
+        rows = self.catalog.text_records(self.category, record_ids)
+        changed = {row[0] for row in rows}
+        for record_id in record_ids:
+            if self.index.remove(record_id):
+                changed.add(record_id)
+        for record_id, subcategory, title, content in rows:
+            self.index.add(record_id, _text(title, content), subcategory)
+        return len(changed)
+
+    def search(self, query: str, k: int = 10, subcategories: Optional[Iterable[str]] = None) -> List[Dict]:
+        self.sync()
+        return self.index.search(query, k, subcategories)
+
+
+def init_app(app, catalog, category: str = 'medical_text') -> CatalogSearch:
+    """Create the text search engine for a catalog category"""
+    engine = CatalogSearch(catalog, category)
+    app.extensions['text_search'] = engine
+    return engine
@@ -0,0 +1,257 @@
+"""
+风险因子输入校验
+Compiled input validators for the ``risk_factors`` schemas in DISEASE_MODELS.
+
+Each disease schema is compiled once into a ``FactorValidator`` holding
+per-field bounds and option sets. ``validate`` is the scalar path used by
+single predictions; ``validate_columns`` checks a whole batch one column at
+a time with NumPy and only builds error objects for the rows that fail.
+NumPy is only imported the first time a batch is validated.
+"""
+
+import math
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# 错误代码
+INVALID_TYPE = 'invalid_type'
+OUT_OF_RANGE = 'out_of_range'
+INVALID_OPTION = 'invalid_option'
+
+
+def _field_error(field: Optional[str], code: str, message: str, value=None) -> Dict:
+    """Build a structured, JSON-serialisable field error"""
+    error = {'field': field, 'code': code, 'message': message}
+    if value is not None:
+        error['value'] = value
+    return error
+
+
+def _is_missing(value) -> bool:
+    """Form submissions send ``null`` or ``""`` for fields left blank"""
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _coerce_number(value) -> Optional[float]:
+    """Convert a raw JSON value to a finite float, or None if impossible"""
+    if isinstance(value, bool):
+        # JSON的true/false不是数值
+        return None
+    if isinstance(value, (int, float)):
+        try:
+            number = float(value)
+        except OverflowError:
+            return None
+    elif isinstance(value, str):
+        try:
+            number = float(value.strip())
+        except ValueError:
+            return None
+    else:
+        return None
+    return number if math.isfinite(number) else None
+
+
+class _FieldSpec:
+    """Compiled form of a single ``risk_factors`` entry"""
+
+    __slots__ = ('id', 'kind', 'min', 'max', 'options', '_option_array')
+
+    def __init__(self, factor: Dict):
+        self.id = factor['id']
+        self.kind = factor.get('type', 'number')
+        self.min = float(factor['min']) if factor.get('min') is not None else -math.inf
+        self.max = float(factor['max']) if factor.get('max') is not None else math.inf
+        if self.kind == 'select':
+            self.options = frozenset(float(option['value']) for option in factor.get('options', []))
+        else:
+            self.options = None
+        self._option_array = None
+
+    @property
+    def option_array(self) -> Optional['np.ndarray']:
+        """Sorted option values for the vectorized path, built on first use"""
+        if self.options is not None and self._option_array is None:
+            import numpy as np
+            self._option_array = np.array(sorted(self.options), dtype=np.float64)
+        return self._option_array
+
+    def check(self, value) -> Tuple[Optional[float], Optional[Dict]]:
+        """Validate one value, returning ``(clean_value, error)``"""
+        number = _coerce_number(value)
+        if number is None:
+            return None, _field_error(self.id, INVALID_TYPE,
+                                      f'{self.id} must be a number', value)
+        return self._check_number(number, value)
+
+    def _check_number(self, number: float, raw) -> Tuple[Optional[float], Optional[Dict]]:
+        if self.options is not None:
+            if number not in self.options:
+                return None, _field_error(self.id, INVALID_OPTION,
+                                          f'{self.id} must be one of {self.allowed()}', raw)
+            return int(number) if number.is_integer() else number, None
+        if number < self.min or number > self.max:
+            return None, _field_error(self.id, OUT_OF_RANGE,
+                                      f'{self.id} must be between {self.min:g} and {self.max:g}', raw)
+        return number, None
+
+    def allowed(self) -> List:
+        return [int(v) if v.is_integer() else v for v in sorted(self.options)]
+
+
+class BatchValidation:
+    """Result of validating a batch column by column"""
+
+    def __init__(self, values: Dict[str, 'np.ndarray'], valid: 'np.ndarray', errors: Dict[int, List[Dict]]):
+        # 每个字段一个float64列，缺失值为NaN
+        self.values = values
+        # 每行是否通过校验
+        self.valid = valid
+        # 行号 -> 该行的字段错误
+        self.errors = errors
+
+    def row(self, index: int) -> Dict:
+        """Return the cleaned factors of one row, omitting missing fields"""
+        factors = {}
+        for field, column in self.values.items():
+            value = column[index]
+            if not math.isnan(value):
+                factors[field] = int(value) if value.is_integer() else float(value)
+        return factors
+
+
+class FactorValidator:
+    """Validator compiled from one disease's ``risk_factors`` schema"""
+
+    def __init__(self, risk_factors: Sequence[Dict]):
+        self.fields = {factor['id']: _FieldSpec(factor) for factor in risk_factors}
+
+    def validate(self, factors) -> Tuple[Dict, List[Dict]]:
+        """
+        Validate a single factor mapping
+
+        Unknown fields are dropped and blank fields are treated as missing.
+
+        Returns:
+            ``(cleaned_factors, errors)``; ``errors`` is empty when valid
+        """
+        if not isinstance(factors, Mapping):
+            return {}, [_field_error(None, INVALID_TYPE, 'factors must be an object')]
+
+        cleaned = {}
+        errors = []
+        for field, value in factors.items():
+            spec = self.fields.get(field)
+            if spec is None or _is_missing(value):
+                continue
+            clean_value, error = spec.check(value)
+            if error is None:
+                cleaned[field] = clean_value
+            else:
+                errors.append(error)
+        return cleaned, errors
+
+    def validate_columns(self, columns: Mapping[str, Sequence], n_rows: int) -> BatchValidation:
+        """
+        Validate a batch given as one sequence of raw values per field
+
+        Args:
+            columns: Field id -> raw values (``None`` for missing)
+            n_rows: Number of rows in the batch
+
+        Returns:
+            BatchValidation with float64 columns and per-row errors
+        """
+        import numpy as np
+
+        valid = np.ones(n_rows, dtype=bool)
+        errors: Dict[int, List[Dict]] = {}
+        values = {}
+
+        for field, spec in self.fields.items():
+            raw = columns.get(field)
+            if raw is None:
+                values[field] = np.full(n_rows, np.nan)
+                continue
+
+            column, type_errors = self._column_to_float(raw, n_rows)
+            for index in type_errors:
+                errors.setdefault(index, []).append(
+                    _field_error(field, INVALID_TYPE, f'{field} must be a number', raw[index]))
+                valid[index] = False
+
+            present = ~np.isnan(column)
+            if spec.option_array is not None:
+                bad = present & ~np.isin(column, spec.option_array)
+                code, message = INVALID_OPTION, f'{field} must be one of {spec.allowed()}'
+            else:
+                bad = present & ((column < spec.min) | (column > spec.max))
+                code, message = OUT_OF_RANGE, f'{field} must be between {spec.min:g} and {spec.max:g}'
+
+            bad_rows = np.flatnonzero(bad)
+            if bad_rows.size:
+                for index in bad_rows.tolist():
+                    errors.setdefault(index, []).append(_field_error(field, code, message, raw[index]))
+                valid[bad_rows] = False
+                column[bad_rows] = np.nan
+            values[field] = column
+
+        return BatchValidation(values, valid, errors)
+
+    @staticmethod
+    def _column_to_float(raw: Sequence, n_rows: int) -> Tuple['np.ndarray', List[int]]:
+        """Convert raw values to float64, falling back to per-item coercion"""
+        import numpy as np
+
+        if len(raw) != n_rows:
+            raise ValueError('column length does not match batch size')
+        # 快速路径只接受JSON数字与null；字符串、布尔值等逐项按单条路径的规则转换
+        if {type(value) for value in raw} <= {int, float, type(None)}:
+            try:
+                column = np.array(raw, dtype=np.float64)
+            except OverflowError:
+                pass
+            else:
+                # 非有限值中只有null是缺失，NaN与无穷大同单条路径一样是非法类型
+                type_errors = [index for index in np.flatnonzero(~np.isfinite(column)).tolist()
+                               if raw[index] is not None]
+                column[type_errors] = np.nan
+                return column, type_errors
+
+        column = np.empty(n_rows, dtype=np.float64)
+        type_errors = []
+        for index, value in enumerate(raw):
+            if _is_missing(value):
+                column[index] = np.nan
+                continue
+            number = _coerce_number(value)
+            if number is None:
+                column[index] = np.nan
+                type_errors.append(index)
+            else:
+                column[index] = number
+        return column, type_errors
+
+
+def records_to_columns(records: Sequence, fields) -> Tuple[Dict[str, List], List[int]]:
+    """
+    Transpose a list of factor dicts into per-field columns
+
+    Returns:
+        ``(columns, bad_rows)`` where ``bad_rows`` are entries that are not objects
+    """
+    bad_rows = [index for index, record in enumerate(records) if not isinstance(record, Mapping)]
+    if bad_rows:
+        records = [record if isinstance(record, Mapping) else {} for record in records]
+    columns = {field: [record.get(field) for record in records] for field in fields}
+    return columns, bad_rows
+
+
+def build_validators(disease_models: Dict) -> Dict[str, FactorValidator]:
+    """Compile one validator per disease in a DISEASE_MODELS mapping"""
+    return {
+        disease_id: FactorValidator(model.get('risk_factors', []))
+        for disease_id, model in disease_models.items()
+    }
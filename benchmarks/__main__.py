@@ -0,0 +1,79 @@
+"""
+运行基准测试
+
+    python -m benchmarks                     运行全部基准并与基线比较
+    python -m benchmarks --save              运行并保存为新基线
+    python -m benchmarks -k scoring -k http  只运行名称包含指定字符串的基准
+
+发现任何基准的p50/p99延迟或ops/sec退化超过阈值时以状态码1退出。
+比较模式下基线文件不存在或缺少某个基准时以状态码2退出，不会静默通过；
+基线与机器相关，需在做比较的同一台机器上用 --save 生成。
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from benchmarks import bench_predict, bench_startup  # noqa: F401  注册基准
+from benchmarks.harness import check_budgets, compare, load_baseline, run_benchmarks, save_baseline
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Run performance benchmarks')
+    parser.add_argument('-k', dest='names', action='append', help='only run benchmarks whose name contains this')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    parser.add_argument('--save', action='store_true', help='save results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=float(os.environ.get('BENCH_THRESHOLD', 0.2)),
+                        help='allowed relative regression of p50 and ops/sec (default 0.2)')
+    parser.add_argument('--p99-threshold', type=float, default=None,
+                        help='allowed relative regression of p99 (default 2x threshold)')
+    parser.add_argument('--samples', type=int, default=50, help='samples per benchmark')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args(argv)
+
+    # 先检查基线，缺少基线时不必运行基准
+    baseline = None if args.save else load_baseline(args.baseline)
+    if not args.save and baseline is None:
+        print(f'error: no baseline at {args.baseline}; run with --save to create one', file=sys.stderr)
+        return 2
+
+    results = run_benchmarks(args.names, samples=args.samples)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print(f"{'benchmark':<42}{'p50 (us)':>12}{'p99 (us)':>12}{'ops/sec':>14}")
+        for name, result in results.items():
+            print(f"{name:<42}{result['p50_us']:>12.2f}{result['p99_us']:>12.2f}{result['ops_per_sec']:>14.1f}")
+
+    violations = check_budgets(results)
+    for v in violations:
+        print(f"\nBudget exceeded: {v['benchmark']} p50 {v['current']:.0f}us > {v['budget']:.0f}us")
+
+    if args.save:
+        save_baseline(results, args.baseline)
+        print(f'\nBaseline saved to {args.baseline}')
+        return 1 if violations else 0
+
+    missing = sorted(set(results) - set(baseline.get('benchmarks', {})))
+    if missing:
+        print(f'\nerror: no baseline for {", ".join(missing)} in {args.baseline}; run with --save to update it',
+              file=sys.stderr)
+        return 2
+
+    regressions = compare(results, baseline, args.threshold, args.p99_threshold)
+    if regressions:
+        print('\nPerformance regressions:')
+        for r in regressions:
+            print(f"  {r['benchmark']} {r['metric']}: {r['baseline']} -> {r['current']} "
+                  f"({r['regression']:+.1%}, threshold {r['threshold']:.0%})")
+        return 1
+    print('\nNo regressions against baseline')
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+预测相关基准测试
+Benchmarks for the scorers, Panda, translation, template rendering and the
+prediction API.
+"""
+
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.harness import benchmark, use_scratch_data_dir
+
+# 基准测试的预测请求不写入 data/ 下的预测历史
+use_scratch_data_dir()
+
+import run
+from algorithms.panda_algorithm import PandaAlgorithm
+
+# 基准测试的请求速率远超单个客户端的限额，关闭准入控制
+run.app.config['ADMISSION_ENABLED'] = False
+
+LUNG_CANCER_FACTORS = {
+    'age': 60, 'gender': 1, 'smoking_years': 30, 'smoking_amount': 20,
+    'family_history': 1, 'occupational_exposure': 1
+}
+DIABETES_FACTORS = {
+    'age': 45, 'bmi': 28.5, 'waist_circumference': 95, 'systolic_bp': 140,
+    'family_history': 1, 'physical_activity': 0
+}
+BREAST_CANCER_FACTORS = {
+    'age': 45, 'gender': 0, 'family_history': 1, 'brca_mutation': 0, 'menstrual_age': 12,
+    'first_birth_age': 28, 'hormone_therapy': 0, 'breast_density': 2
+}
+
+
+@benchmark('scoring.calculate_lung_cancer_risk')
+def bench_lung_cancer():
+    return lambda: run.calculate_lung_cancer_risk(LUNG_CANCER_FACTORS)
+
+
+@benchmark('scoring.calculate_diabetes_risk')
+def bench_diabetes():
+    return lambda: run.calculate_diabetes_risk(DIABETES_FACTORS)
+
+
+@benchmark('scoring.calculate_breast_cancer_risk_panda')
+def bench_breast_cancer():
+    return lambda: run.calculate_breast_cancer_risk_panda(BREAST_CANCER_FACTORS)
+
+
+@benchmark('scoring.calculate_default_risk')
+def bench_default():
+    return lambda: run.calculate_default_risk({'age': 50, 'family_history': 1})
+
+
+@benchmark('scoring.calculate_risk_score')
+def bench_dispatch():
+    return lambda: run.calculate_risk_score('diabetes', DIABETES_FACTORS)
+
+
+@benchmark('panda.calculate_risk_score')
+def bench_panda():
+    panda = PandaAlgorithm(federated_mode=True, privacy_level='high')
+    # 每次计算都会记录INFO日志，基准测试中关闭以免测到日志I/O
+    panda.logger.setLevel(logging.WARNING)
+    return lambda: panda.calculate_risk_score(BREAST_CANCER_FACTORS)
+
+
+@benchmark('i18n.translate_text')
+def bench_translate():
+    context = run.app.test_request_context('/')
+    context.push()
+    from flask import session
+    session['language'] = 'zh'
+    return lambda: run.translate_text('Disease Risk Assessment')
+
+
+@benchmark('template.panda_algorithm')
+def bench_render_panda():
+    context = run.app.test_request_context('/panda')
+    context.push()
+    return lambda: run.render_template('panda_algorithm.html', get_locale=run.get_locale)
+
+
+@benchmark('http.api_predict')
+def bench_api_predict():
+    client = run.app.test_client()
+    body = json.dumps({'factors': DIABETES_FACTORS})
+
+    def call():
+        response = client.post('/api/predict/diabetes', data=body, content_type='application/json')
+        assert response.status_code == 200
+    return call
+
+
+@benchmark('http.api_predict_batch_100')
+def bench_api_predict_batch():
+    client = run.app.test_client()
+    body = json.dumps({'records': [DIABETES_FACTORS] * 100})
+
+    def call():
+        response = client.post('/api/predict/diabetes/batch', data=body, content_type='application/json')
+        assert response.status_code == 200
+    return call
+
+
+@benchmark('imputation.impute_columns_1m', samples=5, budget_ms=2000)
+def bench_impute_columns():
+    import numpy as np
+    from app.imputation import Imputer
+
+    rng = np.random.default_rng(0)
+    n = 1000000
+    source = {'age': rng.uniform(18, 90, n), 'bmi': rng.uniform(18, 40, n), 'family_history': rng.integers(0, 2, n)}
+    source = {field: np.where(rng.random(n) < 0.2, np.nan, column) for field, column in source.items()}
+    imputer = Imputer(run.DISEASE_MODELS)
+    imputer.fit('diabetes', source)
+
+    def call():
+        imputer.impute_columns('diabetes', {field: column.copy() for field, column in source.items()})
+    return call
+
+
+@benchmark('http.api_predict_whatif_10k')
+def bench_api_predict_whatif():
+    client = run.app.test_client()
+    body = json.dumps({'factors': DIABETES_FACTORS, 'grid': {
+        'bmi': None, 'waist_circumference': None, 'systolic_bp': None, 'age': {'delta': list(range(-5, 5))}
+    }})
+
+    def call():
+        response = client.post('/api/predict/diabetes/whatif', data=body, content_type='application/json')
+        assert response.status_code == 200
+    return call
@@ -0,0 +1,41 @@
+"""
+冷启动基准测试
+Cold-start benchmarks: each call starts a fresh interpreter, the way a new
+worker or autoscaled container does.
+"""
+
+import os
+import subprocess
+import sys
+
+from benchmarks.harness import benchmark, use_scratch_data_dir
+
+use_scratch_data_dir()
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+FIRST_RENDER = (
+    "import run\n"
+    "client = run.app.test_client()\n"
+    "assert client.get('/').status_code == 200\n"
+    "assert client.get('/panda').status_code == 200\n"
+)
+
+
+def _python(code: str):
+    def call():
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL)
+    return call
+
+
+@benchmark('startup.import_run', samples=10, budget_ms=500)
+def bench_import_run():
+    return _python('import run')
+
+
+@benchmark('startup.first_render', samples=10, budget_ms=800)
+def bench_first_render():
+    # 先运行一次以填充模板字节码缓存，之后的测量相当于新worker启动
+    _python(FIRST_RENDER)()
+    return _python(FIRST_RENDER)
@@ -0,0 +1,209 @@
+"""
+基准测试框架
+Minimal benchmark harness with JSON baselines and regression gates.
+
+Each benchmark is a zero-argument callable. Calls are grouped into samples
+of ``inner`` iterations, calibrated so a sample lasts at least
+``min_sample_time`` seconds; p50/p99 are computed over the per-call latency
+of each sample and ops/sec over the total measured time.
+"""
+
+import atexit
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {}
+BENCHMARK_OPTIONS: Dict[str, Dict] = {}
+
+# run.py 的数据存储（环境变量 -> 临时目录下的文件名）
+DATA_PATHS = {
+    'HISTORY_DB_PATH': 'prediction_history.db',
+    'CATALOG_DB_PATH': 'catalog.db',
+    'OMICS_DATA_DIR': 'omics',
+    'ANALYSIS_DIR': 'analyses',
+    'UPLOAD_FOLDER': 'uploads',
+    'IMAGING_DATA_DIR': 'imaging',
+    'CHART_CACHE_DIR': 'charts',
+    'IMPUTATION_STATS_PATH': 'imputation.json',
+    'MODEL_DIR': 'models'
+}
+_scratch_dir: Optional[str] = None
+
+
+def use_scratch_data_dir() -> str:
+    """
+    Point run.py's data stores at a temporary directory, removed at exit
+
+    Must be called before ``run`` is imported; subprocesses inherit it.
+    """
+    global _scratch_dir
+    if _scratch_dir is None:
+        _scratch_dir = tempfile.mkdtemp(prefix='disease-prediction-bench-')
+        atexit.register(shutil.rmtree, _scratch_dir, True)
+        for name, path in DATA_PATHS.items():
+            os.environ[name] = os.path.join(_scratch_dir, path)
+    return _scratch_dir
+
+
+def benchmark(name: str, samples: Optional[int] = None, budget_ms: Optional[float] = None):
+    """
+    Register a benchmark factory
+
+    The decorated function performs any setup and returns the callable to time.
+
+    Args:
+        name: Benchmark name
+        samples: Override the number of samples (for slow benchmarks)
+        budget_ms: Absolute p50 budget, enforced even without a baseline
+    """
+    def decorator(factory):
+        BENCHMARKS[name] = factory
+        BENCHMARK_OPTIONS[name] = {'samples': samples, 'budget_ms': budget_ms}
+        return factory
+    return decorator
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * percent / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def _calibrate(func: Callable, min_sample_time: float) -> int:
+    """Find how many calls make one sample last at least min_sample_time"""
+    inner = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(inner):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_sample_time or inner >= 1 << 20:
+            return inner
+        inner *= 2 if elapsed == 0 else max(2, min(10, int(min_sample_time / elapsed) + 1))
+
+
+def measure(func: Callable, samples: int = 50, min_sample_time: float = 0.002, warmup: int = 3) -> Dict:
+    """
+    Time a callable
+
+    Returns:
+        Dictionary with p50/p99/mean latency in microseconds and ops_per_sec
+    """
+    for _ in range(warmup):
+        func()
+    inner = _calibrate(func, min_sample_time)
+
+    latencies = []
+    total = 0.0
+    for _ in range(samples):
+        start = time.perf_counter()
+        for _ in range(inner):
+            func()
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        latencies.append(elapsed / inner * 1e6)
+
+    latencies.sort()
+    return {
+        'p50_us': round(_percentile(latencies, 50), 3),
+        'p99_us': round(_percentile(latencies, 99), 3),
+        'mean_us': round(sum(latencies) / len(latencies), 3),
+        'ops_per_sec': round(samples * inner / total, 1),
+        'samples': samples,
+        'inner': inner
+    }
+
+
+def run_benchmarks(names: Optional[List[str]] = None, samples: int = 50) -> Dict[str, Dict]:
+    """Run the selected (or all) registered benchmarks"""
+    results = {}
+    for name, factory in BENCHMARKS.items():
+        if names and not any(selected in name for selected in names):
+            continue
+        options = BENCHMARK_OPTIONS.get(name, {})
+        results[name] = measure(factory(), samples=options.get('samples') or samples)
+    return results
+
+
+def check_budgets(results: Dict[str, Dict]) -> List[Dict]:
+    """Return the benchmarks whose p50 exceeds their absolute budget"""
+    violations = []
+    for name, result in results.items():
+        budget_ms = BENCHMARK_OPTIONS.get(name, {}).get('budget_ms')
+        if budget_ms is not None and result['p50_us'] > budget_ms * 1000:
+            violations.append({
+                'benchmark': name,
+                'metric': 'p50_us',
+                'budget': budget_ms * 1000,
+                'current': result['p50_us']
+            })
+    return violations
+
+
+def save_baseline(results: Dict[str, Dict], path: str):
+    """Write results as the new JSON baseline, merging with existing entries"""
+    baseline = load_baseline(path) or {'benchmarks': {}}
+    baseline['benchmarks'].update(results)
+    baseline['machine'] = platform.platform()
+    baseline['python'] = platform.python_version()
+    baseline['updated'] = datetime.now().isoformat()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(results: Dict[str, Dict], baseline: Dict, threshold: float = 0.2,
+            p99_threshold: Optional[float] = None) -> List[Dict]:
+    """
+    Compare results with a baseline
+
+    Args:
+        results: Output of run_benchmarks
+        baseline: Loaded baseline JSON
+        threshold: Allowed relative regression of p50 latency and ops/sec
+        p99_threshold: Allowed relative regression of p99 (defaults to 2x threshold)
+
+    Returns:
+        List of regressions, empty when every benchmark is within bounds
+    """
+    if p99_threshold is None:
+        p99_threshold = threshold * 2
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if not previous:
+            continue
+        checks = [
+            ('p50_us', current['p50_us'] / previous['p50_us'] - 1, threshold),
+            ('p99_us', current['p99_us'] / previous['p99_us'] - 1, p99_threshold),
+            ('ops_per_sec', 1 - current['ops_per_sec'] / previous['ops_per_sec'], threshold)
+        ]
+        for metric, change, limit in checks:
+            if change > limit:
+                regressions.append({
+                    'benchmark': name,
+                    'metric': metric,
+                    'baseline': previous[metric],
+                    'current': current[metric],
+                    'regression': round(change, 3),
+                    'threshold': limit
+                })
+    return regressions
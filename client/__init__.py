@@ -0,0 +1,16 @@
+# 预测API客户端包
+from client.prediction_client import (
+    AsyncPredictionClient,
+    PredictionAPIError,
+    PredictionClient,
+    PredictionError,
+    PredictionResult,
+)
+
+__all__ = [
+    'AsyncPredictionClient',
+    'PredictionAPIError',
+    'PredictionClient',
+    'PredictionError',
+    'PredictionResult',
+]
@@ -0,0 +1,331 @@
+"""
+疾病预测API客户端
+Python client for the disease prediction API.
+
+Both clients keep a pooled keep-alive connection set, bound the number of
+in-flight requests, retry with exponential backoff and split large cohorts
+into chunks for ``/api/predict/<disease_id>/batch``. Predictions are
+recorded in the server's history, so only requests the server cannot have
+processed are retried: ``429`` rejections and connections that failed
+before the request was sent. A ``5xx`` or a timeout after sending is
+returned or raised as is.
+Servers without the batch endpoint are detected once per client and the
+records are sent one by one instead.
+
+Example:
+    with PredictionClient('http://localhost:5000') as client:
+        result = client.predict('diabetes', {'age': 45, 'bmi': 28.5})
+        results = client.predict_many('diabetes', cohort)
+"""
+
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import httpx
+
+# 可重试的HTTP状态码：仅限服务器未处理请求的情况
+RETRY_STATUS_CODES = frozenset({429})
+# 请求发出之前的连接错误；读超时等错误发生时服务器可能已记录该预测
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+@dataclass(frozen=True)
+class PredictionResult:
+    """A successful prediction for one record"""
+    disease_id: str
+    risk_score: float
+    risk_level: str
+    risk_level_zh: str
+    risk_level_en: str
+    index: int = 0
+    recommendations: Optional[Dict[str, List[str]]] = None
+    timestamp: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class PredictionError:
+    """A record the server rejected"""
+    disease_id: str
+    message: str
+    index: int = 0
+    status_code: Optional[int] = None
+    field_errors: List[Dict] = field(default_factory=list)
+
+
+PredictionOutcome = Union[PredictionResult, PredictionError]
+
+
+class PredictionAPIError(Exception):
+    """Raised when a single prediction fails"""
+
+    def __init__(self, error: PredictionError):
+        super().__init__(error.message)
+        self.error = error
+
+
+def _result_from_json(disease_id: str, data: Dict, index: int = 0) -> PredictionResult:
+    return PredictionResult(
+        disease_id=disease_id,
+        risk_score=float(data['risk_score']),
+        risk_level=data['risk_level'],
+        risk_level_zh=data.get('risk_level_zh', ''),
+        risk_level_en=data.get('risk_level_en', ''),
+        index=index,
+        recommendations=data.get('recommendations'),
+        timestamp=data.get('timestamp')
+    )
+
+
+def _error_from_response(disease_id: str, response: httpx.Response, index: int = 0) -> PredictionError:
+    try:
+        data = response.json()
+    except ValueError:
+        data = {}
+    return PredictionError(
+        disease_id=disease_id,
+        message=data.get('error') or data.get('message') or f'HTTP {response.status_code}',
+        index=index,
+        status_code=response.status_code,
+        field_errors=data.get('field_errors', [])
+    )
+
+
+def _batch_outcomes(disease_id: str, data: Dict, offset: int) -> List[PredictionOutcome]:
+    outcomes = []
+    for item in data['results']:
+        index = offset + item['index']
+        if item.get('status') == 'success':
+            outcomes.append(_result_from_json(disease_id, item, index))
+        else:
+            outcomes.append(PredictionError(
+                disease_id=disease_id,
+                message='Invalid risk factors',
+                index=index,
+                status_code=400,
+                field_errors=item.get('field_errors', [])
+            ))
+    return outcomes
+
+
+def _is_missing_route(response: httpx.Response) -> bool:
+    """A 404/405 without a JSON error body means the endpoint does not exist"""
+    if response.status_code == 405:
+        return True
+    if response.status_code != 404:
+        return False
+    return 'application/json' not in response.headers.get('content-type', '')
+
+
+def _chunks(records: Sequence, size: int) -> Iterable:
+    for offset in range(0, len(records), size):
+        yield offset, records[offset:offset + size]
+
+
+class _RetryPolicy:
+    """Exponential backoff with full jitter, honouring ``Retry-After``"""
+
+    def __init__(self, max_retries: int, backoff_factor: float, max_backoff: float = 10.0):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.max_backoff)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * (2 ** attempt)))
+
+    def should_retry(self, attempt: int, response: Optional[httpx.Response]) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return response is None or response.status_code in RETRY_STATUS_CODES
+
+
+class _BaseClient:
+    def __init__(self, base_url: str, timeout: float, max_connections: int, max_concurrency: int,
+                 batch_size: int, max_retries: int, backoff_factor: float):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_connections)
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
+        self.retry = _RetryPolicy(max_retries, backoff_factor)
+        # None表示尚未探测服务器是否支持批量接口
+        self.batch_supported: Optional[bool] = None
+
+    def _predict_outcome(self, disease_id: str, response: httpx.Response, index: int) -> PredictionOutcome:
+        if response.status_code == 200:
+            return _result_from_json(disease_id, response.json(), index)
+        return _error_from_response(disease_id, response, index)
+
+
+class PredictionClient(_BaseClient):
+    """Synchronous, thread-pooled client"""
+
+    def __init__(self, base_url: str, timeout: float = 10.0, max_connections: int = 20,
+                 max_concurrency: int = 8, batch_size: int = 500, max_retries: int = 3,
+                 backoff_factor: float = 0.2, transport: Optional[httpx.BaseTransport] = None):
+        super().__init__(base_url, timeout, max_connections, max_concurrency,
+                         batch_size, max_retries, backoff_factor)
+        self._http = httpx.Client(base_url=self.base_url, timeout=timeout,
+                                  limits=self.limits, transport=transport)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._http.close()
+
+    def _post(self, path: str, payload: Dict) -> httpx.Response:
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = self._http.post(path, json=payload)
+            except UNSENT_ERRORS:
+                if not self.retry.should_retry(attempt, None):
+                    raise
+            else:
+                if not self.retry.should_retry(attempt, response):
+                    return response
+            time.sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    def predict(self, disease_id: str, factors: Dict) -> PredictionResult:
+        """Score one patient, raising PredictionAPIError on failure"""
+        outcome = self._predict_one(disease_id, factors, 0)
+        if isinstance(outcome, PredictionError):
+            raise PredictionAPIError(outcome)
+        return outcome
+
+    def _predict_one(self, disease_id: str, factors: Dict, index: int) -> PredictionOutcome:
+        response = self._post(f'/api/predict/{disease_id}', {'factors': factors})
+        return self._predict_outcome(disease_id, response, index)
+
+    def _predict_chunk(self, disease_id: str, offset: int, chunk: Sequence[Dict]) -> Optional[List[PredictionOutcome]]:
+        """Send one chunk to the batch endpoint; None if the server lacks it"""
+        response = self._post(f'/api/predict/{disease_id}/batch', {'records': list(chunk)})
+        if response.status_code == 200:
+            return _batch_outcomes(disease_id, response.json(), offset)
+        if _is_missing_route(response):
+            self.batch_supported = False
+            return None
+        error = _error_from_response(disease_id, response)
+        return [PredictionError(disease_id, error.message, offset + i, error.status_code, error.field_errors)
+                for i in range(len(chunk))]
+
+    def predict_many(self, disease_id: str, records: Sequence[Dict]) -> List[PredictionOutcome]:
+        """
+        Score a cohort with bounded concurrency
+
+        Returns:
+            One PredictionResult or PredictionError per record, in input order
+        """
+        records = list(records)
+        if not records:
+            return []
+
+        outcomes: List[PredictionOutcome] = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            if self.batch_supported is not False:
+                chunks = list(_chunks(records, self.batch_size))
+                # 先发送第一块以探测批量接口
+                first = self._predict_chunk(disease_id, *chunks[0])
+                if first is not None:
+                    self.batch_supported = True
+                    outcomes.extend(first)
+                    for chunk_outcomes in pool.map(lambda c: self._predict_chunk(disease_id, *c), chunks[1:]):
+                        outcomes.extend(chunk_outcomes)
+                    return outcomes
+
+            return list(pool.map(lambda item: self._predict_one(disease_id, item[1], item[0]),
+                                 enumerate(records)))
+
+
+class AsyncPredictionClient(_BaseClient):
+    """asyncio client sharing one connection pool"""
+
+    def __init__(self, base_url: str, timeout: float = 10.0, max_connections: int = 20,
+                 max_concurrency: int = 8, batch_size: int = 500, max_retries: int = 3,
+                 backoff_factor: float = 0.2, transport: Optional[httpx.AsyncBaseTransport] = None):
+        super().__init__(base_url, timeout, max_connections, max_concurrency,
+                         batch_size, max_retries, backoff_factor)
+        self._http = httpx.AsyncClient(base_url=self.base_url, timeout=timeout,
+                                       limits=self.limits, transport=transport)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def _post(self, path: str, payload: Dict) -> httpx.Response:
+        attempt = 0
+        while True:
+            response = None
+            try:
+                async with self._semaphore:
+                    response = await self._http.post(path, json=payload)
+            except UNSENT_ERRORS:
+                if not self.retry.should_retry(attempt, None):
+                    raise
+            else:
+                if not self.retry.should_retry(attempt, response):
+                    return response
+            await asyncio.sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    async def predict(self, disease_id: str, factors: Dict) -> PredictionResult:
+        """Score one patient, raising PredictionAPIError on failure"""
+        outcome = await self._predict_one(disease_id, factors, 0)
+        if isinstance(outcome, PredictionError):
+            raise PredictionAPIError(outcome)
+        return outcome
+
+    async def _predict_one(self, disease_id: str, factors: Dict, index: int) -> PredictionOutcome:
+        response = await self._post(f'/api/predict/{disease_id}', {'factors': factors})
+        return self._predict_outcome(disease_id, response, index)
+
+    async def _predict_chunk(self, disease_id: str, offset: int, chunk: Sequence[Dict]) -> Optional[List[PredictionOutcome]]:
+        response = await self._post(f'/api/predict/{disease_id}/batch', {'records': list(chunk)})
+        if response.status_code == 200:
+            return _batch_outcomes(disease_id, response.json(), offset)
+        if _is_missing_route(response):
+            self.batch_supported = False
+            return None
+        error = _error_from_response(disease_id, response)
+        return [PredictionError(disease_id, error.message, offset + i, error.status_code, error.field_errors)
+                for i in range(len(chunk))]
+
+    async def predict_many(self, disease_id: str, records: Sequence[Dict]) -> List[PredictionOutcome]:
+        """Score a cohort; see PredictionClient.predict_many"""
+        records = list(records)
+        if not records:
+            return []
+
+        if self.batch_supported is not False:
+            chunks = list(_chunks(records, self.batch_size))
+            first = await self._predict_chunk(disease_id, *chunks[0])
+            if first is not None:
+                self.batch_supported = True
+                rest = await asyncio.gather(*(self._predict_chunk(disease_id, *c) for c in chunks[1:]))
+                return first + [outcome for chunk_outcomes in rest for outcome in chunk_outcomes]
+
+        return list(await asyncio.gather(
+            *(self._predict_one(disease_id, factors, index) for index, factors in enumerate(records))))
@@ -0,0 +1,57 @@
+"""
+gunicorn 生产环境配置
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+可通过环境变量覆盖:
+    BIND               监听地址 (默认 0.0.0.0:5000)
+    WEB_CONCURRENCY    worker进程数 (默认CPU核数)
+    WORKER_THREADS     每个worker的线程数 (默认1)
+    MAX_REQUESTS       worker处理多少请求后自动回收 (默认1000, 0为不回收)
+    WORKER_TIMEOUT     worker无响应超时秒数 (默认60)
+
+平滑重启 (不丢连接):
+    kill -HUP <master_pid>    用主进程中已加载的应用重新fork全部worker
+    kill -USR2 <master_pid>   启动新主进程并重新加载代码，确认正常后
+    kill -QUIT <old_master>   再让旧主进程处理完进行中的请求后退出
+"""
+
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WORKER_THREADS', 1))
+
+# 在fork之前加载应用和模型，worker通过写时复制共享内存
+preload_app = True
+
+# 处理一定数量请求后回收worker，加入抖动避免所有worker同时重启
+max_requests = int(os.environ.get('MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+timeout = int(os.environ.get('WORKER_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """主进程加载完应用后冻结GC追踪的对象，防止worker中的GC触碰共享页面"""
+    gc.freeze()
+
+
+def worker_exit(server, worker):
+    """worker退出前把尚未写入的预测历史刷到磁盘"""
+    history = worker.wsgi.extensions.get('history') if worker.wsgi else None
+    if history is not None:
+        history.close()
+
+
+def post_fork(server, worker):
+    """fork后重新设置随机种子，否则所有worker会生成相同的随机序列"""
+    import numpy as np
+    np.random.seed()
@@ -5,15 +5,33 @@
 
 import sys
 import os
+import itertools
+import math
+import tempfile
 
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from flask import Flask, render_template, request, session, redirect, url_for, jsonify
+from flask import Flask, render_template, request, session, redirect, url_for, jsonify, send_file
 from werkzeug.utils import secure_filename
-import numpy as np
+from jinja2 import FileSystemBytecodeCache
 from datetime import datetime
 
+from app.admission import init_app as init_admission
+from app.analyses import init_app as init_analyses, new_analysis_id
+from app.auth import is_admin
+from app.catalog import CatalogConflict, CatalogError, init_app as init_catalog
+from app.charts import ChartError, RenderError, init_app as init_charts
+from app.exports import csv_file_rows, flatten, parse_export_args, stream_export
+from app.history import init_app as init_history
+from app.imaging import ImagingError, init_app as init_imaging
+from app.imputation import init_app as init_imputation
+from app.metrics import init_app as init_metrics, stage
+from app.models.registry import ModelCache, init_app as init_model_registry
+from app.profiling import init_app as init_profiling
+from app.rollups import AGE_BANDS
+from app.search import init_app as init_search
+from app.validation import FactorValidator, build_validators, records_to_columns
 
 
 app = Flask(__name__,
@@ -26,6 +44,56 @@ app.config['LANGUAGES'] = {
     'en': 'English',
     'zh': '中文'
 }
+app.config['MAX_BATCH_SIZE'] = 10000
+app.config['HISTORY_DB_PATH'] = os.environ.get(
+    'HISTORY_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'prediction_history.db'))
+app.config['CATALOG_DB_PATH'] = os.environ.get(
+    'CATALOG_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'catalog.db'))
+app.config['OMICS_DATA_DIR'] = os.environ.get(
+    'OMICS_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'omics'))
+app.config['ANALYSIS_DIR'] = os.environ.get(
+    'ANALYSIS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'analyses'))
+app.config['UPLOAD_FOLDER'] = os.environ.get(
+    'UPLOAD_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads'))
+app.config['IMAGING_DATA_DIR'] = os.environ.get(
+    'IMAGING_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'imaging'))
+app.config['CHART_CACHE_DIR'] = os.environ.get(
+    'CHART_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'charts'))
+app.config['IMPUTATION_STATS_PATH'] = os.environ.get(
+    'IMPUTATION_STATS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'imputation.json'))
+app.config['MODEL_DIR'] = os.environ.get(
+    'MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'models'))
+# 服务进程检查模型新版本的最短间隔（秒）
+app.config['MODEL_CHECK_INTERVAL'] = 1.0
+# 假设分析单次最多评估的组合数
+app.config['WHATIF_MAX_POINTS'] = 100000
+# 风险轨迹最多向后推算的年数
+app.config['TRAJECTORY_MAX_YEARS'] = 50
+# 单次组学矩阵读取返回的最大单元格数
+app.config['OMICS_MAX_CELLS'] = 1000000
+
+# 模板字节码缓存：新worker/容器启动时直接加载已编译的模板，无需重新编译
+JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR',
+                                 os.path.join(tempfile.gettempdir(), 'disease_prediction_jinja'))
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(JINJA_CACHE_DIR)}
+
+# 请求计时、Server-Timing响应头和 /metrics 接口
+init_metrics(app)
+# 按需剖析 (/admin/profile，需设置 ADMIN_TOKEN 环境变量)
+init_profiling(app)
+# 令牌桶准入控制：过载时快速返回429/503，优先保障预测请求
+init_admission(app)
+# 预测历史：请求中只入队，由后台线程批量写入SQLite
+prediction_history = init_history(app)
+# Panda分析结果，供导出和报告使用
+analysis_store = init_analyses(app)
+# 风险图表：matplotlib工作进程池渲染，按输入内容缓存PNG
+chart_service = init_charts(app)
+model_registry = init_model_registry(app)
+model_cache = ModelCache(model_registry, app.config['MODEL_CHECK_INTERVAL'])
+# 疾病 -> OnlineUpdater，按需创建
+online_updaters = {}
 
 # 语言设置函数
 def get_locale():
@@ -363,6 +431,14 @@ DISEASE_MODELS = {
     }
 }
 
+# 按疾病预编译的输入校验器
+FACTOR_VALIDATORS = build_validators(DISEASE_MODELS)
+# 多疾病联合预测：所有疾病风险因子的并集（同名因子定义一致）
+MULTI_VALIDATOR = FactorValidator(list({factor['id']: factor for model in DISEASE_MODELS.values()
+                                        for factor in model['risk_factors']}.values()))
+# 缺失因子按年龄段和性别的人群统计量填充（python -m app.imputation 预先计算）
+imputer = init_imputation(app, DISEASE_MODELS)
+
 # 疾病分类配置
 DISEASE_CATEGORIES = {
     'cancer': {
@@ -441,6 +517,13 @@ MULTIMODAL_DATABASE = {
     }
 }
 
+# 多模态数据目录：按子分类建索引，键集分页
+catalog = init_catalog(app, MULTIMODAL_DATABASE)
+# 医学文本BM25检索，按记录编号增量同步目录
+text_search = init_search(app, catalog, 'medical_text')
+# 医学影像预览金字塔（内容寻址存储）
+imaging_store = init_imaging(app)
+
 def get_locale():
     """获取当前语言设置"""
     return session.get('language', 'zh')
@@ -700,13 +783,292 @@ def multimodal_subcategory(category_id, subcategory_id):
     if not subcategory_info:
         return render_template('404.html', get_locale=get_locale), 404
 
+    query = request.args.get('q', '').strip() if category_id == text_search.category else ''
+    filters = {name: request.args.get(name, '') for name in ('type', 'source', 'status', 'date_from', 'date_to')}
+    if query:
+        results = text_search.search(query, k=50, subcategories=[subcategory_id])
+        records = _search_hits(results)
+        next_cursor = None
+    else:
+        try:
+            records, next_cursor = catalog.list_records(
+                subcategory_id, {name: filters[name] for name in ('type', 'source', 'status')},
+                date_from=filters['date_from'] or None,
+                date_to=filters['date_to'] or None,
+                cursor=request.args.get('cursor') or None,
+                limit=request.args.get('limit', 20, type=int))
+        except CatalogError:
+            records, next_cursor = [], None
+
     return render_template('multimodal_subcategory.html',
                          category_id=category_id,
                          subcategory_id=subcategory_id,
                          category_info=category_info,
                          subcategory_info=subcategory_info,
+                         summary=catalog.summary(subcategory_id),
+                         records=records,
+                         next_cursor=next_cursor,
+                         query=query,
+                         filters=filters,
                          get_locale=get_locale)
 
+
+@app.route('/api/multimodal/<category_id>/<subcategory_id>/records', methods=['GET', 'POST'])
+def api_multimodal_records(category_id, subcategory_id):
+    """多模态数据目录API：GET按类型/来源/状态/日期筛选并分页，POST批量录入（需管理员令牌）"""
+    if catalog.subcategories.get(subcategory_id) != category_id:
+        return jsonify({'status': 'error', 'message': 'Subcategory not found'}), 404
+
+    if request.method == 'POST':
+        if not is_admin():
+            return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+        data = request.get_json(silent=True)
+        records = data.get('records') if isinstance(data, dict) else None
+        if not isinstance(records, list) or not records or not all(isinstance(r, dict) for r in records):
+            return jsonify({'status': 'error', 'message': 'records must be a non-empty list of objects'}), 400
+        if len(records) > app.config['MAX_BATCH_SIZE']:
+            return jsonify({'status': 'error', 'message': f"At most {app.config['MAX_BATCH_SIZE']} records per request"}), 413
+        try:
+            ids = catalog.add_records({**record, 'subcategory': subcategory_id} for record in records)
+        except CatalogConflict as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 409
+        except CatalogError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        return jsonify({'status': 'success', 'ids': ids}), 201
+
+    try:
+        records, next_cursor = catalog.list_records(
+            subcategory_id,
+            {name: request.args.get(name) for name in ('type', 'source', 'status')},
+            date_from=request.args.get('date_from'),
+            date_to=request.args.get('date_to'),
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', 50, type=int))
+    except CatalogError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    return jsonify({
+        'status': 'success',
+        'records': records,
+        'next_cursor': next_cursor,
+        'summary': catalog.summary(subcategory_id)
+    })
+
+
+def _search_hits(results):
+    """检索结果对应的目录记录（跳过索引之后已被删除的记录）"""
+    records = []
+    for result in results:
+        record = catalog.get(result['id'])
+        if record is not None:
+            records.append(dict(record, score=result['score']))
+    return records
+
+
+@app.route('/api/multimodal/medical_text/search')
+def api_medical_text_search():
+    """医学文本全文检索API（BM25排序，支持中英文混合查询）"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'status': 'error', 'message': 'q is required'}), 400
+    k = min(max(request.args.get('k', 10, type=int), 1), 100)
+    subcategories = request.args.getlist('subcategory') or None
+
+    with stage('search'):
+        results = text_search.search(query, k=k, subcategories=subcategories)
+    with stage('fetch'):
+        records = _search_hits(results)
+
+    return jsonify({'status': 'success', 'query': query, 'results': records})
+
+
+def get_omics_store():
+    """组学矩阵存储（首次使用时才导入numpy）"""
+    store = app.extensions.get('omics')
+    if store is None:
+        from app.omics import init_app as init_omics
+        store = init_omics(app)
+    return store
+
+
+def _omics_matrix(subcategory_id, matrix_name):
+    from app.omics import OmicsError
+
+    try:
+        return get_omics_store().open(subcategory_id, matrix_name), None
+    except (KeyError, OmicsError):
+        return None, (jsonify({'status': 'error', 'message': 'Matrix not found'}), 404)
+
+
+def _json_values(values):
+    """NaN转为null"""
+    import numpy as np
+
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+@app.route('/api/imaging/<subcategory_id>/ingest', methods=['POST'])
+def api_imaging_ingest(subcategory_id):
+    """上传影像体数据（.npy）并构建预览金字塔（需管理员令牌）"""
+    if not is_admin():
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+    if catalog.subcategories.get(subcategory_id) != 'medical_imaging':
+        return jsonify({'status': 'error', 'message': 'Subcategory not found'}), 404
+    file = request.files.get('file')
+    if file is None or not file.filename.lower().endswith('.npy'):
+        return jsonify({'status': 'error', 'message': 'A .npy file is required'}), 400
+
+    incoming = os.path.join(app.config['IMAGING_DATA_DIR'], 'incoming')
+    os.makedirs(incoming, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix='.npy', dir=incoming)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            file.save(f)
+        with stage('pyramid'):
+            manifest = imaging_store.ingest(path, subcategory_id)
+    except ImagingError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    finally:
+        os.remove(path)
+    return jsonify({'status': 'success', **manifest}), 201
+
+
+@app.route('/api/imaging/<digest>')
+def api_imaging_manifest(digest):
+    """影像预览金字塔的层级与切片信息"""
+    try:
+        return jsonify({'status': 'success', **imaging_store.manifest(digest)})
+    except ImagingError:
+        return jsonify({'status': 'error', 'message': 'Image not found'}), 404
+
+
+def _immutable(response):
+    # 内容寻址：同一URL的内容永不改变
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+@app.route('/api/imaging/<digest>/<int:level>/<int:index>.png')
+def api_imaging_slice(digest, level, index):
+    """指定层级的单个切片（只从磁盘读取该切片）"""
+    try:
+        png = imaging_store.slice_png(digest, level, index)
+    except ImagingError:
+        return jsonify({'status': 'error', 'message': 'Image not found'}), 404
+    return _immutable(app.response_class(png, mimetype='image/png'))
+
+
+@app.route('/api/imaging/<digest>/thumbnail/<int:index>.png')
+def api_imaging_thumbnail(digest, index):
+    """切片缩略图"""
+    try:
+        path = imaging_store.thumbnail_path(digest, index)
+    except ImagingError:
+        return jsonify({'status': 'error', 'message': 'Image not found'}), 404
+    return _immutable(send_file(path, mimetype='image/png'))
+
+
+@app.route('/api/omics/<subcategory_id>')
+def api_omics_matrices(subcategory_id):
+    """组学矩阵列表"""
+    return jsonify({'status': 'success', 'matrices': get_omics_store().list(subcategory_id)})
+
+
+@app.route('/api/omics/<subcategory_id>/<matrix_name>/values')
+def api_omics_values(subcategory_id, matrix_name):
+    """读取组学矩阵的行、列或子矩阵：按特征/样本编号（row、col）或按位置范围"""
+    from app.omics import OmicsError
+
+    matrix, error = _omics_matrix(subcategory_id, matrix_name)
+    if error:
+        return error
+
+    row_ids, col_ids = request.args.getlist('row'), request.args.getlist('col')
+    try:
+        rows = matrix.row_positions(row_ids) if row_ids else None
+        cols = matrix.col_positions(col_ids) if col_ids else None
+        if rows is None:
+            start = request.args.get('row_start', 0, type=int)
+            stop = request.args.get('row_stop', matrix.shape[0], type=int)
+            rows = list(range(max(start, 0), min(stop, matrix.shape[0])))
+        if cols is None:
+            start = request.args.get('col_start', 0, type=int)
+            stop = request.args.get('col_stop', matrix.shape[1], type=int)
+            cols = list(range(max(start, 0), min(stop, matrix.shape[1])))
+        if len(rows) * len(cols) > app.config['OMICS_MAX_CELLS']:
+            return jsonify({'status': 'error',
+                            'message': f"At most {app.config['OMICS_MAX_CELLS']} cells per request"}), 413
+        with stage('read'):
+            values = matrix.take(rows, cols)
+    except OmicsError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    return jsonify({
+        'status': 'success',
+        'rows': [matrix.row_ids[i] for i in rows],
+        'columns': [matrix.col_ids[i] for i in cols],
+        'values': _json_values(values)
+    })
+
+
+@app.route('/api/omics/<subcategory_id>/<matrix_name>/stats')
+def api_omics_stats(subcategory_id, matrix_name):
+    """组学矩阵逐特征统计（计数、均值、标准差、最小值、最大值）"""
+    from app.omics import OmicsError
+
+    matrix, error = _omics_matrix(subcategory_id, matrix_name)
+    if error:
+        return error
+
+    row_ids = request.args.getlist('row')
+    try:
+        if row_ids:
+            rows = matrix.row_positions(row_ids)
+        else:
+            offset = max(request.args.get('offset', 0, type=int), 0)
+            limit = min(max(request.args.get('limit', 100, type=int), 1), 10000)
+            rows = range(offset, min(offset + limit, matrix.shape[0]))
+    except OmicsError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    with stage('stats'):
+        stats = matrix.feature_stats()
+    return jsonify({
+        'status': 'success',
+        'features': [
+            {'id': matrix.row_ids[i], 'count': int(stats['count'][i]),
+             **{name: _json_values(stats[name][i]) for name in ('mean', 'std', 'min', 'max')}}
+            for i in rows
+        ]
+    })
+
+def get_risk_level(risk_score):
+    """根据风险评分确定风险等级"""
+    if risk_score < 30:
+        return 'low', '低风险', 'Low Risk'
+    elif risk_score < 70:
+        return 'medium', '中等风险', 'Medium Risk'
+    else:
+        return 'high', '高风险', 'High Risk'
+
+def _served_model_result(disease_id, completed):
+    """已发布模型对一组完整因子的预测（未发布模型时为None）"""
+    served = model_cache.get(disease_id)
+    if served is None:
+        return None
+    import numpy as np
+    from app.models.registry import score
+
+    model, metadata = served
+    columns = {field: np.array([completed.get(field, np.nan)], dtype=np.float64) for field in metadata['features']}
+    imputer.complete_columns(disease_id, columns, 1)
+    return {
+        'version': metadata['version'],
+        'estimator': metadata.get('estimator'),
+        'risk_score': round(float(score(model, metadata, columns)[0]), 2)
+    }
+
 @app.route('/api/predict/<disease_id>', methods=['POST'])
 def api_predict(disease_id):
     """疾病预测API"""
@@ -714,50 +1076,483 @@ def api_predict(disease_id):
         if disease_id not in DISEASE_MODELS:
             return jsonify({'error': 'Disease not found'}), 404
         
-        data = request.get_json()
-        if not data:
+        with stage('parse'):
+            data = request.get_json(silent=True)
+        if not data or not isinstance(data, dict):
             return jsonify({'error': 'Invalid request data'}), 400
         
         factors = data.get('factors', {})
         if not factors:
             return jsonify({'error': 'Missing risk factors'}), 400
         
-        risk_score = calculate_risk_score(disease_id, factors)
+        with stage('validate'):
+            factors, field_errors = FACTOR_VALIDATORS[disease_id].validate(factors)
+        if field_errors:
+            return jsonify({'error': 'Invalid risk factors', 'field_errors': field_errors}), 400
+        if not factors:
+            return jsonify({'error': 'Missing risk factors'}), 400
         
-        if risk_score < 30:
-            risk_level = 'low'
-            risk_level_zh = '低风险'
-            risk_level_en = 'Low Risk'
-        elif risk_score < 70:
-            risk_level = 'medium'
-            risk_level_zh = '中等风险'
-            risk_level_en = 'Medium Risk'
-        else:
-            risk_level = 'high'
-            risk_level_zh = '高风险'
-            risk_level_en = 'High Risk'
+        with stage('impute'):
+            completed, imputed_fields = imputer.impute(disease_id, factors)
         
-        recommendations = {
-            'zh': ['定期体检，及时发现和处理健康问题', '保持健康的生活方式'],
-            'en': ['Regular health checkups', 'Maintain a healthy lifestyle']
-        }
+        with stage('score'):
+            risk_score = calculate_risk_score(disease_id, completed)
+            risk_level, risk_level_zh, risk_level_en = get_risk_level(risk_score)
         
-        result = {
-            'disease_id': disease_id,
-            'risk_score': risk_score,
+        with stage('model'):
+            model_result = _served_model_result(disease_id, completed)
+
+        with stage('recommendations'):
+            recommendations = {
+                'zh': ['定期体检，及时发现和处理健康问题', '保持健康的生活方式'],
+                'en': ['Regular health checkups', 'Maintain a healthy lifestyle']
+            }
+        
+        with stage('persist'):
+            prediction_history.record(disease_id, factors, risk_score, risk_level)
+        
+        with stage('serialize'):
+            result = {
+                'disease_id': disease_id,
+                'risk_score': risk_score,
+                'risk_level': risk_level,
+                'risk_level_zh': risk_level_zh,
+                'risk_level_en': risk_level_en,
+                'imputed_fields': imputed_fields,
+                'recommendations': recommendations,
+                'timestamp': datetime.now().isoformat(),
+                'status': 'success'
+            }
+            if model_result is not None:
+                result['model'] = model_result
+            response = jsonify(result)
+        
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
+
+@app.route('/api/predict/<disease_id>/batch', methods=['POST'])
+def api_predict_batch(disease_id):
+    """批量疾病预测API"""
+    try:
+        if disease_id not in DISEASE_MODELS:
+            return jsonify({'error': 'Disease not found'}), 404
+
+        with stage('parse'):
+            data = request.get_json(silent=True)
+        if not data or not isinstance(data, dict):
+            return jsonify({'error': 'Invalid request data'}), 400
+
+        records = data.get('records')
+        if not records or not isinstance(records, list):
+            return jsonify({'error': 'Missing records'}), 400
+        if len(records) > app.config['MAX_BATCH_SIZE']:
+            return jsonify({'error': f"Batch too large (max {app.config['MAX_BATCH_SIZE']} records)"}), 413
+
+        # 按列校验整个批次
+        with stage('validate'):
+            validator = FACTOR_VALIDATORS[disease_id]
+            columns, bad_rows = records_to_columns(records, validator.fields)
+            batch = validator.validate_columns(columns, len(records))
+            for index in bad_rows:
+                batch.valid[index] = False
+                batch.errors.setdefault(index, []).append(
+                    {'field': None, 'code': 'invalid_type', 'message': 'record must be an object'})
+
+        # 整列填充缺失值
+        with stage('impute'):
+            imputed = imputer.impute_columns(disease_id, batch.values)
+
+        with stage('score'):
+            results = []
+            for index in range(len(records)):
+                if not batch.valid[index]:
+                    results.append({'index': index, 'status': 'error', 'field_errors': batch.errors[index]})
+                    continue
+                factors = batch.row(index)
+                imputed_fields = [field for field, mask in imputed.items() if mask[index]]
+                risk_score = calculate_risk_score(disease_id, factors)
+                risk_level, risk_level_zh, risk_level_en = get_risk_level(risk_score)
+                # 历史中只记录实际提供的因子
+                observed = {field: value for field, value in factors.items() if field not in imputed_fields}
+                prediction_history.record(disease_id, observed, risk_score, risk_level)
+                results.append({
+                    'index': index,
+                    'status': 'success',
+                    'risk_score': risk_score,
+                    'risk_level': risk_level,
+                    'risk_level_zh': risk_level_zh,
+                    'risk_level_en': risk_level_en,
+                    'imputed_fields': imputed_fields
+                })
+
+        with stage('serialize'):
+            response = jsonify({
+                'disease_id': disease_id,
+                'results': results,
+                'error_count': len(batch.errors),
+                'timestamp': datetime.now().isoformat(),
+                'status': 'success'
+            })
+
+        return response
+
+    except Exception as e:
+        return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
+
+BMI_BAND_LABELS = ('underweight', 'normal', 'overweight', 'obese')
+
+
+def _multi_result(graph, disease_ids, index):
+    """多疾病评估结果中的一行"""
+    diseases = {}
+    for disease_id in disease_ids:
+        score = round(float(graph['scores'][disease_id][index]), 2)
+        risk_level, risk_level_zh, risk_level_en = get_risk_level(score)
+        diseases[disease_id] = {
+            'risk_score': score,
             'risk_level': risk_level,
             'risk_level_zh': risk_level_zh,
             'risk_level_en': risk_level_en,
-            'recommendations': recommendations,
-            'timestamp': datetime.now().isoformat(),
-            'status': 'success'
+            'imputed_fields': [field for field, mask in graph['imputed'][disease_id].items() if mask[index]],
+            'derived_fields': [field for field, mask in graph['derived'][disease_id].items() if mask[index]]
         }
-        
-        return jsonify(result)
-        
+    features = graph['features']
+    bmi_band, age_band = features['bmi_band'][index], features['age_band'][index]
+    return diseases, {
+        'pack_years': round(float(features['pack_years'][index]), 2),
+        'bmi_band': None if math.isnan(bmi_band) else BMI_BAND_LABELS[int(bmi_band)],
+        'age_band': None if math.isnan(age_band) else AGE_BANDS[int(age_band)][1]
+    }
+
+@app.route('/api/predict/multi', methods=['POST'])
+def api_predict_multi():
+    """多疾病联合预测API：按疾病间依赖顺序评估，共享派生特征"""
+    try:
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data, dict):
+            return jsonify({'error': 'Invalid request data'}), 400
+        disease_ids = data.get('diseases') or list(DISEASE_MODELS)
+        if not isinstance(disease_ids, list) or any(d not in DISEASE_MODELS for d in disease_ids):
+            return jsonify({'error': 'Disease not found'}), 404
+
+        single = 'records' not in data
+        records = [data.get('factors')] if single else data.get('records')
+        if not records or not isinstance(records, list) or not records[0]:
+            return jsonify({'error': 'Missing risk factors' if single else 'Missing records'}), 400
+        if len(records) > app.config['MAX_BATCH_SIZE']:
+            return jsonify({'error': f"Batch too large (max {app.config['MAX_BATCH_SIZE']} records)"}), 413
+
+        with stage('validate'):
+            columns, bad_rows = records_to_columns(records, MULTI_VALIDATOR.fields)
+            batch = MULTI_VALIDATOR.validate_columns(columns, len(records))
+            for index in bad_rows:
+                batch.valid[index] = False
+                batch.errors.setdefault(index, []).append(
+                    {'field': None, 'code': 'invalid_type', 'message': 'record must be an object'})
+        if single and batch.errors:
+            return jsonify({'error': 'Invalid risk factors', 'field_errors': batch.errors[0]}), 400
+        observed = [batch.row(index) for index in range(len(records))]
+
+        from app.disease_graph import evaluate
+
+        with stage('score'):
+            graph = evaluate(DISEASE_MODELS, imputer, disease_ids, batch.values, len(records))
+
+        with stage('persist'):
+            fields = {d: {f['id'] for f in DISEASE_MODELS[d]['risk_factors']} for d in disease_ids}
+            for index, factors in enumerate(observed):
+                if not batch.valid[index]:
+                    continue
+                for disease_id in disease_ids:
+                    score = float(graph['scores'][disease_id][index])
+                    prediction_history.record(disease_id, {k: v for k, v in factors.items() if k in fields[disease_id]},
+                                              score, get_risk_level(score)[0])
+
+        with stage('serialize'):
+            if single:
+                diseases, features = _multi_result(graph, disease_ids, 0)
+                body = {'results': diseases, 'features': features}
+            else:
+                results = []
+                for index in range(len(records)):
+                    if not batch.valid[index]:
+                        results.append({'index': index, 'status': 'error', 'field_errors': batch.errors[index]})
+                        continue
+                    diseases, features = _multi_result(graph, disease_ids, index)
+                    results.append({'index': index, 'status': 'success', 'results': diseases, 'features': features})
+                body = {'results': results, 'error_count': len(batch.errors)}
+            response = jsonify({
+                'evaluation_order': graph['order'],
+                **body,
+                'timestamp': datetime.now().isoformat(),
+                'status': 'success'
+            })
+        return response
+
     except Exception as e:
         return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
 
+@app.route('/api/predict/<disease_id>/whatif', methods=['POST'])
+def api_predict_whatif(disease_id):
+    """假设分析API：基线因子在一组因子变化下的风险曲面"""
+    try:
+        if disease_id not in DISEASE_MODELS:
+            return jsonify({'error': 'Disease not found'}), 404
+
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data, dict):
+            return jsonify({'error': 'Invalid request data'}), 400
+        factors, field_errors = FACTOR_VALIDATORS[disease_id].validate(data.get('factors', {}))
+        if field_errors:
+            return jsonify({'error': 'Invalid risk factors', 'field_errors': field_errors}), 400
+        grid = data.get('grid')
+        if not grid or not isinstance(grid, dict):
+            return jsonify({'error': 'Missing grid'}), 400
+
+        from app.scoring import build_axes, what_if
+
+        base, imputed_fields = imputer.impute(disease_id, factors)
+        try:
+            axes = build_axes(DISEASE_MODELS[disease_id]['risk_factors'], base, grid)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        n_points = 1
+        for _, values in axes:
+            n_points *= len(values)
+        if n_points > app.config['WHATIF_MAX_POINTS']:
+            return jsonify({'error': f"Grid too large (max {app.config['WHATIF_MAX_POINTS']} points)"}), 413
+
+        with stage('score'):
+            result = what_if(disease_id, base, axes)
+        return jsonify({
+            'disease_id': disease_id,
+            'factors': base,
+            'imputed_fields': imputed_fields,
+            **result,
+            'status': 'success'
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'What-if analysis failed: {str(e)}'}), 500
+
+def _whole_number(value):
+    """JSON整数（或整数值的数字、数字字符串）转为int；布尔值、小数等返回None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().lstrip('+-').isdigit():
+        return int(value)
+    return None
+
+@app.route('/api/predict/<disease_id>/trajectory', methods=['POST'])
+def api_predict_trajectory(disease_id):
+    """风险轨迹API：按未来年龄重新评分（可选全部疾病）"""
+    try:
+        if disease_id not in DISEASE_MODELS:
+            return jsonify({'error': 'Disease not found'}), 404
+
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data, dict):
+            return jsonify({'error': 'Invalid request data'}), 400
+        raw_factors = data.get('factors', {})
+        years, step = _whole_number(data.get('years', 20)), _whole_number(data.get('step', 1))
+        if years is None or step is None:
+            return jsonify({'error': 'years and step must be integers'}), 400
+        if not 1 <= years <= app.config['TRAJECTORY_MAX_YEARS'] or not 1 <= step <= years:
+            return jsonify({'error': f"years must be between 1 and {app.config['TRAJECTORY_MAX_YEARS']} "
+                                     f"and step between 1 and years"}), 400
+
+        disease_ids = list(DISEASE_MODELS) if data.get('all_diseases') else [disease_id]
+        bases, imputed_fields = {}, {}
+        for other_id in disease_ids:
+            factors, field_errors = FACTOR_VALIDATORS[other_id].validate(raw_factors)
+            if field_errors:
+                return jsonify({'error': 'Invalid risk factors', 'disease_id': other_id,
+                                'field_errors': field_errors}), 400
+            if 'age' not in factors:
+                return jsonify({'error': 'age is required'}), 400
+            bases[other_id], imputed_fields[other_id] = imputer.impute(other_id, factors)
+
+        import numpy as np
+        from app.scoring import trajectory
+
+        age = bases[disease_id]['age']
+        # 不超过年龄取值上限
+        max_age = min(next(f['max'] for f in DISEASE_MODELS[other_id]['risk_factors'] if f['id'] == 'age')
+                      for other_id in disease_ids)
+        ages = age + np.arange(0, years + 1, step, dtype=np.float64)
+        ages = ages[ages <= max_age]
+
+        with stage('score'):
+            curves = {}
+            for other_id in disease_ids:
+                scores = trajectory(other_id, bases[other_id], ages).round(2).tolist()
+                curves[other_id] = {
+                    'name_zh': DISEASE_MODELS[other_id]['name_zh'],
+                    'name_en': DISEASE_MODELS[other_id]['name_en'],
+                    'risk_scores': scores,
+                    'risk_levels': [get_risk_level(score)[0] for score in scores]
+                }
+
+        return jsonify({
+            'disease_id': disease_id,
+            'ages': ages.tolist(),
+            'curves': curves,
+            'imputed_fields': imputed_fields,
+            'status': 'success'
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'Trajectory failed: {str(e)}'}), 500
+
+@app.route('/api/models')
+def api_models():
+    """已发布模型的当前版本及交叉验证指标"""
+    models = {}
+    for disease_id, metadata in model_registry.catalog().items():
+        models[disease_id] = {key: metadata.get(key) for key in ('version', 'estimator', 'published_at',
+                                                                 'features', 'training', 'online')}
+        # 由在线更新从数据流新建的模型没有交叉验证结果
+        models[disease_id]['cv_metrics'] = (metadata.get('cv') or {}).get('metrics')
+    return jsonify({'status': 'success', 'models': models})
+
+@app.route('/api/models/<disease_id>/updates', methods=['POST'])
+def api_model_updates(disease_id):
+    """用新标注的结局小批量增量更新模型（需管理员令牌）"""
+    if not is_admin():
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+    if disease_id not in DISEASE_MODELS:
+        return jsonify({'status': 'error', 'message': 'Disease not found'}), 404
+    data = request.get_json(silent=True)
+    records = data.get('records') if isinstance(data, dict) else None
+    outcomes = data.get('outcomes') if isinstance(data, dict) else None
+    if not isinstance(records, list) or not records or not isinstance(outcomes, list):
+        return jsonify({'status': 'error', 'message': 'records and outcomes must be non-empty lists'}), 400
+    if len(outcomes) != len(records) or any(outcome not in (0, 1) for outcome in outcomes):
+        return jsonify({'status': 'error', 'message': 'outcomes must be one 0/1 value per record'}), 400
+    if len(records) > app.config['MAX_BATCH_SIZE']:
+        return jsonify({'status': 'error', 'message': f"At most {app.config['MAX_BATCH_SIZE']} records per request"}), 413
+
+    from app.models.online import OnlineError, OnlineUpdater
+
+    validator = FACTOR_VALIDATORS[disease_id]
+    columns, bad_rows = records_to_columns(records, validator.fields)
+    batch = validator.validate_columns(columns, len(records))
+    if bad_rows or batch.errors:
+        errors = {str(index): batch.errors.get(index, []) for index in sorted(set(bad_rows) | set(batch.errors))}
+        return jsonify({'status': 'error', 'message': 'Invalid risk factors', 'field_errors': errors}), 400
+
+    # 只更新已发布的基础模型，不从单个请求的数据新建模型
+    updater = online_updaters.get(disease_id)
+    if updater is None:
+        updater = online_updaters.setdefault(disease_id, OnlineUpdater(model_registry, disease_id, validator, imputer))
+    try:
+        metadata = updater.update(batch.values, outcomes)
+    except OnlineError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
+    return jsonify({'status': 'success', 'version': metadata['version'], 'online': metadata['online']})
+
+def _chart_response(kind, spec, max_age):
+    try:
+        path = chart_service.render(kind, spec)
+    except ChartError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except RenderError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 504 if e.timed_out else 503
+    digest = os.path.splitext(os.path.basename(path))[0]
+    return send_file(path, mimetype='image/png', etag=digest, max_age=max_age)
+
+@app.route('/api/charts/<disease_id>/gauge.png')
+def api_chart_gauge(disease_id):
+    """风险评分仪表图"""
+    if disease_id not in DISEASE_MODELS:
+        return jsonify({'status': 'error', 'message': 'Disease not found'}), 404
+    try:
+        score = round(float(request.args['score']), 1)
+    except (KeyError, ValueError):
+        return jsonify({'status': 'error', 'message': 'score is required'}), 400
+    spec = {'score': score, 'title': DISEASE_MODELS[disease_id]['name_en']}
+    # 相同输入的图表内容不变
+    return _chart_response('gauge', spec, max_age=31536000)
+
+@app.route('/api/charts/<disease_id>/contributions.png', methods=['POST'])
+def api_chart_contributions(disease_id):
+    """风险因素贡献条形图（各因素相对人群典型值的评分变化）"""
+    if disease_id not in DISEASE_MODELS:
+        return jsonify({'status': 'error', 'message': 'Disease not found'}), 404
+    data = request.get_json(silent=True)
+    factors = data.get('factors') if isinstance(data, dict) else None
+    if not factors or not isinstance(factors, dict):
+        return jsonify({'status': 'error', 'message': 'Missing risk factors'}), 400
+    factors, field_errors = FACTOR_VALIDATORS[disease_id].validate(factors)
+    if field_errors:
+        return jsonify({'status': 'error', 'message': 'Invalid risk factors', 'field_errors': field_errors}), 400
+    if not factors:
+        return jsonify({'status': 'error', 'message': 'Missing risk factors'}), 400
+
+    import numpy as np
+    from app.scoring import score_columns
+
+    # 第0行为完整输入，第i行去掉第i个因子（取人群填充值或评分默认值）；
+    # 向量化评分是确定性的（Panda取期望调整系数），同一输入总是得到同一张图
+    rows = [imputer.impute(disease_id, factors)[0]]
+    rows += [imputer.impute(disease_id, {key: value for key, value in factors.items() if key != field})[0]
+             for field in factors]
+    fields = [factor['id'] for factor in DISEASE_MODELS[disease_id]['risk_factors']]
+    scores = score_columns(disease_id, {field: np.array([row.get(field, np.nan) for row in rows], dtype=np.float64)
+                                        for field in fields})
+    names = {factor['id']: factor['name_en'] for factor in DISEASE_MODELS[disease_id]['risk_factors']}
+    items = [[names.get(field, field), round(float(scores[0] - scores[i]), 2)] for i, field in enumerate(factors, 1)]
+    spec = {'items': items, 'title': f"{DISEASE_MODELS[disease_id]['name_en']} ({round(float(scores[0]), 1)})"}
+    return _chart_response('contributions', spec, max_age=3600)
+
+@app.route('/api/charts/<disease_id>/distribution.png')
+def api_chart_distribution(disease_id):
+    """人群风险评分分布图（基于预聚合的汇总表）"""
+    if disease_id not in DISEASE_MODELS:
+        return jsonify({'status': 'error', 'message': 'Disease not found'}), 404
+    try:
+        groups = prediction_history.rollup(disease_id=disease_id, start_day=request.args.get('from'),
+                                           end_day=request.args.get('to'), group_by=['disease_id'])
+        score = request.args.get('score', type=float)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if not groups:
+        return jsonify({'status': 'error', 'message': 'No predictions in range'}), 404
+    spec = {
+        'histogram': groups[0]['histogram'],
+        'score': None if score is None else round(score, 1),
+        'title': f"{DISEASE_MODELS[disease_id]['name_en']} (n={groups[0]['count']})"
+    }
+    # 汇总表持续更新，仅短时缓存
+    return _chart_response('distribution', spec, max_age=60)
+
+@app.route('/api/stats/risk_distribution')
+def api_risk_distribution():
+    """风险等级分布统计API（基于预聚合的汇总表）"""
+    group_by = [column for column in request.args.get('group_by', 'disease_id,risk_level').split(',') if column]
+    try:
+        groups = prediction_history.rollup(
+            disease_id=request.args.get('disease_id'),
+            start_day=request.args.get('from'),
+            end_day=request.args.get('to'),
+            group_by=group_by
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'group_by': group_by,
+        'groups': groups,
+        'histogram_bins': [[i * 10, (i + 1) * 10] for i in range(10)],
+        'status': 'success'
+    })
+
 @app.route('/panda')
 def panda_algorithm():
     """Panda算法主页"""
@@ -792,11 +1587,9 @@ def panda_upload():
                 'message': '不支持的文件格式' if get_locale() == 'zh' else 'Unsupported file format'
             }), 400
 
-        # 保存文件到临时目录
-        import os
-        upload_folder = 'uploads'
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
+        # 保存文件到上传目录
+        upload_folder = app.config['UPLOAD_FOLDER']
+        os.makedirs(upload_folder, exist_ok=True)
 
         filename = secure_filename(file.filename)
         file_path = os.path.join(upload_folder, filename)
@@ -825,29 +1618,75 @@ def panda_analyze():
         data = request.get_json()
         privacy_level = data.get('privacy_level', 'high')
         federated_mode = data.get('federated_mode', True)
+        filename = secure_filename(data.get('filename') or '') or None
+        disease_id = data.get('disease_id', 'breast_cancer')
+        if disease_id not in DISEASE_MODELS:
+            return jsonify({'status': 'error', 'message': 'Disease not found'}), 404
 
-        # 模拟分析过程
-        import time
-        time.sleep(2)  # 模拟处理时间
-
-        # 生成模拟结果
         results = {
             'status': 'success',
-            'analysis_id': f'panda_{datetime.now().strftime("%Y%m%d_%H%M%S")}',
+            'analysis_id': new_analysis_id(),
+            'filename': filename,
+            'disease_id': disease_id,
             'privacy_level': privacy_level,
             'federated_mode': federated_mode,
-            'model_performance': {
-                'accuracy': round(np.random.uniform(0.85, 0.95), 3),
-                'precision': round(np.random.uniform(0.80, 0.90), 3),
-                'recall': round(np.random.uniform(0.75, 0.85), 3),
-                'f1_score': round(np.random.uniform(0.78, 0.88), 3)
-            },
-            'training_time': round(np.random.uniform(120, 300), 1),
-            'data_points': np.random.randint(1000, 5000),
-            'features_used': np.random.randint(15, 25),
             'timestamp': datetime.now().isoformat()
         }
 
+        # 上传数据带结局列时，用真实标签评估模型；只有未指定结局列时才退回模拟分析
+        evaluation = None
+        outcome_column = data.get('outcome_column')
+        path = os.path.join(app.config['UPLOAD_FOLDER'], filename) if filename else None
+        if path and filename.lower().endswith('.csv') and os.path.isfile(path):
+            from app.evaluation import EvaluationError, MissingOutcomeError, evaluate_csv
+            try:
+                evaluation = evaluate_csv(path, disease_id, FACTOR_VALIDATORS[disease_id], imputer, outcome_column)
+            except MissingOutcomeError:
+                if outcome_column:
+                    return jsonify({'status': 'error',
+                                    'message': f'Outcome column {outcome_column} not found'}), 400
+            except EvaluationError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
+        elif outcome_column:
+            return jsonify({'status': 'error', 'message': 'outcome_column requires an uploaded CSV file'}), 400
+
+        if evaluation is not None:
+            operating_point = evaluation['confusion']['f1']
+            results.update({
+                'mode': 'evaluation',
+                'model_performance': {
+                    'accuracy': operating_point['accuracy'],
+                    'precision': operating_point['precision'],
+                    'recall': operating_point['recall'],
+                    'f1_score': operating_point['f1_score'],
+                    'auc': evaluation['auc']
+                },
+                'training_time': evaluation['elapsed_seconds'],
+                'data_points': evaluation['rows'],
+                'features_used': len(evaluation['features_used']),
+                'evaluation': evaluation
+            })
+        else:
+            # 模拟分析过程
+            import time
+            import numpy as np
+            time.sleep(2)  # 模拟处理时间
+
+            # 生成模拟结果
+            results.update({
+                'mode': 'simulated',
+                'model_performance': {
+                    'accuracy': round(np.random.uniform(0.85, 0.95), 3),
+                    'precision': round(np.random.uniform(0.80, 0.90), 3),
+                    'recall': round(np.random.uniform(0.75, 0.85), 3),
+                    'f1_score': round(np.random.uniform(0.78, 0.88), 3)
+                },
+                'training_time': round(np.random.uniform(120, 300), 1),
+                'data_points': int(np.random.randint(1000, 5000)),
+                'features_used': int(np.random.randint(15, 25))
+            })
+        analysis_store.save(results)
+
         return jsonify(results)
 
     except Exception as e:
@@ -856,6 +1695,62 @@ def panda_analyze():
             'message': str(e)
         }), 500
 
+def _export_error(message, status=400):
+    return jsonify({'status': 'error', 'message': message}), status
+
+
+CATALOG_EXPORT_COLUMNS = ('id', 'category', 'subcategory', 'record_type', 'source', 'record_date',
+                          'status', 'title', 'uri', 'metadata')
+
+
+@app.route('/api/export/catalog/<category_id>/<subcategory_id>')
+def export_catalog(category_id, subcategory_id):
+    """流式导出多模态数据目录（支持筛选条件和offset续传）"""
+    if catalog.subcategories.get(subcategory_id) != category_id:
+        return _export_error('Subcategory not found', 404)
+    try:
+        fmt, offset = parse_export_args(request.args)
+        rows = catalog.iter_records(
+            subcategory_id, {name: request.args.get(name) for name in ('type', 'source', 'status')},
+            date_from=request.args.get('date_from') or None,
+            date_to=request.args.get('date_to') or None,
+            offset=offset)
+    except (ValueError, CatalogError) as e:
+        return _export_error(str(e))
+    return stream_export(rows, CATALOG_EXPORT_COLUMNS, fmt, offset, f'{category_id}_{subcategory_id}')
+
+
+@app.route('/api/export/uploads/<filename>')
+def export_upload(filename):
+    """流式导出已上传的CSV数据"""
+    filename = secure_filename(filename)
+    path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not filename or not os.path.isfile(path):
+        return _export_error('File not found', 404)
+    if not filename.lower().endswith('.csv'):
+        return _export_error('Only CSV uploads can be exported', 415)
+    try:
+        fmt, offset = parse_export_args(request.args)
+        columns, rows = csv_file_rows(path, offset)
+    except ValueError as e:
+        return _export_error(str(e))
+    return stream_export(rows, columns, fmt, offset, filename.rsplit('.', 1)[0])
+
+
+@app.route('/api/export/analyses/<analysis_id>')
+def export_analysis(analysis_id):
+    """导出Panda分析结果（逐项展开为 key/value 行）"""
+    try:
+        fmt, offset = parse_export_args(request.args)
+        result = analysis_store.load(analysis_id)
+    except ValueError as e:
+        return _export_error(str(e))
+    except KeyError:
+        return _export_error('Analysis not found', 404)
+    rows = itertools.islice(flatten(result), offset, None)
+    return stream_export(rows, ('key', 'value'), fmt, offset, analysis_id)
+
+
 @app.route('/health')
 def health_check():
     """健康检查接口"""
@@ -0,0 +1,43 @@
+"""
+测试环境
+Point every data store of ``run.py`` at a temporary directory before any
+test module imports it, so a test run never writes into ``data/``, and turn
+off its admission control: every test request comes from the same address,
+far faster than one client's limits allow. ``tests/test_admission.py``
+covers admission control on its own app.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+DATA_PATHS = {
+    'HISTORY_DB_PATH': 'prediction_history.db',
+    'CATALOG_DB_PATH': 'catalog.db',
+    'OMICS_DATA_DIR': 'omics',
+    'ANALYSIS_DIR': 'analyses',
+    'UPLOAD_FOLDER': 'uploads',
+    'IMAGING_DATA_DIR': 'imaging',
+    'CHART_CACHE_DIR': 'charts',
+    'IMPUTATION_STATS_PATH': 'imputation.json',
+    'MODEL_DIR': 'models'
+}
+
+_data_dir = tempfile.mkdtemp(prefix='disease-prediction-tests-')
+for name, path in DATA_PATHS.items():
+    os.environ[name] = os.path.join(_data_dir, path)
+
+
+@pytest.fixture(autouse=True)
+def admission_disabled():
+    run = sys.modules.get('run')
+    if run is not None:
+        run.app.config['ADMISSION_ENABLED'] = False
+    yield
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_data_dir, ignore_errors=True)
@@ -0,0 +1,113 @@
+import unittest
+import json
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask, jsonify
+
+from app.admission import DEFAULT_ADMISSION, AdmissionController, ConcurrencyLimiter, TokenBucket, init_app
+
+TEST_ADMISSION = {
+    'max_concurrency': 4,
+    'classes': {
+        'predict': {'routes': ['/predict'], 'rate': 100, 'burst': 100,
+                    'client_rate': 1, 'client_burst': 2, 'max_concurrency': 4, 'max_share': 1.0},
+        'analysis': {'routes': ['/analyze'], 'rate': 100, 'burst': 100,
+                     'client_rate': 100, 'client_burst': 100, 'max_concurrency': 4, 'max_share': 0.5}
+    }
+}
+
+
+class TestAdmission(unittest.TestCase):
+    """准入控制测试类"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['ADMISSION'] = TEST_ADMISSION
+        self.app.add_url_rule('/predict', 'predict', lambda: jsonify({'status': 'success'}))
+        self.app.add_url_rule('/health', 'health', lambda: jsonify({'status': 'healthy'}))
+        init_app(self.app)
+        self.client = self.app.test_client()
+
+    def test_token_bucket(self):
+        """测试令牌桶耗尽后给出重试时间"""
+        bucket = TokenBucket(rate=1, capacity=2)
+        self.assertTrue(bucket.try_acquire()[0])
+        self.assertTrue(bucket.try_acquire()[0])
+        admitted, retry_after = bucket.try_acquire()
+        self.assertFalse(admitted)
+        self.assertGreater(retry_after, 0)
+
+    def get(self, path, address, headers=None):
+        return self.client.get(path, headers=headers, environ_base={'REMOTE_ADDR': address})
+
+    def test_client_over_limit_gets_429(self):
+        """测试超过客户端限额返回429和Retry-After"""
+        statuses = [self.get('/predict', '10.0.0.1').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+        response = self.get('/predict', '10.0.0.1')
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(json.loads(response.data)['status'], 'error')
+
+        # 其他客户端和未分类路由不受影响
+        self.assertEqual(self.get('/predict', '10.0.0.2').status_code, 200)
+        self.assertEqual(self.get('/health', '10.0.0.1').status_code, 200)
+
+    def test_client_header_is_not_trusted(self):
+        """测试客户端自报的标识不能换取新的令牌桶"""
+        statuses = [self.get('/predict', '10.0.0.3', {'X-Client-Id': f'client-{i}'}).status_code for i in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_rejected_requests_are_refunded(self):
+        """测试被全局限额或并发上限拒绝时退还已取的令牌"""
+        config = {'max_concurrency': 1, 'classes': {'predict': {
+            'routes': ['/predict'], 'rate': 0, 'burst': 1, 'client_rate': 0, 'client_burst': 5}}}
+        controller = AdmissionController(config)
+        traffic_class, rejection = controller.admit('/predict', 'a')
+        self.assertIsNone(rejection)
+        self.assertEqual(controller.admit('/predict', 'a')[1][0], 429)
+        self.assertEqual(traffic_class.client_bucket('a').tokens, 4)
+
+        traffic_class.bucket.refund()
+        self.assertEqual(controller.admit('/predict', 'b')[1][0], 503)
+        self.assertEqual(traffic_class.client_bucket('b').tokens, 5)
+        self.assertEqual(traffic_class.bucket.tokens, 1)
+
+    def test_heavy_routes_are_classified(self):
+        """测试应用中所有耗时的接口都受准入控制"""
+        import run
+
+        rules = {rule.rule for rule in run.app.url_map.iter_rules()}
+        classified = {route for config in DEFAULT_ADMISSION['classes'].values() for route in config['routes']}
+        self.assertEqual(classified - rules, set())
+        heavy = {rule for rule in rules if rule.startswith(('/api/predict', '/api/export', '/api/charts', '/panda/'))}
+        heavy |= {'/api/models/<disease_id>/updates', '/api/imaging/<subcategory_id>/ingest',
+                  '/api/omics/<subcategory_id>/<matrix_name>/values'}
+        self.assertEqual(heavy - classified, set())
+
+    def test_low_priority_share(self):
+        """测试低优先级请求不能占满全局并发"""
+        controller = AdmissionController(TEST_ADMISSION)
+        limiter = controller.limiter
+        self.assertTrue(limiter.try_acquire('analysis', 4, 0.5))
+        self.assertTrue(limiter.try_acquire('analysis', 4, 0.5))
+        self.assertFalse(limiter.try_acquire('analysis', 4, 0.5))
+        self.assertTrue(limiter.try_acquire('predict', 4, 1.0))
+        self.assertTrue(limiter.try_acquire('predict', 4, 1.0))
+        self.assertFalse(limiter.try_acquire('predict', 4, 1.0))
+
+        limiter.release('analysis')
+        self.assertEqual(limiter.in_flight, 3)
+
+    def test_concurrency_released_after_request(self):
+        """测试请求结束后释放并发槽位"""
+        self.get('/predict', '10.0.0.4')
+        self.assertEqual(self.app.extensions['admission'].limiter.in_flight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
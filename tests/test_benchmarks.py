@@ -0,0 +1,55 @@
+import unittest
+import io
+import json
+import tempfile
+import sys
+import os
+from contextlib import redirect_stderr, redirect_stdout
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks import __main__ as cli
+from benchmarks.harness import compare, measure
+
+
+class TestBenchmarkHarness(unittest.TestCase):
+    """基准测试框架测试类"""
+
+    def test_measure(self):
+        """测试计时结果字段"""
+        result = measure(lambda: sum(range(10)), samples=5, min_sample_time=0.0001)
+        self.assertGreater(result['ops_per_sec'], 0)
+        self.assertLessEqual(result['p50_us'], result['p99_us'])
+
+    def test_compare_detects_regression(self):
+        """测试超过阈值的退化被检出"""
+        baseline = {'benchmarks': {'a': {'p50_us': 10.0, 'p99_us': 20.0, 'ops_per_sec': 1000.0}}}
+        within = {'a': {'p50_us': 11.0, 'p99_us': 25.0, 'ops_per_sec': 900.0}}
+        slower = {'a': {'p50_us': 15.0, 'p99_us': 20.0, 'ops_per_sec': 700.0}}
+
+        self.assertEqual(compare(within, baseline, threshold=0.2), [])
+        metrics = {r['metric'] for r in compare(slower, baseline, threshold=0.2)}
+        self.assertEqual(metrics, {'p50_us', 'ops_per_sec'})
+
+    def test_missing_baseline_fails(self):
+        """测试比较模式下缺少基线或缺少某个基准的基线时返回2"""
+        results = {'a': {'p50_us': 10.0, 'p99_us': 20.0, 'ops_per_sec': 1000.0}}
+        with tempfile.TemporaryDirectory() as tmpdir, redirect_stdout(io.StringIO()), \
+                redirect_stderr(io.StringIO()) as stderr, \
+                mock.patch.object(cli, 'run_benchmarks', return_value=results) as run_benchmarks:
+            path = os.path.join(tmpdir, 'baseline.json')
+            self.assertEqual(cli.main(['--baseline', path]), 2)
+            run_benchmarks.assert_not_called()
+            self.assertIn('no baseline', stderr.getvalue())
+
+            with open(path, 'w') as f:
+                json.dump({'benchmarks': {}}, f)
+            self.assertEqual(cli.main(['--baseline', path]), 2)
+            self.assertEqual(cli.main(['--baseline', path, '--save']), 0)
+            self.assertEqual(cli.main(['--baseline', path]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
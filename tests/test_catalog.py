@@ -0,0 +1,186 @@
+import unittest
+import tempfile
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import run
+from app.catalog import Catalog, CatalogConflict, CatalogError, decode_cursor
+
+
+def _record(i, **overrides):
+    record = {
+        'subcategory': 'literature',
+        'record_type': 'article' if i % 2 else 'review',
+        'source': f'hospital_{i % 3}',
+        'record_date': f'2024-01-{i % 28 + 1:02d}',
+        'status': ('active', 'processing', 'archived')[i % 3],
+        'title': f'Record {i}'
+    }
+    record.update(overrides)
+    return record
+
+
+class TestCatalog(unittest.TestCase):
+    """多模态数据目录测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.catalog = Catalog(os.path.join(self.tmpdir.name, 'catalog.db'),
+                               {'literature': 'medical_text', 'ct': 'medical_imaging'})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_keyset_pagination_visits_every_record_once(self):
+        """测试键集分页按日期倒序且不重复、不遗漏"""
+        self.catalog.add_records(_record(i) for i in range(95))
+        seen, cursor = [], None
+        while True:
+            records, cursor = self.catalog.list_records('literature', cursor=cursor, limit=20)
+            seen.extend(records)
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 95)
+        self.assertEqual(len({r['id'] for r in seen}), 95)
+        keys = [(r['record_date'], r['id']) for r in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_filters(self):
+        """测试按类型、来源、状态和日期筛选"""
+        self.catalog.add_records(_record(i) for i in range(60))
+        self.catalog.add_records([_record(0, subcategory='ct')])
+        records, _ = self.catalog.list_records(
+            'literature', {'type': 'article', 'source': 'hospital_1'},
+            date_from='2024-01-05', date_to='2024-01-20', limit=500)
+        self.assertTrue(records)
+        for record in records:
+            self.assertEqual(record['record_type'], 'article')
+            self.assertEqual(record['source'], 'hospital_1')
+            self.assertTrue('2024-01-05' <= record['record_date'] <= '2024-01-20')
+            self.assertEqual(record['category'], 'medical_text')
+
+        with self.assertRaises(CatalogError):
+            self.catalog.list_records('literature', {'title': 'x'})
+        with self.assertRaises(CatalogError):
+            self.catalog.list_records('literature', cursor='not-a-cursor')
+
+    def test_filtered_queries_use_indexes(self):
+        """测试筛选查询走复合索引而不是全表扫描"""
+        connection = self.catalog._connection()
+        plan = connection.execute(
+            'EXPLAIN QUERY PLAN SELECT id FROM catalog_records WHERE subcategory = ? AND status = ? '
+            'AND (record_date, id) < (?, ?) ORDER BY record_date DESC, id DESC LIMIT 21',
+            ('literature', 'active', '2024-01-10', 5)).fetchall()
+        detail = ' '.join(row[-1] for row in plan)
+        self.assertIn('idx_catalog_status', detail)
+        self.assertNotIn('TEMP B-TREE', detail)
+
+    def test_summary_counts_follow_changes(self):
+        """测试触发器维护的统计随增删改同步"""
+        ids = self.catalog.add_records(_record(i) for i in range(9))
+        summary = self.catalog.summary('literature')
+        self.assertEqual(summary['total'], 9)
+        self.assertEqual(summary['statuses'], {'active': 3, 'processing': 3, 'archived': 3})
+        self.assertEqual(summary['sources'], 3)
+
+        connection = self.catalog._connection()
+        with connection:
+            connection.execute("UPDATE catalog_records SET status = 'archived' WHERE id = ?", (ids[0],))
+            connection.execute('DELETE FROM catalog_records WHERE id = ?', (ids[1],))
+        summary = self.catalog.summary('literature')
+        self.assertEqual(summary['total'], 8)
+        self.assertEqual(summary['statuses'], {'active': 2, 'processing': 2, 'archived': 4})
+
+    def test_invalid_records_rejected(self):
+        """测试非法记录整批拒绝"""
+        with self.assertRaises(CatalogError):
+            self.catalog.add_records([_record(0), _record(1, status='deleted')])
+        with self.assertRaises(CatalogError):
+            self.catalog.add_records([_record(0, record_date='15/01/2024')])
+        self.assertEqual(self.catalog.summary('literature')['total'], 0)
+
+    def test_duplicate_id_rejected(self):
+        """测试重复的记录编号整批拒绝"""
+        self.catalog.add_records([dict(_record(0), id=7)])
+        with self.assertRaises(CatalogConflict):
+            self.catalog.add_records([_record(1), dict(_record(2), id=7)])
+        self.assertEqual(self.catalog.summary('literature')['total'], 1)
+
+    def test_cursor_roundtrip(self):
+        """测试游标编码"""
+        self.catalog.add_records(_record(i) for i in range(3))
+        _, cursor = self.catalog.list_records('literature', limit=1)
+        self.assertEqual(decode_cursor(cursor)[0], '2024-01-03')
+
+
+class TestCatalogRoutes(unittest.TestCase):
+    """多模态数据目录接口测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.original = run.catalog
+        run.catalog = Catalog(os.path.join(self.tmpdir.name, 'catalog.db'), self.original.subcategories)
+        run.app.config['TESTING'] = True
+        run.app.config['ADMIN_TOKEN'] = 'secret'
+        self.client = run.app.test_client()
+
+    def tearDown(self):
+        run.catalog = self.original
+        run.app.config['ADMIN_TOKEN'] = None
+        self.tmpdir.cleanup()
+
+    def _ingest(self, records, token='secret'):
+        return self.client.post('/api/multimodal/medical_text/literature/records',
+                                json={'records': records}, headers={'X-Admin-Token': token})
+
+    def test_ingest_requires_admin(self):
+        """测试录入需要管理员令牌"""
+        response = self._ingest([_record(0)], token='wrong')
+        self.assertEqual(response.status_code, 403)
+
+    def test_ingest_and_page(self):
+        """测试录入后按游标翻页"""
+        response = self._ingest([_record(i) for i in range(30)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.get_json()['ids']), 30)
+
+        url = '/api/multimodal/medical_text/literature/records'
+        first = self.client.get(url + '?limit=25&status=active').get_json()
+        self.assertEqual(first['summary']['total'], 30)
+        self.assertEqual(len(first['records']), 10)
+        self.assertIsNone(first['next_cursor'])
+
+        page = self.client.get(url + '?limit=25').get_json()
+        rest = self.client.get(url + f"?limit=25&cursor={page['next_cursor']}").get_json()
+        self.assertEqual(len(page['records']) + len(rest['records']), 30)
+
+    def test_bad_requests(self):
+        """测试非法参数和错误分类"""
+        self.assertEqual(self._ingest([_record(0, status='bogus')]).status_code, 400)
+        self.assertEqual(self.client.get(
+            '/api/multimodal/medical_text/literature/records?date_from=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/multimodal/omics_data/literature/records').status_code, 404)
+        self.assertEqual(self._ingest([dict(_record(0), id=5)]).status_code, 201)
+        self.assertEqual(self._ingest([dict(_record(1), id=5)]).status_code, 409)
+        for field, value in (('id', 'abc'), ('id', True), ('id', 2 ** 63), ('title', 5),
+                             ('content', {'x': 1}), ('uri', []), ('metadata', [1])):
+            response = self._ingest([dict(_record(2), **{field: value})])
+            self.assertEqual(response.status_code, 400, field)
+            self.assertIn(field, response.get_json()['message'])
+        self.assertEqual(self._ingest([dict(_record(3), title=None)]).status_code, 201)
+
+    def test_subcategory_page_lists_records(self):
+        """测试子分类页面显示真实记录和统计"""
+        self._ingest([_record(i, title=f'Catalog entry {i}') for i in range(3)])
+        response = self.client.get('/multimodal/medical_text/literature')
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertIn('Catalog entry 2', html)
+        self.assertNotIn('1,234', html)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+import io
+import tempfile
+import sys
+import os
+from unittest import mock
+
+from PIL import Image
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import run
+from app.charts import ChartError, ChartService, RenderError, chart_key
+from app.history import PredictionHistory
+
+
+class TestChartService(unittest.TestCase):
+    """图表渲染服务测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.service = ChartService(self.tmpdir.name, workers=1)
+
+    def tearDown(self):
+        self.service.close()
+        self.tmpdir.cleanup()
+
+    def test_key_is_canonical(self):
+        """测试缓存键与字段顺序无关"""
+        self.assertEqual(chart_key('gauge', {'score': 1.0, 'title': 'a'}),
+                         chart_key('gauge', {'title': 'a', 'score': 1.0}))
+        self.assertNotEqual(chart_key('gauge', {'score': 1.0}), chart_key('gauge', {'score': 1.1}))
+
+    def test_render_once_then_read_from_cache(self):
+        """测试同一图表只渲染一次"""
+        spec = {'items': [['Age', 20.0], ['BMI', -5.0]], 'title': 'Diabetes'}
+        path = self.service.render('contributions', spec)
+        self.assertEqual(Image.open(path).size, (600, 400))
+        self.assertEqual(self.service.render('contributions', dict(spec)), path)
+        self.assertEqual(self.service.rendered, 1)
+
+        self.service.render('gauge', {'score': 75.0})
+        self.service.render('distribution', {'histogram': [5, 3, 0, 1, 0, 0, 2, 0, 0, 1], 'score': 12.0})
+        self.assertEqual(self.service.rendered, 3)
+        self.assertEqual([name for name in os.listdir(os.path.dirname(path)) if name.endswith('.tmp')], [])
+
+    def test_invalid_specs(self):
+        """测试非法图表参数"""
+        for kind, spec in (('pie', {}), ('gauge', {}), ('gauge', {'score': 120}), ('contributions', {'items': []})):
+            with self.assertRaises(ChartError):
+                self.service.render(kind, spec)
+        self.assertEqual(self.service.rendered, 0)
+
+    def test_render_failures(self):
+        """测试工作进程出错或超时时抛出RenderError"""
+        with self.assertRaises(RenderError) as context:
+            self.service.render('contributions', {'items': [['Age', 'high']]})
+        self.assertFalse(context.exception.timed_out)
+
+        slow = ChartService(self.tmpdir.name, workers=1, timeout=0.001)
+        self.addCleanup(slow.close)
+        with self.assertRaises(RenderError) as context:
+            slow.render('gauge', {'score': 10.0})
+        self.assertTrue(context.exception.timed_out)
+
+
+class TestChartRoutes(unittest.TestCase):
+    """图表接口测试类"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.original = run.chart_service, run.prediction_history
+        run.chart_service = ChartService(os.path.join(cls.tmpdir.name, 'charts'), workers=1)
+        run.prediction_history = PredictionHistory(os.path.join(cls.tmpdir.name, 'history.db'))
+        run.app.config['TESTING'] = True
+
+    @classmethod
+    def tearDownClass(cls):
+        run.chart_service.close()
+        run.prediction_history.close()
+        run.chart_service, run.prediction_history = cls.original
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        self.client = run.app.test_client()
+
+    def test_gauge(self):
+        """测试仪表图及缓存头"""
+        response = self.client.get('/api/charts/diabetes/gauge.png?score=42.04')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        etag = response.headers['ETag']
+        # 四舍五入到一位小数后命中同一缓存
+        again = self.client.get('/api/charts/diabetes/gauge.png?score=42.01', headers={'If-None-Match': etag})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.client.get('/api/charts/diabetes/gauge.png').status_code, 400)
+        self.assertEqual(self.client.get('/api/charts/diabetes/gauge.png?score=-3').status_code, 400)
+        self.assertEqual(self.client.get('/api/charts/unknown/gauge.png?score=3').status_code, 404)
+
+    def test_contributions(self):
+        """测试风险因素贡献图"""
+        response = self.client.post('/api/charts/lung_cancer/contributions.png',
+                                    json={'factors': {'age': 65, 'smoking_years': 30, 'smoking_amount': 20}})
+        self.assertEqual(response.status_code, 200)
+        Image.open(io.BytesIO(response.get_data())).verify()
+        response = self.client.post('/api/charts/lung_cancer/contributions.png', json={'factors': {'age': 'old'}})
+        self.assertEqual(response.status_code, 400)
+
+    def test_contributions_are_deterministic(self):
+        """测试Panda评分的贡献图不含随机调整，重复请求命中同一缓存"""
+        factors = {'age': 55, 'gender': 0, 'family_history': 1, 'brca_mutation': 1}
+        etags = {self.client.post('/api/charts/breast_cancer/contributions.png',
+                                  json={'factors': factors}).headers['ETag'] for _ in range(3)}
+        self.assertEqual(len(etags), 1)
+
+    def test_render_errors(self):
+        """测试渲染失败返回503，超时返回504"""
+        for error, status in ((RenderError('chart worker exited'), 503), (RenderError('slow', timed_out=True), 504)):
+            with mock.patch.object(run.chart_service, 'render', side_effect=error):
+                response = self.client.get('/api/charts/diabetes/gauge.png?score=10')
+            self.assertEqual(response.status_code, status)
+            self.assertEqual(response.get_json()['status'], 'error')
+
+    def test_distribution(self):
+        """测试人群风险分布图"""
+        self.assertEqual(self.client.get('/api/charts/diabetes/distribution.png').status_code, 404)
+        for score in (12.0, 35.0, 36.0, 81.0):
+            run.prediction_history.record('diabetes', {'age': 50}, score, run.get_risk_level(score)[0])
+        run.prediction_history.flush()
+        response = self.client.get('/api/charts/diabetes/distribution.png?score=36')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/charts/diabetes/distribution.png?from=bad').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import asyncio
+import json
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import httpx
+
+from client import AsyncPredictionClient, PredictionAPIError, PredictionClient, PredictionError
+from run import app
+
+
+class TestPredictionClient(unittest.TestCase):
+    """同步客户端测试类"""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = PredictionClient('http://testserver', batch_size=2,
+                                       transport=httpx.WSGITransport(app=app))
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_predict(self):
+        """测试单条预测"""
+        result = self.client.predict('diabetes', {'age': 65, 'bmi': 32, 'family_history': 1})
+        self.assertEqual(result.disease_id, 'diabetes')
+        self.assertIn(result.risk_level, ('low', 'medium', 'high'))
+
+    def test_predict_invalid(self):
+        """测试非法输入抛出异常"""
+        with self.assertRaises(PredictionAPIError) as context:
+            self.client.predict('diabetes', {'age': 500})
+        self.assertEqual(context.exception.error.status_code, 400)
+
+    def test_predict_many_uses_batch_endpoint(self):
+        """测试分块提交到批量接口并保持顺序"""
+        records = [{'age': 30 + i} for i in range(5)] + [{'age': 500}]
+        outcomes = self.client.predict_many('diabetes', records)
+        self.assertTrue(self.client.batch_supported)
+        self.assertEqual([o.index for o in outcomes], list(range(6)))
+        self.assertIsInstance(outcomes[-1], PredictionError)
+
+
+    def test_retries_only_unprocessed_requests(self):
+        """测试只重试429与发送前的连接错误，不重试可能已被处理的请求"""
+        failures = []
+
+        def handler(request):
+            failure = failures.pop(0) if failures else None
+            if isinstance(failure, Exception):
+                raise failure
+            if failure:
+                return httpx.Response(failure, headers={'Retry-After': '0'})
+            return httpx.Response(200, json={'risk_score': 10, 'risk_level': 'low'})
+
+        with PredictionClient('http://testserver', backoff_factor=0,
+                              transport=httpx.MockTransport(handler)) as client:
+            failures[:] = [httpx.ConnectError('refused'), 429]
+            self.assertEqual(client.predict('diabetes', {'age': 40}).risk_score, 10.0)
+            for failure in (502, 503, 504):
+                failures[:] = [failure]
+                with self.assertRaises(PredictionAPIError) as context:
+                    client.predict('diabetes', {'age': 40})
+                self.assertEqual(context.exception.error.status_code, failure)
+            failures[:] = [httpx.ReadTimeout('timed out')]
+            with self.assertRaises(httpx.ReadTimeout):
+                client.predict('diabetes', {'age': 40})
+            self.assertEqual(failures, [])
+
+
+class TestAsyncPredictionClient(unittest.TestCase):
+    """异步客户端测试类"""
+
+    def test_fallback_without_batch_endpoint(self):
+        """测试服务器不支持批量接口时逐条请求，并重试429"""
+        calls = {'single': 0, 'unavailable': 1}
+
+        def handler(request):
+            if request.url.path.endswith('/batch'):
+                return httpx.Response(404, text='Not Found', headers={'content-type': 'text/html'})
+            if calls['unavailable']:
+                calls['unavailable'] -= 1
+                return httpx.Response(429, headers={'Retry-After': '0'})
+            calls['single'] += 1
+            factors = json.loads(request.content)['factors']
+            return httpx.Response(200, json={
+                'risk_score': factors['age'], 'risk_level': 'low',
+                'risk_level_zh': '低风险', 'risk_level_en': 'Low Risk'
+            })
+
+        async def run_client():
+            async with AsyncPredictionClient('http://testserver',
+                                             transport=httpx.MockTransport(handler)) as client:
+                return client, await client.predict_many('diabetes', [{'age': 40}, {'age': 50}])
+
+        client, outcomes = asyncio.run(run_client())
+        self.assertFalse(client.batch_supported)
+        self.assertEqual([o.risk_score for o in outcomes], [40.0, 50.0])
+        self.assertEqual(calls['single'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import sys
+import os
+from unittest import mock
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import run
+from app import disease_graph
+from app.imputation import Imputer
+from app.scoring import Features, score_columns
+
+
+class TestDiseaseGraph(unittest.TestCase):
+    """多疾病依赖评估测试类"""
+
+    def setUp(self):
+        self.imputer = Imputer(run.DISEASE_MODELS)
+
+    def columns(self, **fields):
+        n = len(next(iter(fields.values())))
+        return {field: np.array(values, dtype=np.float64) for field, values in fields.items()}, n
+
+    def test_evaluation_order(self):
+        """测试上游疾病先于下游疾病评估"""
+        self.assertEqual(disease_graph.evaluation_order(['stroke']), ['diabetes', 'stroke'])
+        self.assertEqual(disease_graph.evaluation_order(['diabetes', 'stroke', 'copd']),
+                         ['diabetes', 'stroke', 'copd'])
+        cycle = {('stroke', 'diabetes'): ('diabetes', None), ('diabetes', 'stroke'): ('stroke', None)}
+        with mock.patch.dict(disease_graph.DEPENDENCIES, cycle):
+            with self.assertRaises(ValueError):
+                disease_graph.evaluation_order(['stroke'])
+
+    def test_upstream_prediction_feeds_input(self):
+        """测试糖尿病预测结果填充卒中的糖尿病因子"""
+        values, n = self.columns(age=[70, 30, 70], bmi=[32, 20, 32], waist_circumference=[100, 70, 100],
+                                 systolic_bp=[150, 110, 150], family_history=[1, 0, 1],
+                                 diabetes=[np.nan, np.nan, 0])
+        result = disease_graph.evaluate(run.DISEASE_MODELS, self.imputer, ['stroke'], values, n)
+        self.assertEqual(result['order'], ['diabetes', 'stroke'])
+        self.assertEqual(result['scores']['diabetes'][0], 100)
+        # 高风险视为患病；客户端提供的值保持不变
+        np.testing.assert_array_equal(values['diabetes'], [1, 0, 0])
+        np.testing.assert_array_equal(result['derived']['stroke']['diabetes'], [True, True, False])
+        self.assertNotIn('diabetes', result['imputed']['stroke'])
+
+    def test_shared_imputation(self):
+        """测试同一患者的缺失因子在各疾病中取同一值"""
+        self.imputer.fit('diabetes', {'age': np.linspace(20, 80, 500), 'bmi': np.linspace(18, 30, 500)})
+        values, n = self.columns(age=[50, 60], gender=[1, 0])
+        result = disease_graph.evaluate(run.DISEASE_MODELS, self.imputer, ['diabetes', 'hypertension'], values, n)
+        self.assertFalse(np.isnan(values['bmi']).any())
+        self.assertTrue(result['imputed']['diabetes']['bmi'].all())
+        self.assertTrue(result['imputed']['hypertension']['bmi'].all())
+        self.assertFalse(result['imputed']['hypertension']['age'].any())
+        # 没有参考数据的因子保持缺失
+        self.assertTrue(np.isnan(values['waist_circumference']).all())
+        self.assertFalse(result['imputed']['diabetes']['waist_circumference'].any())
+        expected = score_columns('diabetes', {field: values[field] for field in values})
+        np.testing.assert_array_equal(result['scores']['diabetes'], expected)
+
+    def test_features_are_memoized(self):
+        """测试派生特征与清洗后的列只计算一次"""
+        values, _ = self.columns(age=[40, 70], smoking_years=[10, 40], smoking_amount=[20, 30], bmi=[22, 29])
+        features = Features(values)
+        score_columns('lung_cancer', features)
+        computed = features.computed
+        score_columns('lung_cancer', features)
+        score_columns('copd', features)
+        self.assertEqual(features.computed, computed)
+        np.testing.assert_array_equal(features['pack_years'], [10, 60])
+        np.testing.assert_array_equal(features['bmi_band'], [1, 3])
+        np.testing.assert_array_equal(features['age_band'], [1, 3])
+
+
+class TestMultiPredictRoute(unittest.TestCase):
+    """多疾病联合预测接口测试类"""
+
+    FACTORS = {'age': 60, 'gender': 1, 'bmi': 31, 'waist_circumference': 100, 'systolic_bp': 150,
+               'family_history': 1, 'smoking_years': 20, 'smoking_amount': 20}
+
+    def setUp(self):
+        run.app.config['TESTING'] = True
+        self.client = run.app.test_client()
+
+    def test_single_patient(self):
+        """测试单个患者的多疾病预测"""
+        data = self.client.post('/api/predict/multi',
+                                json={'factors': self.FACTORS, 'diseases': ['stroke', 'lung_cancer']}).get_json()
+        self.assertEqual(data['evaluation_order'], ['diabetes', 'stroke', 'lung_cancer'])
+        self.assertEqual(set(data['results']), {'stroke', 'lung_cancer'})
+        self.assertEqual(data['results']['stroke']['derived_fields'], ['diabetes'])
+        self.assertEqual(data['results']['lung_cancer']['risk_score'],
+                         run.calculate_lung_cancer_risk(dict(self.FACTORS, occupational_exposure=0)))
+        self.assertEqual(data['features'], {'pack_years': 20.0, 'bmi_band': 'obese', 'age_band': '60-74'})
+
+    def test_batch(self):
+        """测试批量多疾病预测"""
+        data = self.client.post('/api/predict/multi', json={'records': [self.FACTORS, {'age': 'old'}, {'age': 30}]})
+        data = data.get_json()
+        self.assertEqual(data['error_count'], 1)
+        self.assertEqual(data['results'][1]['status'], 'error')
+        self.assertEqual(set(data['results'][2]['results']), set(run.DISEASE_MODELS))
+
+    def test_invalid_requests(self):
+        """测试非法请求"""
+        self.assertEqual(self.client.post('/api/predict/multi', json={'factors': {}}).status_code, 400)
+        self.assertEqual(self.client.post('/api/predict/multi', json={'factors': {'age': 500}}).status_code, 400)
+        self.assertEqual(self.client.post('/api/predict/multi',
+                                          json={'factors': {'age': 50}, 'diseases': ['flu']}).status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import unittest
+import tempfile
+import sys
+import os
+from unittest import mock
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import run
+from app.analyses import AnalysisStore
+from app.evaluation import EvaluationError, StreamingEvaluator, evaluate_csv
+from app.imputation import Imputer
+from app.scoring import score_columns
+
+
+def brute_force_auc(scores, labels):
+    """两两比较计算AUC（并列计0.5）"""
+    positive = scores[labels == 1][:, None]
+    negative = scores[labels == 0][None, :]
+    return ((positive > negative).sum() + 0.5 * (positive == negative).sum()) / (positive.size * negative.size)
+
+
+def write_cohort(path, n, seed=0):
+    """按糖尿病评分生成带结局列的队列，部分BMI缺失"""
+    rng = np.random.default_rng(seed)
+    columns = {'age': rng.integers(20, 80, n), 'bmi': rng.integers(18, 40, n),
+               'waist_circumference': rng.integers(60, 120, n), 'systolic_bp': rng.integers(100, 170, n),
+               'family_history': rng.integers(0, 2, n), 'physical_activity': rng.integers(0, 3, n)}
+    values = {field: column.astype(np.float64) for field, column in columns.items()}
+    scores = score_columns('diabetes', values)
+    outcome = (rng.random(n) < scores / 100).astype(int)
+    with open(path, 'w') as f:
+        f.write(','.join(columns) + ',outcome\n')
+        for i in range(n):
+            row = [str(columns[field][i]) for field in columns]
+            if i % 10 == 0:
+                row[1] = ''
+            f.write(','.join(row) + f',{outcome[i]}\n')
+    return values, outcome
+
+
+class TestStreamingEvaluator(unittest.TestCase):
+    """流式评估测试类"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.labels = (rng.random(5000) < 0.3).astype(np.float64)
+        self.scores = np.round(np.clip(rng.normal(40 + 25 * self.labels, 15), 0, 100), 1)
+
+    def test_matches_brute_force(self):
+        """测试分块累计结果与逐阈值计算一致"""
+        evaluator = StreamingEvaluator()
+        for start in range(0, 5000, 700):
+            evaluator.update(self.scores[start:start + 700], self.labels[start:start + 700])
+        result = evaluator.result()
+        self.assertEqual(result['rows'], 5000)
+        self.assertAlmostEqual(result['auc'], brute_force_auc(self.scores, self.labels), places=4)
+
+        for threshold in (30, 70, result['suggested_thresholds']['f1']):
+            predicted = self.scores >= threshold
+            confusion = evaluator.confusion(threshold)
+            self.assertEqual(confusion['tp'], int((predicted & (self.labels == 1)).sum()))
+            self.assertEqual(confusion['fp'], int((predicted & (self.labels == 0)).sum()))
+        self.assertEqual(result['confusion']['current_high'], evaluator.confusion(70))
+
+        brier = np.mean((self.scores / 100 - self.labels) ** 2)
+        self.assertAlmostEqual(result['brier_score'], brier, places=4)
+        self.assertEqual(sum(b['count'] for b in result['calibration']), 5000)
+        self.assertEqual(len(result['roc_curve']['fpr']), 101)
+
+    def test_suggested_thresholds(self):
+        """测试建议阈值满足敏感度与特异度目标"""
+        evaluator = StreamingEvaluator()
+        evaluator.update(self.scores, self.labels)
+        cutoffs = evaluator.result()['suggested_thresholds']
+        self.assertGreaterEqual(evaluator.confusion(cutoffs['low_medium'])['recall'], 0.9)
+        self.assertLess(evaluator.confusion(cutoffs['low_medium'] + 0.1)['recall'], 0.9)
+        self.assertGreaterEqual(evaluator.confusion(cutoffs['medium_high'])['specificity'], 0.9)
+        self.assertLessEqual(cutoffs['low_medium'], cutoffs['medium_high'])
+
+    def test_single_class(self):
+        """测试只有一种结局时报错"""
+        evaluator = StreamingEvaluator()
+        evaluator.update([10, 20], [0, 0])
+        with self.assertRaises(EvaluationError):
+            evaluator.result()
+
+
+class TestEvaluateCsv(unittest.TestCase):
+    """CSV分块评估测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'cohort.csv')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_chunked_matches_single_pass(self):
+        """测试小分块与一次读取结果一致"""
+        write_cohort(self.path, 3000)
+        imputer = Imputer(run.DISEASE_MODELS)
+        validator = run.FACTOR_VALIDATORS['diabetes']
+        chunked = evaluate_csv(self.path, 'diabetes', validator, imputer, chunk_rows=257)
+        whole = evaluate_csv(self.path, 'diabetes', validator, imputer)
+        for key in ('rows', 'auc', 'brier_score', 'suggested_thresholds', 'confusion'):
+            self.assertEqual(chunked[key], whole[key])
+        self.assertEqual(chunked['outcome_column'], 'outcome')
+        self.assertEqual(chunked['rows'], 3000)
+        self.assertGreater(chunked['auc'], 0.6)
+
+
+class TestPandaAnalyzeEvaluation(unittest.TestCase):
+    """Panda分析接口真实评估测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.original = run.analysis_store, run.app.config['UPLOAD_FOLDER']
+        run.analysis_store = AnalysisStore(os.path.join(self.tmpdir.name, 'analyses'))
+        run.app.config['UPLOAD_FOLDER'] = self.tmpdir.name
+        run.app.config['ADMISSION_ENABLED'] = False
+        run.app.config['TESTING'] = True
+        self.client = run.app.test_client()
+
+    def tearDown(self):
+        run.analysis_store, run.app.config['UPLOAD_FOLDER'] = self.original
+        run.app.config['ADMISSION_ENABLED'] = True
+        self.tmpdir.cleanup()
+
+    def test_labelled_upload_is_evaluated(self):
+        """测试带结局列的上传数据返回真实指标且不等待"""
+        write_cohort(os.path.join(self.tmpdir.name, 'cohort.csv'), 1000)
+        with mock.patch('time.sleep') as sleep:
+            data = self.client.post('/panda/analyze', json={'filename': 'cohort.csv',
+                                                            'disease_id': 'diabetes'}).get_json()
+        sleep.assert_not_called()
+        self.assertEqual(data['mode'], 'evaluation')
+        self.assertEqual(data['data_points'], 1000)
+        self.assertEqual(data['features_used'], 6)
+        self.assertEqual(data['model_performance']['f1_score'], data['evaluation']['confusion']['f1']['f1_score'])
+        self.assertIn('medium_high', data['evaluation']['suggested_thresholds'])
+        self.assertEqual(run.analysis_store.load(data['analysis_id'])['mode'], 'evaluation')
+
+    def test_unlabelled_upload_is_simulated(self):
+        """测试无结局列时保持模拟分析"""
+        with open(os.path.join(self.tmpdir.name, 'plain.csv'), 'w') as f:
+            f.write('age,bmi\n40,22\n')
+        with mock.patch('time.sleep'):
+            data = self.client.post('/panda/analyze', json={'filename': 'plain.csv'}).get_json()
+        self.assertEqual(data['mode'], 'simulated')
+
+    def test_single_class_outcome(self):
+        """测试结局只有一类时返回400"""
+        with open(os.path.join(self.tmpdir.name, 'one.csv'), 'w') as f:
+            f.write('age,bmi,outcome\n40,22,0\n50,30,0\n')
+        response = self.client.post('/panda/analyze', json={'filename': 'one.csv', 'disease_id': 'diabetes'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_requested_outcome_column_must_exist(self):
+        """测试指定的结局列不存在时返回400而不退回模拟分析"""
+        write_cohort(os.path.join(self.tmpdir.name, 'cohort.csv'), 100)
+        with mock.patch('time.sleep') as sleep:
+            response = self.client.post('/panda/analyze', json={'filename': 'cohort.csv', 'disease_id': 'diabetes',
+                                                                'outcome_column': 'diagnosed'})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('diagnosed', response.get_json()['message'])
+            response = self.client.post('/panda/analyze', json={'outcome_column': 'outcome'})
+            self.assertEqual(response.status_code, 400)
+        sleep.assert_not_called()
+
+    def test_unreadable_csv(self):
+        """测试无法解析的CSV返回400"""
+        with open(os.path.join(self.tmpdir.name, 'broken.csv'), 'w') as f:
+            f.write('age,bmi,outcome\n40,"22,0\n50,30,1\n')
+        with open(os.path.join(self.tmpdir.name, 'binary.csv'), 'wb') as f:
+            f.write(b'\xff\xfe\x00age\x00,\x00\x81\n')
+        for filename in ('broken.csv', 'binary.csv'):
+            response = self.client.post('/panda/analyze', json={'filename': filename, 'disease_id': 'diabetes'})
+            self.assertEqual(response.status_code, 400, filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+import csv
+import io
+import json
+import tempfile
+import sys
+import os
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import run
+from app import exports
+from app.analyses import AnalysisStore
+from app.catalog import Catalog
+
+
+class TestExportFormats(unittest.TestCase):
+    """导出格式测试类"""
+
+    def setUp(self):
+        self.rows = [{'a': i, 'b': f'row {i}', 'c': {'nested': i}} for i in range(2500)]
+
+    def test_csv_is_chunked(self):
+        """测试CSV分块输出且内容完整"""
+        original = exports.CHUNK_BYTES
+        exports.CHUNK_BYTES = 1024
+        try:
+            chunks = list(exports.iter_csv(iter(self.rows), ('a', 'b', 'c')))
+        finally:
+            exports.CHUNK_BYTES = original
+        self.assertGreater(len(chunks), 10)
+        parsed = list(csv.reader(io.StringIO(''.join(chunks))))
+        self.assertEqual(parsed[0], ['a', 'b', 'c'])
+        self.assertEqual(parsed[-1], ['2499', 'row 2499', '{"nested":2499}'])
+
+    def test_ndjson_and_columnar(self):
+        """测试NDJSON与列式批次"""
+        lines = ''.join(exports.iter_ndjson(self.rows, ('a',))).splitlines()
+        self.assertEqual(len(lines), 2500)
+        self.assertEqual(json.loads(lines[3]), {'a': 3})
+
+        batches = [json.loads(line) for line in exports.iter_columnar(iter(self.rows[500:]), ('a',), offset=500)]
+        self.assertEqual([b['offset'] for b in batches], [500, 1500])
+        self.assertEqual(batches[1]['columns']['a'][0], 1500)
+
+    def test_flatten(self):
+        """测试分析结果展开"""
+        rows = list(exports.flatten({'x': {'y': 1, 'z': [1, 2]}, 'folds': [{'auc': 0.9}]}))
+        self.assertEqual(rows, [{'key': 'x.y', 'value': 1}, {'key': 'x.z', 'value': [1, 2]},
+                                {'key': 'folds[0].auc', 'value': 0.9}])
+
+
+class TestExportRoutes(unittest.TestCase):
+    """导出接口测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.original = run.catalog, run.analysis_store, run.app.config['UPLOAD_FOLDER']
+        run.catalog = Catalog(os.path.join(self.tmpdir.name, 'catalog.db'), self.original[0].subcategories)
+        run.analysis_store = AnalysisStore(os.path.join(self.tmpdir.name, 'analyses'))
+        run.app.config['UPLOAD_FOLDER'] = self.tmpdir.name
+        run.app.config['TESTING'] = True
+        self.client = run.app.test_client()
+
+    def tearDown(self):
+        run.catalog, run.analysis_store, run.app.config['UPLOAD_FOLDER'] = self.original
+        self.tmpdir.cleanup()
+
+    def test_catalog_export_resumes_by_offset(self):
+        """测试目录导出及按offset续传"""
+        run.catalog.add_records({'subcategory': 'genomics', 'record_type': 'vcf', 'source': f'lab{i % 2}',
+                                 'record_date': f'2024-02-{i % 28 + 1:02d}', 'title': f'Sample {i}'}
+                                for i in range(2300))
+        url = '/api/export/catalog/omics_data/genomics'
+        response = self.client.get(url + '?format=csv')
+        self.assertTrue(response.is_streamed)
+        full = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(len(full), 2301)
+
+        resumed = self.client.get(url + '?format=csv&offset=1500')
+        self.assertEqual(resumed.headers['X-Export-Offset'], '1500')
+        tail = list(csv.reader(io.StringIO(resumed.get_data(as_text=True))))
+        self.assertEqual(full[:1501] + tail, full)
+
+        lines = self.client.get(url + '?format=ndjson&source=lab1').get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 1150)
+        self.assertEqual(self.client.get(url + '?format=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/export/catalog/omics_data/ct').status_code, 404)
+
+    def test_upload_export(self):
+        """测试上传CSV导出"""
+        with open(os.path.join(self.tmpdir.name, 'cohort.csv'), 'w', newline='') as f:
+            f.write('age,bmi\n40,22.5\n50,\n60,31\n')
+        data = self.client.get('/api/export/uploads/cohort.csv?format=ndjson&offset=1').get_data(as_text=True)
+        self.assertEqual([json.loads(line) for line in data.splitlines()],
+                         [{'age': '50', 'bmi': ''}, {'age': '60', 'bmi': '31'}])
+        self.assertEqual(self.client.get('/api/export/uploads/missing.csv').status_code, 404)
+
+    def test_undecodable_upload_rejected(self):
+        """测试非UTF-8的上传文件在开始流式响应前返回400"""
+        for name, content in (('header.csv', b'\xffage,bmi\n40,22\n'),
+                              ('body.csv', b'age,bmi\n40,22\n' * 5000 + b'50,\xe9\n')):
+            with open(os.path.join(self.tmpdir.name, name), 'wb') as f:
+                f.write(content)
+            response = self.client.get(f'/api/export/uploads/{name}?format=csv')
+            self.assertEqual(response.status_code, 400, name)
+            self.assertEqual(response.get_json()['message'], 'file is not UTF-8 encoded text')
+
+    def test_analysis_results_are_saved_and_exported(self):
+        """测试分析结果保存后可导出"""
+        run.app.config['ADMISSION_ENABLED'] = False
+        try:
+            # 跳过分析接口中的模拟等待
+            with mock.patch('time.sleep'):
+                analysis = self.client.post('/panda/analyze', json={'privacy_level': 'high'}).get_json()
+        finally:
+            run.app.config['ADMISSION_ENABLED'] = True
+
+        response = self.client.get(f"/api/export/analyses/{analysis['analysis_id']}?format=csv")
+        rows = dict(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(rows['privacy_level'], 'high')
+        self.assertIn('model_performance.accuracy', rows)
+        self.assertEqual(self.client.get('/api/export/analyses/panda_20240101_000000_abcdef').status_code, 404)
+        self.assertEqual(self.client.get('/api/export/analyses/..').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import sqlite3
+import tempfile
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import rollups
+from app.history import PredictionHistory
+
+
+class TestPredictionHistory(unittest.TestCase):
+    """预测历史记录测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'history.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_batched_write_and_flush(self):
+        """测试记录被批量写入并可查询"""
+        history = PredictionHistory(self.path, batch_size=7)
+        for i in range(20):
+            self.assertTrue(history.record('diabetes', {'age': 40 + i}, 10.0 + i, 'low'))
+        history.record('lung_cancer', {'age': 60}, 75.0, 'high')
+        history.flush()
+
+        self.assertEqual(history.written, 21)
+        recent = history.recent('diabetes', limit=5)
+        self.assertEqual(len(recent), 5)
+        self.assertEqual(recent[0]['factors'], {'age': 59})
+        history.close()
+
+    def test_wal_and_indexes(self):
+        """测试数据库使用WAL模式并建立索引"""
+        history = PredictionHistory(self.path)
+        history.record('diabetes', {'age': 40}, 10.0, 'low')
+        history.close()
+
+        connection = sqlite3.connect(self.path)
+        self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        indexes = {row[1] for row in connection.execute("PRAGMA index_list('predictions')")}
+        self.assertIn('idx_predictions_disease_created', indexes)
+        self.assertEqual(connection.execute('SELECT COUNT(*) FROM predictions').fetchone()[0], 1)
+        connection.close()
+
+    def test_full_queue_drops(self):
+        """测试队列满时丢弃记录而不阻塞"""
+        history = PredictionHistory(self.path, max_queue=1)
+        queue = history._ensure_writer()
+        queue.put(('diabetes', 1.0, 'low', {}, 0.0))
+        # 写线程可能已经取走了上一条，持续写入直到队列满
+        results = [history.record('diabetes', {}, 1.0, 'low') for _ in range(1000)]
+        self.assertIn(False, results)
+        self.assertGreater(history.dropped, 0)
+        history.close()
+
+
+class TestRollups(unittest.TestCase):
+    """预测结果汇总测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.history = PredictionHistory(os.path.join(self.tmpdir.name, 'history.db'), batch_size=3)
+
+    def tearDown(self):
+        self.history.close()
+        self.tmpdir.cleanup()
+
+    def test_age_band(self):
+        """测试年龄分段"""
+        self.assertEqual(rollups.age_band(29.9), '18-29')
+        self.assertEqual(rollups.age_band(45), '45-59')
+        self.assertEqual(rollups.age_band(90), '75+')
+        self.assertEqual(rollups.age_band(None), 'unknown')
+
+    def test_rollups_updated_incrementally(self):
+        """测试汇总表随记录增量更新"""
+        for age, score, level in [(25, 10, 'low'), (50, 40, 'medium'), (52, 60, 'medium'), (70, 90, 'high')]:
+            self.history.record('diabetes', {'age': age}, score, level)
+        self.history.record('lung_cancer', {}, 20, 'low')
+        self.history.flush()
+
+        groups = self.history.rollup(disease_id='diabetes', group_by=['risk_level'])
+        medium = next(g for g in groups if g['risk_level'] == 'medium')
+        self.assertEqual(medium['count'], 2)
+        self.assertEqual(medium['mean_score'], 50.0)
+        self.assertEqual(medium['histogram'][4], 1)
+        self.assertEqual(medium['histogram'][6], 1)
+
+        by_band = self.history.rollup(group_by=['disease_id', 'age_band'])
+        self.assertIn({'disease_id': 'lung_cancer', 'age_band': 'unknown'},
+                      [{'disease_id': g['disease_id'], 'age_band': g['age_band']} for g in by_band])
+
+        total = self.history.rollup(group_by=[])
+        self.assertEqual(total[0]['count'], 5)
+
+    def test_rebuild_matches_incremental(self):
+        """测试从原始记录重建的汇总与增量结果一致"""
+        for i in range(10):
+            self.history.record('diabetes', {'age': 20 + i * 7}, i * 9.5, 'low' if i < 3 else 'high')
+        self.history.flush()
+        before = self.history.rollup(group_by=list(rollups.GROUP_COLUMNS))
+
+        rollups.rebuild(self.history._reader())
+        self.assertEqual(self.history.rollup(group_by=list(rollups.GROUP_COLUMNS)), before)
+
+    def test_invalid_group_by(self):
+        """测试非法分组字段"""
+        with self.assertRaises(ValueError):
+            self.history.rollup(group_by=['factors'])
+
+
+if __name__ == '__main__':
+    unittest.main()
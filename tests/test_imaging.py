@@ -0,0 +1,158 @@
+import unittest
+import io
+import tempfile
+import threading
+import sys
+import os
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import run
+from app import imaging
+from app.imaging import ImagingError, ImagingStore, level_shapes
+
+
+class TestImagingStore(unittest.TestCase):
+    """影像预览金字塔测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ImagingStore(os.path.join(self.tmpdir.name, 'store'), workers=2)
+        rng = np.random.default_rng(0)
+        # 20个切片，多于单个任务的切片数，会经过进程池
+        self.volume = rng.integers(-1000, 2000, size=(20, 300, 260)).astype(np.int16)
+        self.source = os.path.join(self.tmpdir.name, 'ct.npy')
+        np.save(self.source, self.volume)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_level_shapes(self):
+        """测试金字塔各层尺寸"""
+        self.assertEqual(level_shapes(300, 260), [(300, 260), (150, 130), (75, 65)])
+        self.assertEqual(level_shapes(50, 40), [(50, 40)])
+
+    def test_ingest_builds_pyramid_once(self):
+        """测试构建金字塔并按内容去重"""
+        manifest = self.store.ingest(self.source, 'ct')
+        self.assertEqual(manifest['slices'], 20)
+        self.assertEqual(len(manifest['levels']), 3)
+        path = self.store.path(manifest['digest'])
+        level = np.load(os.path.join(path, 'level_2.npy'), mmap_mode='r')
+        self.assertEqual(level.shape, (20, 75, 65))
+        self.assertEqual(len(os.listdir(os.path.join(path, 'thumbs'))), 20)
+
+        # 同一内容再次导入直接返回
+        copy = os.path.join(self.tmpdir.name, 'copy.npy')
+        np.save(copy, self.volume)
+        self.assertEqual(self.store.ingest(copy)['digest'], manifest['digest'])
+
+    def test_concurrent_ingests_of_same_volume(self):
+        """测试并发导入同一内容时各自暂存，结果完整"""
+        source = os.path.join(self.tmpdir.name, 'xray.npy')
+        np.save(source, self.volume[0])
+        barrier = threading.Barrier(2, timeout=10)
+        build = imaging._build_slices
+
+        def build_together(*args):
+            # 两个导入都建好暂存目录后才开始写入
+            barrier.wait()
+            build(*args)
+
+        results = []
+        with mock.patch.object(imaging, '_build_slices', build_together):
+            threads = [threading.Thread(target=lambda: results.append(self.store.ingest(source)))
+                       for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]['digest'], results[1]['digest'])
+        path = self.store.path(results[0]['digest'])
+        self.assertEqual(sorted(os.listdir(os.path.dirname(path))), [results[0]['digest']])
+        self.assertEqual(self.store.manifest(results[0]['digest'])['slices'], 1)
+        self.assertTrue(self.store.slice_png(results[0]['digest'], 0, 0))
+
+    def test_downsampling_matches_mean_pooling(self):
+        """测试下采样为窗口化后的2x2均值"""
+        manifest = self.store.ingest(self.source)
+        low, high = manifest['window']
+        windowed = np.clip((self.volume[7].astype(np.float32) - low) * (255.0 / (high - low)), 0, 255)
+        expected = windowed.reshape(150, 2, 130, 2).mean(axis=(1, 3))
+        level = np.load(os.path.join(self.store.path(manifest['digest']), 'level_1.npy'), mmap_mode='r')
+        self.assertLessEqual(np.abs(level[7].astype(np.float32) - expected).max(), 0.5 + 1e-3)
+
+    def test_slice_png(self):
+        """测试读取单个切片为PNG"""
+        manifest = self.store.ingest(self._xray())
+        png = self.store.slice_png(manifest['digest'], 0, 0)
+        self.assertEqual(Image.open(io.BytesIO(png)).size, (200, 120))
+        self.assertIs(self.store.slice_png(manifest['digest'], 0, 0), png)
+        with self.assertRaises(ImagingError):
+            self.store.slice_png(manifest['digest'], 5, 0)
+
+    def test_rejects_non_volumes(self):
+        """测试非法输入"""
+        bad = os.path.join(self.tmpdir.name, 'bad.npy')
+        with open(bad, 'wb') as f:
+            f.write(b'not numpy')
+        with self.assertRaises(ImagingError):
+            self.store.ingest(bad)
+        with self.assertRaises(ImagingError):
+            self.store.manifest('../../etc')
+
+    def _xray(self):
+        path = os.path.join(self.tmpdir.name, 'xray.npy')
+        np.save(path, np.linspace(0, 1, 120 * 200).reshape(120, 200))
+        return path
+
+
+class TestImagingRoutes(unittest.TestCase):
+    """影像接口测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.original = run.imaging_store, run.app.config['IMAGING_DATA_DIR']
+        run.imaging_store = ImagingStore(self.tmpdir.name)
+        run.app.config['IMAGING_DATA_DIR'] = self.tmpdir.name
+        run.app.config['TESTING'] = True
+        run.app.config['ADMIN_TOKEN'] = 'secret'
+        self.client = run.app.test_client()
+
+    def tearDown(self):
+        run.imaging_store, run.app.config['IMAGING_DATA_DIR'] = self.original
+        run.app.config['ADMIN_TOKEN'] = None
+        self.tmpdir.cleanup()
+
+    def _upload(self, token='secret'):
+        buffer = io.BytesIO()
+        np.save(buffer, np.arange(3 * 80 * 90, dtype=np.float32).reshape(3, 80, 90))
+        buffer.seek(0)
+        return self.client.post('/api/imaging/mri/ingest', data={'file': (buffer, 'brain.npy')},
+                                headers={'X-Admin-Token': token}, content_type='multipart/form-data')
+
+    def test_ingest_and_serve(self):
+        """测试上传后获取切片和缩略图"""
+        self.assertEqual(self._upload(token='wrong').status_code, 403)
+        response = self._upload()
+        self.assertEqual(response.status_code, 201)
+        digest = response.get_json()['digest']
+
+        manifest = self.client.get(f'/api/imaging/{digest}').get_json()
+        self.assertEqual(manifest['modality'], 'mri')
+        response = self.client.get(f'/api/imaging/{digest}/0/2.png')
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertEqual(self.client.get(f'/api/imaging/{digest}/thumbnail/1.png').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/imaging/{digest}/0/9.png').status_code, 404)
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir.name, 'incoming')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import unittest
+import csv
+import json
+import tempfile
+import sys
+import os
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import run
+from app import imputation
+from app.imputation import Imputer
+
+
+class TestImputer(unittest.TestCase):
+    """缺失数据填充测试类"""
+
+    def setUp(self):
+        self.imputer = Imputer(run.DISEASE_MODELS)
+        rng = np.random.default_rng(0)
+        n = 20000
+        age = rng.uniform(18, 90, n)
+        gender = rng.integers(0, 2, n).astype(float)
+        # 吸烟年数随年龄增长，男性更高
+        smoking_years = np.clip(age / 3 + gender * 10 + rng.normal(0, 2, n), 0, 80)
+        family_history = (rng.random(n) < np.where(age > 60, 0.8, 0.1)).astype(float)
+        self.cohort = {'age': age, 'gender': gender, 'smoking_years': smoking_years,
+                       'family_history': family_history}
+
+    def test_no_statistics_leaves_fields_missing(self):
+        """测试无参考数据时不填充，模型特征才使用模式默认值"""
+        factors, imputed = self.imputer.impute('lung_cancer', {'smoking_years': 10})
+        self.assertEqual((factors, imputed), ({'smoking_years': 10}, []))
+
+        columns = {'smoking_years': np.array([10.0, np.nan])}
+        self.assertFalse(any(mask.any() for mask in self.imputer.impute_columns('lung_cancer', columns).values()))
+        self.assertTrue(np.isnan(columns['smoking_years'][1]))
+        self.imputer.complete_columns('lung_cancer', columns)
+        np.testing.assert_allclose(columns['age'], [59, 59])
+        np.testing.assert_allclose(columns['smoking_years'], [10, 40])
+
+    def test_conditional_statistics(self):
+        """测试按年龄段和性别的条件均值与众数"""
+        self.imputer.fit('lung_cancer', self.cohort)
+        young_female, _ = self.imputer.impute('lung_cancer', {'age': 25, 'gender': 0})
+        old_male, _ = self.imputer.impute('lung_cancer', {'age': 70, 'gender': 1})
+        cohort = self.cohort
+        in_cell = (cohort['age'] >= 60) & (cohort['age'] < 75) & (cohort['gender'] == 1)
+        self.assertAlmostEqual(old_male['smoking_years'], cohort['smoking_years'][in_cell].mean(), places=3)
+        self.assertLess(young_female['smoking_years'], old_male['smoking_years'])
+        self.assertEqual((young_female['family_history'], old_male['family_history']), (0, 1))
+        # 没有参考数据的字段保持缺失
+        self.assertNotIn('smoking_amount', old_male)
+
+        # 年龄未知时使用按性别的边际统计量
+        no_age, imputed = self.imputer.impute('lung_cancer', {'gender': 1})
+        self.assertIn('age', imputed)
+        self.assertAlmostEqual(no_age['smoking_years'],
+                               cohort['smoking_years'][cohort['gender'] == 1].mean(), places=3)
+
+    def test_sparse_cells_fall_back(self):
+        """测试样本不足的单元格回退到边际统计量"""
+        cohort = {key: value[:200] for key, value in self.cohort.items()}
+        cohort['age'] = np.where(cohort['age'] < 75, cohort['age'], 74)
+        cohort['age'][:5] = 80
+        stats = self.imputer.fit('lung_cancer', cohort)
+        table = np.array(stats['fields']['smoking_years'])
+        np.testing.assert_allclose(table[4], table[imputation.ANY_BAND])
+        self.assertFalse(np.isnan(table).any())
+
+    def test_vectorized_matches_scalar(self):
+        """测试整列填充与逐条填充一致"""
+        self.imputer.fit('lung_cancer', self.cohort)
+        rng = np.random.default_rng(1)
+        n = 500
+        columns = {field: np.where(rng.random(n) < 0.4, np.nan, value[:n]) for field, value in self.cohort.items()}
+        columns.update({'smoking_amount': np.full(n, np.nan), 'occupational_exposure': np.full(n, np.nan)})
+        rows = [{field: float(column[i]) for field, column in columns.items() if not np.isnan(column[i])}
+                for i in range(n)]
+        masks = self.imputer.impute_columns('lung_cancer', columns)
+        for i in range(n):
+            expected, imputed = self.imputer.impute('lung_cancer', rows[i])
+            self.assertEqual(imputed, [field for field in expected if masks[field][i]])
+            for field, value in expected.items():
+                self.assertAlmostEqual(columns[field][i], value)
+
+    def test_cli_and_reload(self):
+        """测试由CSV计算统计量并重新加载"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = os.path.join(tmpdir, 'cohort.csv')
+            with open(source, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['age', 'bmi', 'note'])
+                for i in range(100):
+                    writer.writerow([40 + i % 20, '' if i % 10 == 0 else 24, 'x'])
+                writer.writerow([50, 999, 'out of range'])
+            output = os.path.join(tmpdir, 'stats.json')
+            imputation.main([source, '--disease', 'diabetes', '--output', output])
+
+            with open(output) as f:
+                self.assertEqual(json.load(f)['diseases']['diabetes']['rows'], 101)
+            loaded = imputation.load(output, run.DISEASE_MODELS)
+            factors, _ = loaded.impute('diabetes', {'age': 50})
+            self.assertEqual(factors['bmi'], 24)
+
+
+class TestImputationRoutes(unittest.TestCase):
+    """预测接口缺失值填充测试类"""
+
+    def setUp(self):
+        run.app.config['TESTING'] = True
+        self.client = run.app.test_client()
+        self.original = run.imputer
+        run.imputer = Imputer(run.DISEASE_MODELS)
+
+    def tearDown(self):
+        run.imputer = self.original
+
+    def fit_diabetes(self):
+        rng = np.random.default_rng(0)
+        n = 2000
+        run.imputer.fit('diabetes', {'age': rng.uniform(18, 90, n), 'bmi': rng.uniform(18, 30, n)})
+
+    def test_partial_inputs_keep_scorer_defaults(self):
+        """测试无参考数据时部分输入的评分与引入填充前一致"""
+        cases = [
+            ('diabetes', {'age': 45}, 10),
+            ('diabetes', {'bmi': 30}, 15),
+            ('lung_cancer', {'age': 50, 'gender': 0}, 20),
+            ('lung_cancer', {'smoking_years': 10}, 0),
+            ('copd', {'age': 50}, 15),
+            ('hypertension', {'age': 50}, 15)
+        ]
+        for disease_id, factors, expected in cases:
+            response = self.client.post(f'/api/predict/{disease_id}', json={'factors': factors}).get_json()
+            self.assertEqual(response['risk_score'], expected, (disease_id, factors))
+            self.assertEqual(response['imputed_fields'], [])
+        response = self.client.post('/api/predict/diabetes/batch', json={'records': [{'age': 45}]}).get_json()
+        self.assertEqual(response['results'][0]['risk_score'], 10)
+
+    def test_missing_age_is_not_scored_as_zero(self):
+        """测试有参考数据时缺失年龄不再按0计分"""
+        self.fit_diabetes()
+        response = self.client.post('/api/predict/diabetes', json={'factors': {'bmi': 22}}).get_json()
+        self.assertEqual(response['imputed_fields'], ['age'])
+        full = dict(run.imputer.impute('diabetes', {'bmi': 22})[0])
+        self.assertEqual(response['risk_score'], run.calculate_diabetes_risk(full))
+
+    def test_batch_reports_imputed_fields(self):
+        """测试批量预测返回每行填充的字段"""
+        self.fit_diabetes()
+        response = self.client.post('/api/predict/diabetes/batch', json={'records': [
+            {'age': 50, 'bmi': 22, 'waist_circumference': 80, 'systolic_bp': 120, 'family_history': 0,
+             'physical_activity': 1},
+            {'age': 50}
+        ]}).get_json()
+        self.assertEqual(response['results'][0]['imputed_fields'], [])
+        self.assertEqual(response['results'][1]['imputed_fields'], ['bmi'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import json
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.metrics import Histogram
+from run import app
+
+
+class TestMetrics(unittest.TestCase):
+    """请求计时与指标测试类"""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+
+    def test_histogram_buckets(self):
+        """测试直方图累计计数"""
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [('0.1', 1), ('1.0', 3), ('+Inf', 4)])
+
+    def test_server_timing_header(self):
+        """测试预测接口返回分阶段的Server-Timing"""
+        response = self.client.post('/api/predict/diabetes',
+                                    data=json.dumps({'factors': {'age': 50}}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        header = response.headers['Server-Timing']
+        for name in ('parse', 'validate', 'score', 'recommendations', 'serialize', 'total'):
+            self.assertIn(f'{name};dur=', header)
+
+    def test_metrics_endpoint(self):
+        """测试Prometheus格式的指标输出"""
+        self.client.get('/health')
+        self.client.get('/no/such/page')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_data(as_text=True)
+        self.assertIn('http_requests_total{method="GET",route="/health",status="200"}', body)
+        self.assertIn('route="<unmatched>",status="404"', body)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="/health",le="+Inf"}', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
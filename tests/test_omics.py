@@ -0,0 +1,168 @@
+import unittest
+import tempfile
+import threading
+import sys
+import os
+from unittest import mock
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import run
+from app.omics import OmicsError, OmicsMatrix, OmicsStore
+
+
+class TestOmicsStore(unittest.TestCase):
+    """组学矩阵存储测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = OmicsStore(self.tmpdir.name)
+        rng = np.random.default_rng(0)
+        self.data = rng.normal(size=(53, 37)).astype(np.float32)
+        self.data[3, [1, 20, 30]] = np.nan
+        self.data[4, :] = np.nan
+        self.row_ids = [f'GENE{i}' for i in range(53)]
+        self.col_ids = [f'S{i}' for i in range(37)]
+        writer = self.store.create('genomics', 'expression', self.row_ids, self.col_ids,
+                                   chunk_rows=8, chunk_cols=10)
+        # 分多次、按不规则大小写入
+        for start, stop in ((0, 5), (5, 30), (30, 53)):
+            writer.write_rows(self.data[start:stop])
+        self.matrix = writer.close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_tiles_on_disk(self):
+        """测试矩阵按分块存储"""
+        chunks = os.listdir(os.path.join(self.matrix.path, 'chunks'))
+        self.assertEqual(len(chunks), 7 * 4)
+        tile = np.load(os.path.join(self.matrix.path, 'chunks', 'r6_c3.npy'))
+        self.assertEqual(tile.shape, (5, 7))
+
+    def test_reads_match_source(self):
+        """测试行、列、子矩阵和连续块读取"""
+        np.testing.assert_array_equal(self.matrix.rows(['GENE10', 'GENE2']), self.data[[10, 2]])
+        np.testing.assert_array_equal(self.matrix.columns(['S36', 'S0']), self.data[:, [36, 0]])
+        np.testing.assert_array_equal(
+            self.matrix.rows(['GENE50', 'GENE7', 'GENE8'], ['S15', 'S9', 'S30']),
+            self.data[np.ix_([50, 7, 8], [15, 9, 30])])
+        np.testing.assert_array_equal(self.matrix.block(6, 19, 9, 31), self.data[6:19, 9:31])
+        np.testing.assert_array_equal(self.matrix.take(), self.data)
+
+    def test_unknown_ids(self):
+        """测试未知编号报错"""
+        with self.assertRaises(OmicsError):
+            self.matrix.rows(['NOPE'])
+        with self.assertRaises(OmicsError):
+            self.store.create('genomics', '../escape', ['a'], ['b'])
+        with self.assertRaises(KeyError):
+            self.store.open('genomics', 'missing')
+
+    def test_feature_stats_streaming(self):
+        """测试写入时累计的统计与直接计算一致"""
+        # 统计量在写入时即已保存，读取不再扫描分块
+        self.assertTrue(os.path.exists(os.path.join(self.matrix.path, 'stats.npz')))
+        with mock.patch.object(OmicsMatrix, 'iter_tiles', side_effect=AssertionError('scanned')):
+            stats = OmicsMatrix(self.matrix.path).feature_stats()
+        data = self.data.astype(np.float64)
+        valid_rows = [i for i in range(53) if i != 4]
+        np.testing.assert_array_equal(stats['count'], (~np.isnan(data)).sum(axis=1))
+        np.testing.assert_allclose(stats['mean'][valid_rows], np.nanmean(data[valid_rows], axis=1))
+        np.testing.assert_allclose(stats['std'][valid_rows], np.nanstd(data[valid_rows], axis=1, ddof=1))
+        np.testing.assert_allclose(stats['min'][valid_rows], np.nanmin(data[valid_rows], axis=1))
+        self.assertTrue(np.isnan(stats['mean'][4]))
+
+    def test_feature_stats_without_stored_stats(self):
+        """测试旧矩阵首次使用时按分块计算一次并保存"""
+        stats = self.matrix.feature_stats()
+        os.remove(os.path.join(self.matrix.path, 'stats.npz'))
+        matrix = OmicsMatrix(self.matrix.path)
+        with mock.patch.object(OmicsMatrix, 'iter_tiles', wraps=matrix.iter_tiles) as scan:
+            threads = [threading.Thread(target=matrix.feature_stats) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(scan.call_count, 1)
+        for name in ('count', 'mean', 'std', 'min', 'max'):
+            np.testing.assert_allclose(matrix.feature_stats()[name], stats[name])
+        self.assertTrue(os.path.exists(os.path.join(self.matrix.path, 'stats.npz')))
+
+    def test_concurrent_writers_and_replacement(self):
+        """测试同一矩阵的并发写入互不破坏，替换后打开的是新版本"""
+        opened = self.store.open('genomics', 'expression')
+        self.assertIs(self.store.open('genomics', 'expression'), opened)
+        # 由另一个存储实例（如另一个进程）写入
+        other = OmicsStore(self.tmpdir.name)
+        first = other.create('genomics', 'expression', ['A', 'B'], ['S1'])
+        second = other.create('genomics', 'expression', ['A', 'B', 'C'], ['S1'])
+        first.write_rows([[1.0]])
+        second.write_rows([[2.0], [3.0]])
+        # 写入中的临时目录不出现在列表里
+        self.assertEqual([m['name'] for m in self.store.list('genomics')], ['expression'])
+        first.write_rows([[4.0]])
+        first.close()
+        matrix = self.store.open('genomics', 'expression')
+        self.assertIsNot(matrix, opened)
+        np.testing.assert_array_equal(matrix.take(), [[1.0], [4.0]])
+        second.write_rows([[5.0]])
+        second.close()
+        np.testing.assert_array_equal(self.store.open('genomics', 'expression').take(), [[2.0], [3.0], [5.0]])
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir.name, 'genomics')), ['expression'])
+
+    def test_incomplete_write_not_published(self):
+        """测试未写完的矩阵不可见"""
+        writer = self.store.create('proteomics', 'partial', ['P1', 'P2'], ['S1'])
+        writer.write_rows([[1.0]])
+        with self.assertRaises(OmicsError):
+            writer.close()
+        self.assertEqual(self.store.list('proteomics'), [])
+        self.assertEqual(self.store.list('genomics')[0]['features'], 53)
+
+
+class TestOmicsRoutes(unittest.TestCase):
+    """组学数据接口测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.original = run.app.extensions.get('omics')
+        run.app.extensions['omics'] = OmicsStore(self.tmpdir.name)
+        writer = run.get_omics_store().create('metabolomics', 'plasma', ['M1', 'M2', 'M3'], ['A', 'B'],
+                                              chunk_rows=2, chunk_cols=1)
+        writer.write_rows([[1.0, 2.0], [np.nan, 4.0], [5.0, 6.0]])
+        writer.close()
+        run.app.config['TESTING'] = True
+        self.client = run.app.test_client()
+
+    def tearDown(self):
+        if self.original is None:
+            run.app.extensions.pop('omics', None)
+        else:
+            run.app.extensions['omics'] = self.original
+        self.tmpdir.cleanup()
+
+    def test_values(self):
+        """测试按编号和位置读取"""
+        data = self.client.get('/api/omics/metabolomics/plasma/values?row=M2&row=M1').get_json()
+        self.assertEqual(data['columns'], ['A', 'B'])
+        self.assertEqual(data['values'], [[None, 4.0], [1.0, 2.0]])
+        data = self.client.get('/api/omics/metabolomics/plasma/values?col=B&row_start=1').get_json()
+        self.assertEqual(data['rows'], ['M2', 'M3'])
+        self.assertEqual(data['values'], [[4.0], [6.0]])
+        self.assertEqual(self.client.get('/api/omics/metabolomics/plasma/values?row=X').status_code, 400)
+        self.assertEqual(self.client.get('/api/omics/metabolomics/nope/values').status_code, 404)
+
+    def test_stats_and_listing(self):
+        """测试统计与矩阵列表"""
+        features = self.client.get('/api/omics/metabolomics/plasma/stats').get_json()['features']
+        self.assertEqual(features[1], {'id': 'M2', 'count': 1, 'mean': 4.0, 'std': None, 'min': 4.0, 'max': 4.0})
+        matrices = self.client.get('/api/omics/metabolomics').get_json()['matrices']
+        self.assertEqual(matrices, [{'name': 'plasma', 'features': 3, 'samples': 2, 'dtype': 'float32'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+import unittest
+import logging
+import tempfile
+import sys
+import os
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import run
+from algorithms.panda_algorithm import PandaAlgorithm
+from app.imputation import Imputer
+from app.models import online, training
+from app.models.registry import ModelCache, ModelRegistry
+
+
+def diabetes_batch(n, seed):
+    """按年龄与BMI决定结局概率的小批量数据"""
+    rng = np.random.default_rng(seed)
+    age = rng.integers(20, 80, n).astype(np.float64)
+    bmi = rng.integers(18, 40, n).astype(np.float64)
+    labels = (rng.random(n) < (age - 20) / 60 * 0.5 + (bmi - 18) / 22 * 0.5).astype(np.float64)
+    return {'age': age, 'bmi': bmi}, labels
+
+
+def panda_batch(n, seed):
+    """只有BRCA突变决定结局的乳腺癌小批量数据"""
+    rng = np.random.default_rng(seed)
+    patients = [{'age': int(rng.integers(25, 75)), 'family_history': int(rng.integers(0, 2)),
+                 'brca_mutation': int(rng.integers(0, 3)), 'breast_density': int(rng.integers(0, 3))}
+                for _ in range(n)]
+    labels = np.array([1.0 if p['brca_mutation'] else 0.0 for p in patients])
+    return patients, labels
+
+
+class TestPandaPartialFit(unittest.TestCase):
+    """Panda权重增量更新测试类"""
+
+    def test_updates_reduce_loss(self):
+        """测试连续小批量更新使Brier分数下降"""
+        panda = PandaAlgorithm(federated_mode=False, privacy_level='low')
+        panda.logger.setLevel(logging.WARNING)
+        brca_weight = panda.model_weights['brca_mutation']
+        first = panda.partial_fit(*panda_batch(200, 0), learning_rate=0.5)
+        for seed in range(1, 20):
+            last = panda.partial_fit(*panda_batch(200, seed), learning_rate=0.5)
+        self.assertLess(last['brier_after'], first['brier_before'] / 2)
+        self.assertGreater(panda.model_weights['brca_mutation'], brca_weight)
+        self.assertTrue(all(weight >= 0 for weight in panda.model_weights.values()))
+        patients, _ = panda_batch(5, 99)
+        np.testing.assert_allclose(panda.predict_scores(patients[:1]), panda.predict_scores(patients)[:1])
+
+
+class TestOnlineUpdater(unittest.TestCase):
+    """在线更新测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.registry = ModelRegistry(self.tmpdir.name)
+        self.imputer = Imputer(run.DISEASE_MODELS)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def updater(self, disease_id='diabetes', **kwargs):
+        return online.OnlineUpdater(self.registry, disease_id, run.FACTOR_VALIDATORS[disease_id], self.imputer,
+                                    **kwargs)
+
+    def test_stream_publishes_versions(self):
+        """测试每个小批量发布一个新版本并累计统计"""
+        updater = self.updater(estimator='sgd_logistic', keep_versions=3)
+        for seed in range(6):
+            metadata = updater.update(*diabetes_batch(500, seed))
+        self.assertEqual(metadata['version'], 6)
+        self.assertEqual(metadata['estimator'], 'sgd_logistic')
+        self.assertEqual(metadata['online']['updates'], 6)
+        self.assertEqual(metadata['online']['rows_seen'], 3000)
+        self.assertEqual(metadata['online']['base_version'], 5)
+        self.assertEqual(self.registry.versions('diabetes'), [4, 5, 6])
+
+        # 另一个更新器（如另一个进程）从当前版本继续
+        metadata = self.updater().update(*diabetes_batch(500, 6))
+        self.assertEqual(metadata['online']['updates'], 7)
+        self.assertLess(metadata['online']['last_batch']['brier_before'], 0.25)
+
+    def test_panda_weights(self):
+        """测试乳腺癌Panda权重的增量更新"""
+        updater = self.updater('breast_cancer', estimator='panda', learning_rate=0.5)
+        patients, labels = panda_batch(300, 0)
+        values = {field: np.array([p.get(field, np.nan) for p in patients], dtype=np.float64)
+                  for field in run.FACTOR_VALIDATORS['breast_cancer'].fields}
+        metadata = updater.update(values, labels)
+        model, _ = self.registry.load('breast_cancer')
+        self.assertIsInstance(model, PandaAlgorithm)
+        self.assertLess(metadata['online']['last_batch']['brier_after'], 0.25)
+
+    def test_batch_models_are_rejected(self):
+        """测试不支持增量更新的模型"""
+        self.registry.publish('diabetes', training.build_estimator('logistic_regression').fit(
+            np.random.default_rng(0).random((20, 6)), np.arange(20) % 2),
+            {'estimator': 'logistic_regression', 'features': list(run.FACTOR_VALIDATORS['diabetes'].fields)})
+        with self.assertRaises(online.OnlineError):
+            self.updater().update(*diabetes_batch(10, 0))
+        with self.assertRaises(online.OnlineError):
+            self.updater(estimator='random_forest')
+        with self.assertRaises(online.OnlineError):
+            self.updater('diabetes', estimator='panda')
+        self.assertEqual(self.registry.versions('diabetes'), [1])
+
+    def test_new_model_needs_base(self):
+        """测试没有已发布模型时不从小批量新建模型"""
+        with self.assertRaises(online.OnlineError):
+            self.updater().update(*diabetes_batch(500, 0))
+        with self.assertRaises(online.OnlineError):
+            self.updater(estimator='sgd_logistic').update(*diabetes_batch(online.MIN_BASE_ROWS - 1, 0))
+        values, labels = diabetes_batch(500, 0)
+        with self.assertRaises(online.OnlineError):
+            self.updater(estimator='sgd_logistic').update(values, np.ones_like(labels))
+        self.assertEqual(self.registry.versions('diabetes'), [])
+
+
+class TestModelCache(unittest.TestCase):
+    """模型服务缓存测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.registry = ModelRegistry(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_reloads_new_versions(self):
+        """测试检查间隔后加载新版本，之前继续使用旧版本"""
+        cache = ModelCache(self.registry, check_interval=3600)
+        self.assertIsNone(cache.get('copd'))
+        self.registry.publish('copd', {'w': 1}, {})
+        cache.check_interval = 0
+        self.assertEqual(cache.get('copd')[0], {'w': 1})
+        cache.check_interval = 3600
+        self.registry.publish('copd', {'w': 2}, {})
+        self.assertEqual(cache.get('copd')[0], {'w': 1})
+        cache.check_interval = 0
+        self.assertEqual(cache.get('copd')[1]['version'], 2)
+        self.assertEqual(cache.get('copd')[0], {'w': 2})
+        self.assertEqual(cache.loads, 2)
+
+
+class TestOnlineRoutes(unittest.TestCase):
+    """在线更新接口测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.original = run.model_registry, run.model_cache, run.online_updaters
+        run.model_registry = ModelRegistry(self.tmpdir.name)
+        run.model_cache = ModelCache(run.model_registry, check_interval=0)
+        run.online_updaters = {}
+        run.app.config['ADMIN_TOKEN'] = 'secret'
+        run.app.config['TESTING'] = True
+        self.client = run.app.test_client()
+
+    def tearDown(self):
+        run.model_registry, run.model_cache, run.online_updaters = self.original
+        run.app.config['ADMIN_TOKEN'] = None
+        self.tmpdir.cleanup()
+
+    def post(self, records, outcomes, token='secret'):
+        return self.client.post('/api/models/diabetes/updates', json={'records': records, 'outcomes': outcomes},
+                                headers={'X-Admin-Token': token})
+
+    def test_update_then_predict(self):
+        """测试增量更新后预测接口使用新版本"""
+        values, labels = diabetes_batch(200, 0)
+        records = [{'age': int(a), 'bmi': int(b)} for a, b in zip(values['age'], values['bmi'])]
+        online.OnlineUpdater(run.model_registry, 'diabetes', run.FACTOR_VALIDATORS['diabetes'], run.imputer,
+                             'sgd_logistic').update(*diabetes_batch(500, 1))
+        data = self.client.post('/api/predict/diabetes', json={'factors': {'age': 70, 'bmi': 35}}).get_json()
+        self.assertEqual(data['model']['version'], 1)
+        self.assertEqual(data['model']['estimator'], 'sgd_logistic')
+        self.assertTrue(0 <= data['model']['risk_score'] <= 100)
+
+        response = self.post(records, labels.astype(int).tolist())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['version'], 2)
+        self.assertEqual(response.get_json()['online']['updates'], 2)
+        data = self.client.post('/api/predict/diabetes', json={'factors': {'age': 70, 'bmi': 35}}).get_json()
+        self.assertEqual(data['model']['version'], 2)
+
+    def test_lists_stream_started_model(self):
+        """测试从数据流新建的模型没有交叉验证结果时模型列表仍可用"""
+        patients, labels = panda_batch(300, 0)
+        values = {field: np.array([p.get(field, np.nan) for p in patients], dtype=np.float64)
+                  for field in run.FACTOR_VALIDATORS['breast_cancer'].fields}
+        online.OnlineUpdater(run.model_registry, 'breast_cancer', run.FACTOR_VALIDATORS['breast_cancer'],
+                             run.imputer, 'panda').update(values, labels)
+        response = self.client.get('/api/models')
+        self.assertEqual(response.status_code, 200)
+        model = response.get_json()['models']['breast_cancer']
+        self.assertEqual(model['estimator'], 'panda')
+        self.assertIsNone(model['cv_metrics'])
+        self.assertEqual(model['online']['updates'], 1)
+
+    def test_requires_published_model(self):
+        """测试没有基础模型时拒绝更新，不发布由单个请求训练的模型"""
+        response = self.post([{'age': 30}], [1])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(run.model_registry.versions('diabetes'), [])
+        self.assertNotIn('model', self.client.post('/api/predict/diabetes',
+                                                   json={'factors': {'age': 80}}).get_json())
+
+    def test_invalid_requests(self):
+        """测试鉴权与非法数据"""
+        self.assertEqual(self.post([{'age': 40}], [1], token='wrong').status_code, 403)
+        self.assertEqual(self.post([{'age': 40}], [1, 0]).status_code, 400)
+        self.assertEqual(self.post([{'age': 40}], [2]).status_code, 400)
+        self.assertEqual(self.post([{'age': 400}], [1]).status_code, 400)
+        self.assertNotIn('model', self.client.post('/api/predict/diabetes',
+                                                   json={'factors': {'age': 40}}).get_json())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import logging
+import sys
+import os
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from algorithms.panda_algorithm import MIN_CI_SAMPLES, PandaAlgorithm
+
+PATIENT = {
+    'age': 45, 'family_history': 1, 'brca_mutation': 0, 'menstrual_age': 12,
+    'first_birth_age': 28, 'hormone_therapy': 0, 'breast_density': 2
+}
+
+
+class TestConfidenceIntervals(unittest.TestCase):
+    """Panda算法蒙特卡洛置信区间测试类"""
+
+    def setUp(self):
+        self.panda = PandaAlgorithm(federated_mode=True, privacy_level='high')
+        self.panda.logger.setLevel(logging.WARNING)
+
+    def test_matches_empirical_distribution(self):
+        """测试区间与逐次计算评分的经验分位数一致"""
+        np.random.seed(0)
+        scores = [self.panda.calculate_risk_score(PATIENT)['risk_score'] for _ in range(4000)]
+        expected = np.percentile(scores, [2.5, 97.5])
+        interval = self.panda.confidence_intervals([PATIENT], budget_ms=1e6, rng=np.random.default_rng(0))
+        self.assertEqual(interval['samples'], 2000)
+        self.assertFalse(interval['truncated'])
+        np.testing.assert_allclose([interval['lower'][0], interval['upper'][0]], expected, atol=1.0)
+        self.assertLess(interval['lower'][0], interval['median'][0])
+        self.assertLess(interval['median'][0], interval['upper'][0])
+
+        low, high = self.panda.calculate_risk_score(PATIENT)['confidence_interval']
+        self.assertLess(high - low, 20)
+        self.assertGreater(high - low, 5)
+
+    def test_batch_rows_are_independent(self):
+        """测试批量计算中各患者的区间各自独立"""
+        low_risk = dict(PATIENT, age=25, family_history=0, breast_density=0, menstrual_age=14, first_birth_age=22)
+        interval = self.panda.confidence_intervals([PATIENT, low_risk, PATIENT], rng=np.random.default_rng(1))
+        self.assertEqual(interval['lower'].shape, (3,))
+        self.assertLess(interval['upper'][1], interval['lower'][0])
+        self.assertAlmostEqual(interval['median'][0], interval['median'][2], delta=0.5)
+
+    def test_deadline_returns_partial_estimate(self):
+        """测试超过时间预算时返回已有样本的估计"""
+        interval = self.panda.confidence_intervals([PATIENT] * 5000, budget_ms=0)
+        self.assertTrue(interval['truncated'])
+        self.assertGreaterEqual(interval['samples'], MIN_CI_SAMPLES)
+        self.assertLess(interval['samples'], 400)
+        self.assertTrue((interval['lower'] < interval['upper']).all())
+
+    def test_deterministic_without_noise(self):
+        """测试无噪声时区间退化为单点"""
+        panda = PandaAlgorithm(federated_mode=False, privacy_level='low')
+        panda.logger.setLevel(logging.WARNING)
+        result = panda.calculate_risk_score(PATIENT)
+        self.assertEqual(result['confidence_interval'], (result['risk_score'], result['risk_score']))
+
+
+if __name__ == '__main__':
+    unittest.main()
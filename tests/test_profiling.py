@@ -0,0 +1,66 @@
+import unittest
+import json
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from run import app
+
+
+class TestProfilingAPI(unittest.TestCase):
+    """按需剖析接口测试类"""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['ADMIN_TOKEN'] = 'test-token'
+        self.client = app.test_client()
+        self.headers = {'X-Admin-Token': 'test-token'}
+
+    def start(self, **options):
+        response = self.client.post('/admin/profile', data=json.dumps(options),
+                                    content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)['profile_id']
+
+    def predict(self):
+        self.client.post('/api/predict/diabetes', data=json.dumps({'factors': {'age': 50}}),
+                         content_type='application/json')
+
+    def test_requires_admin_token(self):
+        """测试未授权请求被拒绝"""
+        response = self.client.post('/admin/profile', data=json.dumps({'route': '/health'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_unknown_route(self):
+        """测试未知路由返回400"""
+        response = self.client.post('/admin/profile', data=json.dumps({'route': '/nope'}),
+                                    content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_cprofile_next_requests(self):
+        """测试cProfile模式在N个请求后结束"""
+        profile_id = self.start(route='/api/predict/<disease_id>', mode='cprofile', requests=2)
+        self.predict()
+        self.predict()
+        self.predict()
+
+        response = self.client.get(f'/admin/profile/{profile_id}', headers=self.headers)
+        self.assertEqual(response.headers['X-Profile-Status'], 'finished')
+        self.assertEqual(response.headers['X-Profile-Requests'], '2')
+        self.assertIn('calculate_risk_score', response.get_data(as_text=True))
+
+    def test_sample_mode_stop(self):
+        """测试采样模式可手动停止"""
+        profile_id = self.start(route='/api/predict/<disease_id>', seconds=5)
+        self.predict()
+        response = self.client.delete(f'/admin/profile/{profile_id}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Profile-Status'], 'finished')
+        self.assertNotIn('/api/predict/<disease_id>', app.extensions['profiler'].active)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import unittest
+import sys
+import os
+from unittest import mock
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import run
+from app import scoring
+from app.imputation import Imputer
+
+
+def random_profiles(disease_id, n, seed=0):
+    """按 risk_factors 取值范围随机生成因子，部分字段缺失"""
+    rng = np.random.default_rng(seed)
+    profiles = []
+    for _ in range(n):
+        factors = {}
+        for factor in run.DISEASE_MODELS[disease_id]['risk_factors']:
+            if rng.random() < 0.15:
+                continue
+            if factor['type'] == 'select':
+                factors[factor['id']] = int(rng.choice([option['value'] for option in factor['options']]))
+            else:
+                # 取整数值以覆盖各阈值的边界
+                factors[factor['id']] = int(rng.integers(factor['min'], factor['max'] + 1))
+        profiles.append(factors)
+    return profiles
+
+
+def to_columns(disease_id, profiles):
+    return {factor['id']: np.array([p.get(factor['id'], np.nan) for p in profiles], dtype=np.float64)
+            for factor in run.DISEASE_MODELS[disease_id]['risk_factors']}
+
+
+class TestScoringParity(unittest.TestCase):
+    """向量化评分与逐条评分一致性测试类"""
+
+    def assert_parity(self, disease_id, scalar):
+        profiles = random_profiles(disease_id, 2000)
+        vectorized = scoring.score_columns(disease_id, to_columns(disease_id, profiles))
+        expected = np.array([scalar(factors) for factors in profiles], dtype=np.float64)
+        np.testing.assert_allclose(vectorized, expected, rtol=1e-12)
+
+    def test_lung_cancer(self):
+        """测试肺癌评分一致"""
+        self.assert_parity('lung_cancer', run.calculate_lung_cancer_risk)
+
+    def test_diabetes(self):
+        """测试糖尿病评分一致"""
+        self.assert_parity('diabetes', run.calculate_diabetes_risk)
+
+    def test_breast_cancer_panda(self):
+        """测试乳腺癌Panda评分在联邦调整因子取期望值时一致"""
+        with mock.patch('numpy.random.normal', return_value=1.0):
+            self.assert_parity('breast_cancer', run.calculate_breast_cancer_risk_panda)
+
+    def test_default(self):
+        """测试默认评分一致"""
+        self.assert_parity('copd', run.calculate_default_risk)
+        self.assertEqual(scoring.score_columns('copd', {}).shape, (0,))
+
+
+class TestWhatIf(unittest.TestCase):
+    """假设分析测试类"""
+
+    BASE = {'age': 50, 'gender': 1, 'smoking_years': 30, 'smoking_amount': 20,
+            'family_history': 0, 'occupational_exposure': 1}
+
+    def setUp(self):
+        run.app.config['TESTING'] = True
+        self.client = run.app.test_client()
+
+    def test_surface_and_largest_effect(self):
+        """测试风险曲面与影响最大的单一改变"""
+        response = self.client.post('/api/predict/lung_cancer/whatif', json={
+            'factors': self.BASE,
+            'grid': {'smoking_amount': [0, 5, 20], 'occupational_exposure': None, 'age': {'delta': [-10, 60]}}
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['base_score'], run.calculate_lung_cancer_risk(self.BASE))
+        # 测试客户端按键名排序序列化，轴的顺序与请求中的键顺序一致
+        self.assertEqual([axis['field'] for axis in data['axes']], ['age', 'occupational_exposure', 'smoking_amount'])
+        self.assertEqual([axis['values'] for axis in data['axes']], [[40, 100], [0, 1], [0, 5, 20]])
+        surface = np.array(data['surface'])
+        self.assertEqual(surface.shape, (2, 2, 3))
+        for i, age in enumerate([40, 100]):
+            for j, exposure in enumerate([0, 1]):
+                for k, amount in enumerate([0, 5, 20]):
+                    factors = dict(self.BASE, smoking_amount=amount, occupational_exposure=exposure, age=age)
+                    self.assertEqual(surface[i, j, k], run.calculate_lung_cancer_risk(factors))
+
+        # 戒烟降低30分，为最大的单一改变
+        self.assertEqual(data['largest_effect'], {'field': 'smoking_amount', 'from': 20, 'to': 0,
+                                                  'risk_score': 35.0, 'delta': -30.0})
+        self.assertEqual(len(data['effects']), 5)
+
+    def test_missing_base_factors_are_imputed(self):
+        """测试基线缺失因子先填充"""
+        original = run.imputer
+        run.imputer = Imputer(run.DISEASE_MODELS)
+        self.addCleanup(setattr, run, 'imputer', original)
+        run.imputer.fit('diabetes', {'age': np.linspace(20, 80, 500)})
+        data = self.client.post('/api/predict/diabetes/whatif',
+                                json={'factors': {'bmi': 31}, 'grid': {'bmi': {'delta': [-3, -8]}}}).get_json()
+        self.assertEqual(data['imputed_fields'], ['age'])
+        self.assertEqual(data['axes'][0]['values'], [28, 23])
+        self.assertEqual(data['largest_effect']['to'], 23)
+
+    def test_delta_on_absent_factor(self):
+        """测试对未提供且无法填充的因子给出delta时返回400，可填充时以填充值为基线"""
+        original = run.imputer
+        run.imputer = Imputer(run.DISEASE_MODELS)
+        self.addCleanup(setattr, run, 'imputer', original)
+        request = {'factors': {'age': 45}, 'grid': {'bmi': {'delta': [-3]}}}
+        response = self.client.post('/api/predict/diabetes/whatif', json=request)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['error'], 'delta on bmi needs a base value')
+
+        run.imputer.fit('diabetes', {'bmi': np.full(100, 30.0)})
+        data = self.client.post('/api/predict/diabetes/whatif', json=request).get_json()
+        self.assertEqual(data['imputed_fields'], ['bmi'])
+        self.assertEqual(data['axes'][0]['values'], [27])
+
+    def test_invalid_grids(self):
+        """测试非法网格"""
+        url = '/api/predict/diabetes/whatif'
+        for grid in ({}, {'height': [1]}, {'bmi': [5]}, {'physical_activity': [7]},
+                     {'physical_activity': {'delta': [1]}}, {'bmi': 'low'}):
+            self.assertEqual(self.client.post(url, json={'factors': {'age': 40}, 'grid': grid}).status_code, 400)
+        large = {'age': list(range(18, 101)), 'bmi': list(range(15, 51)), 'waist_circumference': None,
+                 'systolic_bp': None}
+        self.assertEqual(self.client.post(url, json={'factors': {}, 'grid': large}).status_code, 413)
+        self.assertEqual(self.client.post('/api/predict/unknown/whatif', json={}).status_code, 404)
+
+
+class TestTrajectory(unittest.TestCase):
+    """风险轨迹测试类"""
+
+    def setUp(self):
+        run.app.config['TESTING'] = True
+        self.client = run.app.test_client()
+
+    def test_trajectory_matches_scalar_scores(self):
+        """测试各年龄的评分与逐条计算一致"""
+        factors = {'age': 40, 'bmi': 27, 'waist_circumference': 88, 'systolic_bp': 135,
+                   'family_history': 0, 'physical_activity': 0}
+        data = self.client.post('/api/predict/diabetes/trajectory', json={'factors': factors, 'years': 30,
+                                                                           'step': 5}).get_json()
+        self.assertEqual(data['ages'], [40, 45, 50, 55, 60, 65, 70])
+        curve = data['curves']['diabetes']
+        self.assertEqual(curve['risk_scores'],
+                         [run.calculate_diabetes_risk(dict(factors, age=age)) for age in data['ages']])
+        self.assertEqual(curve['risk_levels'][0], 'medium')
+        self.assertEqual(curve['risk_levels'][-1], 'high')
+
+    def test_all_diseases(self):
+        """测试全部疾病模式及年龄上限"""
+        data = self.client.post('/api/predict/stroke/trajectory',
+                                json={'factors': {'age': 90, 'gender': 0, 'bmi': 24}, 'all_diseases': True}).get_json()
+        self.assertEqual(set(data['curves']), set(run.DISEASE_MODELS))
+        self.assertEqual(data['ages'][-1], 100)
+        self.assertEqual(len(data['curves']['copd']['risk_scores']), 11)
+        self.assertNotIn('bmi', data['imputed_fields']['hypertension'])
+
+    def test_invalid_requests(self):
+        """测试非法请求"""
+        url = '/api/predict/diabetes/trajectory'
+        self.assertEqual(self.client.post(url, json={'factors': {'bmi': 25}}).status_code, 400)
+        self.assertEqual(self.client.post(url, json={'factors': {'age': 40}, 'years': 0}).status_code, 400)
+        self.assertEqual(self.client.post(url, json={'factors': {'age': 40}, 'step': 'x'}).status_code, 400)
+        for years in (True, 2.9, '2.9', None, [5]):
+            self.assertEqual(self.client.post(url, json={'factors': {'age': 40}, 'years': years}).status_code, 400)
+        self.assertEqual(self.client.post(url, json={'factors': {'age': 40}, 'step': False}).status_code, 400)
+        data = self.client.post(url, json={'factors': {'age': 40}, 'years': 4.0, 'step': '2'}).get_json()
+        self.assertEqual(data['ages'], [40, 42, 44])
+        self.assertEqual(self.client.post(url, json={'factors': {'age': 400}}).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
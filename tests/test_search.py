@@ -0,0 +1,227 @@
+import unittest
+import math
+import random
+import tempfile
+import sys
+import os
+from collections import Counter
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import run
+from app.catalog import Catalog
+from app.search import CatalogSearch, InvertedIndex, tokenize
+
+VOCABULARY = ['diabetes', 'insulin', 'glucose', 'stroke', 'cancer', 'tumor', 'lung', 'heart',
+              '糖尿病', '胰岛素', '血糖', '中风', '肺癌', '心脏', '患者', '治疗']
+
+
+def _brute_force(documents, query, k, k1=1.2, b=0.75):
+    """不做剪枝的BM25参考实现"""
+    counts = [Counter(tokenize(text)) for text in documents]
+    avgdl = sum(sum(c.values()) for c in counts) / len(counts)
+    scores = Counter()
+    for term in set(tokenize(query)):
+        df = sum(1 for c in counts if term in c)
+        if not df:
+            continue
+        idf = math.log(1 + (len(counts) - df + 0.5) / (df + 0.5))
+        for number, c in enumerate(counts):
+            if term in c:
+                norm = k1 * (1 - b + b * sum(c.values()) / avgdl)
+                scores[number] += idf * c[term] * (k1 + 1) / (c[term] + norm)
+    return scores
+
+
+class TestTokenize(unittest.TestCase):
+    """中英文混合分词测试类"""
+
+    def test_mixed_text(self):
+        """测试英文小写分词、中文二元切分和全角字符归一化"""
+        self.assertEqual(tokenize('Type-2 Diabetes 患者ＨｂＡ1c升高，肺'),
+                         ['type', '2', 'diabetes', '患者', 'hba1c', '升高', '肺'])
+        self.assertEqual(tokenize('糖尿病'), ['糖尿', '尿病'])
+        self.assertEqual(tokenize(''), [])
+
+
+class TestInvertedIndex(unittest.TestCase):
+    """BM25倒排索引测试类"""
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.documents = [' '.join(rng.choice(VOCABULARY) for _ in range(rng.randint(3, 40)))
+                          for _ in range(600)]
+        self.index = InvertedIndex()
+        for number, text in enumerate(self.documents):
+            self.index.add(1000 + number, text, 'even' if number % 2 == 0 else 'odd')
+
+    def test_pruned_top_k_matches_exhaustive_ranking(self):
+        """测试剪枝后的top-k与穷举BM25一致"""
+        for query in ('diabetes insulin glucose', '糖尿病 胰岛素 stroke', 'lung cancer tumor heart 肺癌'):
+            for k in (1, 5, 20):
+                results = self.index.search(query, k=k)
+                expected = _brute_force(self.documents, query, k)
+                kth = sorted(expected.values(), reverse=True)[k - 1]
+                self.assertEqual(len(results), k)
+                for result in results:
+                    self.assertAlmostEqual(result['score'], expected[result['id'] - 1000], places=3)
+                    self.assertGreaterEqual(result['score'], kth - 1e-3)
+                scores = [r['score'] for r in results]
+                self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_group_filter(self):
+        """测试按分组过滤"""
+        results = self.index.search('stroke heart', k=10, groups=['odd'])
+        self.assertTrue(results)
+        self.assertTrue(all((r['id'] - 1000) % 2 == 1 for r in results))
+        self.assertEqual(self.index.search('stroke', groups=['missing']), [])
+
+    def test_incremental_add(self):
+        """测试新增文档立即可检索"""
+        self.assertEqual(self.index.search('hypertension'), [])
+        self.index.add(1, 'Hypertension guideline 高血压指南', 'even')
+        self.assertEqual(self.index.search('hypertension')[0]['id'], 1)
+        self.assertEqual(self.index.search('高血压')[0]['id'], 1)
+
+    def test_window_pruning_matches_exhaustive_ranking(self):
+        """测试多窗口剪枝、分组过滤与删除后仍与穷举BM25一致，且跳过了部分倒排块"""
+        for number in range(0, 600, 7):
+            self.index.remove(1000 + number)
+        index = InvertedIndex(block_size=8, window_size=32)
+        for number, text in enumerate(self.documents):
+            index.add(1000 + number, text, 'even' if number % 2 == 0 else 'odd')
+        for number in range(0, 600, 7):
+            index.remove(1000 + number)
+        for query in ('diabetes insulin glucose', '糖尿病 胰岛素 stroke', 'lung cancer tumor heart 肺癌'):
+            for k in (1, 5, 20):
+                for groups in (None, ['odd']):
+                    expected = self.index.search(query, k=k, groups=groups)
+                    self.assertEqual(index.search(query, k=k, groups=groups), expected)
+                    self.assertTrue(all((r['id'] - 1000) % 7 for r in expected))
+
+    def test_top_k_stops_early(self):
+        """测试窗口上界不足第k高分时不再解码其倒排块"""
+        index = InvertedIndex(block_size=8, window_size=32)
+        for number in range(3200):
+            strong = number % 1000 == 0
+            index.add(number, 'diabetes ' * (5 if strong else 1) + 'insulin' + ' note' * (0 if strong else 30))
+        with mock.patch.object(index, '_decode', wraps=index._decode) as decode:
+            results = index.search('diabetes insulin', k=3)
+        self.assertEqual([r['id'] for r in results], [0, 1000, 2000])
+        # 穷举需要解码两个词在全部100个窗口中的倒排块
+        self.assertLess(decode.call_count, 20)
+
+    def test_update_and_remove(self):
+        """测试更新与删除文档"""
+        self.index.add(1, 'hypertension 高血压')
+        self.index.add(1, 'hypotension 低血压')
+        self.assertEqual(self.index.search('hypertension'), [])
+        self.assertEqual(self.index.search('hypotension')[0]['id'], 1)
+        self.assertEqual(len(self.index), 601)
+        self.assertTrue(self.index.remove(1))
+        self.assertFalse(self.index.remove(1))
+        self.assertEqual(self.index.search('hypotension'), [])
+        self.assertEqual(len(self.index), 600)
+
+    def test_postings_are_delta_encoded(self):
+        """测试倒排表以差值数组存储"""
+        postings = self.index.postings['diabetes']
+        self.assertEqual(postings.gaps.typecode, 'I')
+        self.assertEqual(sum(postings.gaps) - 1, postings.last)
+
+
+class TestCatalogSearch(unittest.TestCase):
+    """目录检索同步与接口测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.original_catalog, self.original_search = run.catalog, run.text_search
+        run.catalog = Catalog(os.path.join(self.tmpdir.name, 'catalog.db'), self.original_catalog.subcategories)
+        run.text_search = CatalogSearch(run.catalog, 'medical_text')
+        run.app.config['TESTING'] = True
+        self.client = run.app.test_client()
+
+    def tearDown(self):
+        run.catalog, run.text_search = self.original_catalog, self.original_search
+        self.tmpdir.cleanup()
+
+    def _add(self, subcategory, title, content, record_type='article'):
+        run.catalog.add_records([{'subcategory': subcategory, 'record_type': record_type, 'source': 'pubmed',
+                                  'record_date': '2024-03-01', 'title': title, 'content': content}])
+
+    def test_index_follows_catalog(self):
+        """测试检索按记录编号增量同步目录，且只索引医学文本"""
+        self._add('literature', 'Metformin and type 2 diabetes', '二甲双胍治疗2型糖尿病的疗效')
+        self._add('ct', 'Chest CT diabetes', '', record_type='scan')
+        self.assertEqual(len(run.text_search.search('diabetes')), 1)
+        self._add('reports', '糖尿病随访报告', 'HbA1c 7.2%')
+        results = run.text_search.search('糖尿病')
+        self.assertEqual(len(results), 2)
+        self.assertEqual(run.text_search.sync(), 0)
+
+    def test_index_follows_updates_and_deletes(self):
+        """测试检索跟随目录记录的修改、删除与显式编号插入"""
+        self._add('literature', 'Stroke prevention', 'stroke')
+        self._add('literature', 'Asthma control', 'asthma')
+        self.assertEqual(len(run.text_search.search('stroke')), 1)
+        connection = run.catalog._connection()
+        with connection:
+            connection.execute("UPDATE catalog_records SET content = 'insulin' WHERE title = 'Stroke prevention'")
+            connection.execute("DELETE FROM catalog_records WHERE title = 'Asthma control'")
+        run.catalog.add_records([{'id': 1000, 'subcategory': 'reports', 'record_type': 'report', 'source': 'ehr',
+                                  'record_date': '2024-03-01', 'title': 'Insulin titration'}])
+        run.catalog.add_records([{'id': 500, 'subcategory': 'records', 'record_type': 'note', 'source': 'ehr',
+                                  'record_date': '2024-03-01', 'title': 'Asthma admission'}])
+        self.assertEqual(run.text_search.search('stroke prevention')[0]['id'], 1)
+        self.assertEqual([r['id'] for r in run.text_search.search('asthma')], [500])
+        self.assertEqual({r['id'] for r in run.text_search.search('insulin')}, {1, 1000})
+        self.assertEqual(run.text_search.sync(), 0)
+
+    def test_index_is_rebuilt_after_deletes(self):
+        """测试删除过多时从目录重建索引"""
+        for number in range(10):
+            self._add('literature', f'Stroke study {number}', 'stroke')
+        run.text_search.search('stroke')
+        connection = run.catalog._connection()
+        with connection:
+            connection.execute('DELETE FROM catalog_records WHERE id <= 3')
+        self.assertEqual(len(run.text_search.search('stroke')), 7)
+        self.assertEqual(run.text_search.index.deleted, 0)
+        self.assertEqual(len(run.text_search.index), 7)
+
+    def test_search_api(self):
+        """测试检索接口返回带评分的目录记录"""
+        self._add('literature', 'Stroke prevention', 'Atrial fibrillation and stroke 中风')
+        self._add('records', 'Stroke admission', '患者中风入院')
+        response = self.client.get('/api/multimodal/medical_text/search?q=中风&subcategory=records')
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()['results']
+        self.assertEqual([r['title'] for r in results], ['Stroke admission'])
+        self.assertIn('score', results[0])
+        self.assertEqual(self.client.get('/api/multimodal/medical_text/search').status_code, 400)
+
+    def test_deleted_hits_are_skipped(self):
+        """测试检索命中已删除的记录时跳过"""
+        self._add('literature', 'Stroke prevention', 'stroke')
+        self._add('literature', 'Stroke rehabilitation', 'stroke')
+        results = run.text_search.search('stroke')
+        connection = run.catalog._connection()
+        with connection:
+            connection.execute('DELETE FROM catalog_records WHERE id = ?', (results[0]['id'],))
+        with mock.patch.object(run.text_search, 'search', return_value=results):
+            response = self.client.get('/api/multimodal/medical_text/search?q=stroke')
+            self.assertEqual(len(response.get_json()['results']), 1)
+            page = self.client.get('/multimodal/medical_text/literature?q=stroke')
+        self.assertEqual(page.status_code, 200)
+
+    def test_subcategory_page_search(self):
+        """测试子分类页面检索框"""
+        self._add('literature', 'Lung cancer screening', '低剂量CT肺癌筛查')
+        html = self.client.get('/multimodal/medical_text/literature?q=肺癌').get_data(as_text=True)
+        self.assertIn('Lung cancer screening', html)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import subprocess
+import sys
+import os
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# 应用启动时不应导入的重型依赖，只在用到它们的代码路径中按需导入
+HEAVY_MODULES = ('numpy', 'pandas', 'matplotlib', 'seaborn', 'plotly', 'sklearn')
+
+
+class TestColdStart(unittest.TestCase):
+    """冷启动测试类"""
+
+    def test_import_is_lazy(self):
+        """测试导入run.py不会加载重型依赖"""
+        code = ('import sys, run\n'
+                f'print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))')
+        output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout.strip()
+        self.assertEqual(output, '')
+
+    def test_bytecode_cache_enabled(self):
+        """测试启用了模板字节码缓存"""
+        sys.path.insert(0, ROOT)
+        from run import app
+        self.assertIsNotNone(app.jinja_env.bytecode_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
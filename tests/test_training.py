@@ -0,0 +1,157 @@
+import unittest
+import tempfile
+import sys
+import os
+from unittest import mock
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import run
+from app.imputation import Imputer
+from app.models import training
+from app.models.registry import ModelRegistry
+from app.scoring import score_columns
+
+
+def write_cohort(path, n, seed=0):
+    """按糖尿病评分生成带结局列的队列"""
+    rng = np.random.default_rng(seed)
+    columns = {'age': rng.integers(20, 80, n), 'bmi': rng.integers(18, 40, n),
+               'waist_circumference': rng.integers(60, 120, n), 'systolic_bp': rng.integers(100, 170, n),
+               'family_history': rng.integers(0, 2, n), 'physical_activity': rng.integers(0, 3, n)}
+    scores = score_columns('diabetes', {field: column.astype(np.float64) for field, column in columns.items()})
+    outcome = (rng.random(n) < scores / 100).astype(int)
+    with open(path, 'w') as f:
+        f.write(','.join(columns) + ',outcome\n')
+        for i in range(n):
+            f.write(','.join(str(columns[field][i]) for field in columns) + f',{outcome[i]}\n')
+
+
+class TestModelRegistry(unittest.TestCase):
+    """模型注册表测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.registry = ModelRegistry(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_publish_versions(self):
+        """测试发布新版本并切换当前版本"""
+        self.assertIsNone(self.registry.current_version('diabetes'))
+        self.assertEqual(self.registry.publish('diabetes', {'w': 1}, {'estimator': 'a'}), 1)
+        self.assertEqual(self.registry.publish('diabetes', {'w': 2}, {'estimator': 'b'}), 2)
+        self.assertEqual(self.registry.versions('diabetes'), [1, 2])
+        model, metadata = self.registry.load('diabetes')
+        self.assertEqual(model, {'w': 2})
+        self.assertEqual(metadata['version'], 2)
+        self.assertEqual(self.registry.load('diabetes', 1)[0], {'w': 1})
+        self.assertEqual(list(self.registry.catalog()), ['diabetes'])
+        # 不留下临时目录
+        self.assertEqual(sorted(os.listdir(self.registry.path('diabetes'))), ['CURRENT', 'v1', 'v2'])
+
+    def test_failed_publish_keeps_current(self):
+        """测试写入失败时当前版本不变"""
+        self.registry.publish('diabetes', {'w': 1}, {})
+        with mock.patch('joblib.dump', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.registry.publish('diabetes', {'w': 2}, {})
+        self.assertEqual(self.registry.current_version('diabetes'), 1)
+        self.assertEqual(self.registry.versions('diabetes'), [1])
+
+    def test_invalid_ids(self):
+        """测试非法疾病编号与未发布模型"""
+        with self.assertRaises(KeyError):
+            self.registry.path('../x')
+        with self.assertRaises(KeyError):
+            self.registry.load('stroke')
+
+
+class TestTraining(unittest.TestCase):
+    """交叉验证训练测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cohort = os.path.join(self.tmpdir.name, 'cohort.csv')
+        self.cache_dir = os.path.join(self.tmpdir.name, 'cache')
+        self.registry = ModelRegistry(os.path.join(self.tmpdir.name, 'models'))
+        self.imputer = Imputer(run.DISEASE_MODELS)
+        write_cohort(self.cohort, 600)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def train(self, **kwargs):
+        options = dict(estimator='logistic_regression', folds=3, workers=1)
+        options.update(kwargs)
+        return training.train(self.cohort, ['diabetes'], run.FACTOR_VALIDATORS, self.imputer, self.registry,
+                              self.cache_dir, **options)
+
+    def test_cross_validation_and_publish(self):
+        """测试各折指标与发布的模型"""
+        metadata = self.train()['diabetes']
+        self.assertEqual(metadata['version'], 1)
+        self.assertEqual(metadata['training']['rows'], 600)
+        self.assertEqual(len(metadata['cv']['per_fold']), 3)
+        self.assertEqual(sum(fold['n_test'] for fold in metadata['cv']['per_fold']), 600)
+        self.assertGreater(metadata['cv']['metrics']['auc']['mean'], 0.6)
+
+        model, _ = self.registry.load('diabetes')
+        self.assertEqual(model.predict_proba(np.zeros((2, len(metadata['features'])))).shape, (2, 2))
+
+    def test_fold_cache_is_reused(self):
+        """测试同一队列再次训练时不重新解析"""
+        first = self.train()['diabetes']
+        with mock.patch.object(training, 'LabelledCsv', side_effect=AssertionError('parsed again')):
+            second = self.train(estimator='random_forest', params={'n_estimators': 20})['diabetes']
+        self.assertEqual(second['version'], 2)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        self.assertEqual(first['training'], second['training'])
+
+    def test_process_pool(self):
+        """测试进程池并行训练与进程内训练结果一致"""
+        serial = self.train()['diabetes']['cv']['per_fold']
+        parallel = self.train(workers=2)['diabetes']['cv']['per_fold']
+        for a, b in zip(serial, parallel):
+            self.assertEqual(a['auc'], b['auc'])
+
+    def test_too_few_cases(self):
+        """测试结局样本不足时报错"""
+        with self.assertRaises(training.TrainingError):
+            self.train(folds=1)
+        with open(self.cohort, 'w') as f:
+            f.write('age,outcome\n40,1\n50,0\n60,0\n')
+        with self.assertRaises(training.TrainingError):
+            self.train()
+
+
+class TestModelsRoute(unittest.TestCase):
+    """模型列表接口测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.original = run.model_registry
+        run.model_registry = ModelRegistry(self.tmpdir.name)
+        run.app.config['TESTING'] = True
+        self.client = run.app.test_client()
+
+    def tearDown(self):
+        run.model_registry = self.original
+        self.tmpdir.cleanup()
+
+    def test_lists_current_versions(self):
+        """测试返回当前版本与交叉验证指标"""
+        self.assertEqual(self.client.get('/api/models').get_json()['models'], {})
+        metrics = {'auc': {'mean': 0.8, 'std': 0.01}}
+        run.model_registry.publish('copd', {}, {'estimator': 'random_forest', 'cv': {'metrics': metrics}})
+        models = self.client.get('/api/models').get_json()['models']
+        self.assertEqual(models['copd']['version'], 1)
+        self.assertEqual(models['copd']['cv_metrics'], metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+import json
+import tempfile
+import sys
+import os
+from unittest import mock
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import run
+from app.imputation import Imputer
+from app.models import training, tuning
+from app.models.registry import ModelRegistry
+
+SPACE = {'C': {'low': 0.001, 'high': 10.0, 'log': True}}
+
+
+class TestSchedule(unittest.TestCase):
+    """搜索预算计划测试类"""
+
+    def test_brackets(self):
+        """测试逐级淘汰与Hyperband的各级预算和候选数"""
+        self.assertEqual(tuning.brackets('halving', 10, 270, 3),
+                         [[(27, 10.0), (9, 30.0), (3, 90.0), (1, 270.0)]])
+        hyperband = tuning.brackets('hyperband', 10, 270, 3)
+        self.assertEqual([bracket[0] for bracket in hyperband], [(27, 10.0), (12, 30.0), (6, 90.0), (4, 270.0)])
+        self.assertTrue(all(bracket[-1][1] == 270 for bracket in hyperband))
+        with self.assertRaises(tuning.SearchError):
+            tuning.brackets('grid', 10, 270, 3)
+        with self.assertRaises(tuning.SearchError):
+            tuning.rung_budgets(0, 1, 3)
+
+    def test_sample_candidates(self):
+        """测试候选配置不重复且取值在范围内"""
+        candidates = tuning.sample_candidates({'a': [1, 2, 3], 'b': {'low': 1, 'high': 100, 'log': True}}, 20,
+                                              np.random.default_rng(0), fixed={'c': 'x'})
+        self.assertEqual(len({json.dumps(c, sort_keys=True) for c in candidates}), 20)
+        self.assertTrue(all(c['a'] in (1, 2, 3) and 1 <= c['b'] <= 100 and c['c'] == 'x' for c in candidates))
+        # 离散空间组合数不足时返回全部
+        self.assertEqual(len(tuning.sample_candidates({'a': [1, 2]}, 5, np.random.default_rng(0))), 2)
+
+
+class TestSearch(unittest.TestCase):
+    """超参数搜索测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.cohort = os.path.join(self.tmpdir.name, 'cohort.csv')
+        with open(self.cohort, 'w') as f:
+            f.write('age,bmi,outcome\n')
+            for _ in range(600):
+                age, bmi = rng.integers(20, 80), rng.integers(18, 40)
+                f.write(f'{age},{bmi},{int(rng.random() < (age - 10) / 80)}\n')
+        self.imputer = Imputer(run.DISEASE_MODELS)
+        self.cache_dir = os.path.join(self.tmpdir.name, 'cache')
+        self.path = training.prepare(self.cohort, 'diabetes', run.FACTOR_VALIDATORS['diabetes'], self.imputer,
+                                     self.cache_dir, folds=3)
+        self.checkpoint = os.path.join(self.tmpdir.name, 'tuning', 'diabetes.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def search(self, **kwargs):
+        options = dict(estimator='logistic_regression', method='halving', space=SPACE, resource='rows',
+                       min_budget=1 / 9, max_budget=1.0, workers=1, checkpoint=self.checkpoint)
+        options.update(kwargs)
+        return tuning.search(self.path, **options)
+
+    def test_halving_promotes_best(self):
+        """测试每级只晋升得分最高的候选"""
+        result = self.search()
+        self.assertEqual([len(rung['candidates']) for rung in result['history']], [9, 3, 1])
+        for lower, upper in zip(result['history'], result['history'][1:]):
+            promoted = [c['params'] for c in lower['candidates'][:len(upper['candidates'])]]
+            self.assertEqual(sorted(map(json.dumps, promoted)),
+                             sorted(json.dumps(c['params']) for c in upper['candidates']))
+        self.assertEqual(result['evaluations'], 13)
+        self.assertEqual(result['best_params'], result['history'][-1]['candidates'][0]['params'])
+        self.assertGreater(result['best_score'], 0.6)
+
+    def test_resume_after_interruption(self):
+        """测试中断后从检查点恢复，已完成的评估不再重复"""
+        calls = []
+        fit_fold = training.fit_fold
+
+        def interrupted(*args):
+            if len(calls) == 20:
+                raise KeyboardInterrupt
+            calls.append(args)
+            return fit_fold(*args)
+
+        with mock.patch.object(tuning, 'fit_fold', side_effect=interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                self.search()
+        with open(self.checkpoint) as f:
+            self.assertEqual(len(json.load(f)['results']), 6)
+
+        calls.clear()
+        with mock.patch.object(tuning, 'fit_fold', side_effect=fit_fold) as resumed:
+            result = self.search()
+        self.assertEqual(resumed.call_count, (13 - 6) * 3)
+        self.assertEqual(result['best_params'], self.search(checkpoint=None)['best_params'])
+
+        with self.assertRaises(tuning.SearchError):
+            self.search(eta=2)
+
+    def test_estimator_budget_and_pool(self):
+        """测试以树的数量为预算并在进程池中并行"""
+        result = tuning.search(self.path, 'random_forest', 'hyperband', space={'max_depth': [2, 4]},
+                               min_budget=5, max_budget=15, workers=2)
+        self.assertEqual({rung['budget'] for rung in result['history']}, {5, 15})
+        self.assertEqual(result['best_params']['n_estimators'], 15)
+        # 相同配置与预算在不同分组间复用
+        self.assertGreater(result['reused_evaluations'], 0)
+
+    def test_search_and_train_publishes(self):
+        """测试搜索后用最佳参数训练并发布"""
+        registry = ModelRegistry(os.path.join(self.tmpdir.name, 'models'))
+        published = tuning.search_and_train(self.cohort, ['diabetes'], run.FACTOR_VALIDATORS, self.imputer,
+                                            registry, self.cache_dir, None, 'logistic_regression', 'halving',
+                                            folds=3, workers=1, space=SPACE, resource='rows', min_budget=1 / 3,
+                                            max_budget=1.0)
+        metadata = published['diabetes']
+        self.assertEqual(metadata['search']['method'], 'halving')
+        self.assertEqual(metadata['params']['C'], registry.metadata('diabetes')['params']['C'])
+        self.assertEqual(len(metadata['cv']['per_fold']), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
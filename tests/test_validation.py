@@ -0,0 +1,145 @@
+import unittest
+import json
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.validation import FactorValidator, records_to_columns
+from run import app, DISEASE_MODELS
+
+
+class TestFactorValidator(unittest.TestCase):
+    """风险因子校验器测试类"""
+
+    def setUp(self):
+        self.validator = FactorValidator(DISEASE_MODELS['diabetes']['risk_factors'])
+
+    def test_valid_factors(self):
+        """测试合法输入"""
+        factors, errors = self.validator.validate({'age': 45, 'bmi': '28.5', 'physical_activity': 2.0})
+        self.assertEqual(errors, [])
+        self.assertEqual(factors, {'age': 45.0, 'bmi': 28.5, 'physical_activity': 2})
+
+    def test_invalid_factors(self):
+        """测试越界、非法类型和非法选项"""
+        factors, errors = self.validator.validate({
+            'age': 150,
+            'bmi': 'abc',
+            'family_history': 3,
+            'unknown': 1,
+            'systolic_bp': None
+        })
+        codes = {error['field']: error['code'] for error in errors}
+        self.assertEqual(codes, {
+            'age': 'out_of_range',
+            'bmi': 'invalid_type',
+            'family_history': 'invalid_option'
+        })
+        self.assertEqual(factors, {})
+
+    def test_factors_not_object(self):
+        """测试非对象输入"""
+        _, errors = self.validator.validate([1, 2])
+        self.assertEqual(errors[0]['code'], 'invalid_type')
+
+    def test_columns_match_scalar_path(self):
+        """测试批量校验与单条校验结果一致"""
+        self.assertColumnsMatchScalarPath([
+            {'age': 45, 'bmi': 28.5},
+            {'age': 10, 'bmi': 'abc'},
+            {'age': '', 'family_history': 1},
+            {'family_history': 5, 'physical_activity': None}
+        ])
+
+    def test_nan_and_booleans_match_scalar_path(self):
+        """测试NaN、"nan"、无穷大和布尔值在批量与单条校验中都是非法类型"""
+        records = [
+            {'age': 45, 'bmi': float('nan')},
+            {'age': True, 'bmi': 28.5},
+            {'age': 10 ** 400, 'bmi': None},
+            {'age': 50, 'bmi': float('inf')}
+        ]
+        self.assertColumnsMatchScalarPath(records)
+        self.assertColumnsMatchScalarPath(records + [{'age': 'nan', 'bmi': 'NaN'}, {'age': '45', 'bmi': False}])
+        _, errors = self.validator.validate({'age': False})
+        self.assertEqual(errors[0]['code'], 'invalid_type')
+
+    def assertColumnsMatchScalarPath(self, records):
+        columns, bad_rows = records_to_columns(records, self.validator.fields)
+        batch = self.validator.validate_columns(columns, len(records))
+        self.assertEqual(bad_rows, [])
+
+        for index, record in enumerate(records):
+            factors, errors = self.validator.validate(record)
+            self.assertEqual(bool(batch.valid[index]), not errors)
+            if errors:
+                self.assertEqual(
+                    sorted((e['field'], e['code']) for e in batch.errors[index]),
+                    sorted((e['field'], e['code']) for e in errors))
+            else:
+                self.assertEqual(batch.row(index), factors)
+
+
+class TestPredictValidationAPI(unittest.TestCase):
+    """预测API输入校验测试类"""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+
+    def test_out_of_range_rejected(self):
+        """测试越界输入返回400"""
+        response = self.client.post('/api/predict/diabetes',
+                                    data=json.dumps({'factors': {'age': 500}}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data)
+        self.assertEqual(data['field_errors'][0]['field'], 'age')
+
+    def test_invalid_type_is_not_server_error(self):
+        """测试非法类型不再返回500"""
+        response = self.client.post('/api/predict/lung_cancer',
+                                    data=json.dumps({'factors': {'age': 'old'}}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_json(self):
+        """测试无效的JSON数据"""
+        response = self.client.post('/api/predict/diabetes',
+                                    data='invalid json',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_predict(self):
+        """测试批量预测"""
+        records = [
+            {'age': 65, 'bmi': 32, 'family_history': 1},
+            {'age': 500},
+            'not a record'
+        ]
+        response = self.client.post('/api/predict/diabetes/batch',
+                                    data=json.dumps({'records': records}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['error_count'], 2)
+        self.assertEqual([r['status'] for r in data['results']], ['success', 'error', 'error'])
+        self.assertIn('risk_level', data['results'][0])
+
+    def test_batch_and_single_predict_agree(self):
+        """测试同一记录在单条与批量预测接口中的校验结果一致"""
+        records = [{'age': 45, 'bmi': float('nan')}, {'age': True}, {'age': 'nan'}, {'age': 45, 'bmi': 28.5}]
+        response = self.client.post('/api/predict/diabetes/batch', data=json.dumps({'records': records}),
+                                    content_type='application/json')
+        statuses = [r['status'] for r in response.get_json()['results']]
+        for record, status in zip(records, statuses):
+            single = self.client.post('/api/predict/diabetes', data=json.dumps({'factors': record}),
+                                      content_type='application/json')
+            self.assertEqual(single.status_code == 200, status == 'success', record)
+        self.assertEqual(statuses, ['error', 'error', 'error', 'success'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+生产环境WSGI入口
+
+用法:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py 开启了 preload_app，本模块在主进程fork之前被导入一次，
+因此应用、校验器和已编译的模板都通过写时复制在所有worker之间共享。
+run.py 本身按需导入NumPy等重型依赖以加快冷启动，这里在主进程中提前导入，
+使worker不必各自重复导入。
+"""
+
+from run import app
+
+
+def preload():
+    """导入重型依赖并预编译全部模板，避免每个worker重复这些工作"""
+    import numpy  # noqa: F401
+
+    for template_name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template_name)
+
+
+preload()